@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Count the file system calls made to create the directories of a deep
+skeleton tree: per directory (the skeleton 0.6 way - exists, mkdir and
+copymode for each directory found by the walk) or with the directory
+plan of `Skeleton.write`.
+
+Usage: python benchmarks/bench_directories.py [depth [fan_out]]
+"""
+from __future__ import with_statement
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from skeleton import Skeleton
+
+
+CALLS = ('stat', 'lstat', 'mkdir', 'chmod',)
+
+
+class Counter(object):
+    """Wrap the os functions listed in CALLS to count their calls."""
+
+    def __init__(self):
+        self.counts = dict((name, 0,) for name in CALLS)
+        self._originals = {}
+
+    def __enter__(self):
+        for name in CALLS:
+            original = getattr(os, name)
+            self._originals[name] = original
+            setattr(os, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, *args):
+        for name, original in self._originals.items():
+            setattr(os, name, original)
+
+    def _wrap(self, name, func):
+        """Return a wrapper of func counting its calls"""
+        def wrapper(*args, **kw):
+            """Count the call"""
+            self.counts[name] += 1
+            return func(*args, **kw)
+        return wrapper
+
+
+def make_tree(root, depth, fan_out):
+    """Create a tree of directories."""
+    if not depth:
+        return
+    for index in range(fan_out):
+        path = os.path.join(root, 'dir%d' % index)
+        os.mkdir(path)
+        make_tree(path, depth - 1, fan_out)
+
+
+def per_directory(skel, dst_dir):
+    """Create the directories like skeleton 0.6 did."""
+    real_src = skel.real_src
+    if not os.path.exists(dst_dir):
+        os.mkdir(dst_dir)
+    for dir_path, dir_names, _ in os.walk(real_src):
+        rel_dir_path = dir_path[len(real_src):].lstrip(r'\/')
+        for dir_name in dir_names:
+            src = os.path.join(dir_path, dir_name)
+            dst = os.path.join(dst_dir, rel_dir_path, dir_name)
+            if not os.path.exists(dst):
+                os.mkdir(dst)
+            shutil.copymode(src, dst)
+
+
+def with_plan(skel, dst_dir):
+    """Create the directories with Skeleton.write."""
+    skel.write(dst_dir)
+
+
+def run(depth=6, fan_out=3):
+    """Print the number of calls and the duration of each strategy"""
+    src_dir = tempfile.mkdtemp()
+    try:
+        make_tree(src_dir, depth, fan_out)
+
+        class Tree(Skeleton):
+            """Skeleton of empty directories"""
+            src = src_dir
+
+        skel = Tree()
+        skel.manifest  # the manifest is built once per process
+        print("%d directories (depth %d, fan out %d)" % (
+            len(skel.manifest), depth, fan_out))
+
+        for name, func in (
+            ('per directory', per_directory,), ('plan', with_plan,)):
+            dst_dir = tempfile.mkdtemp()
+            try:
+                with Counter() as counter:
+                    func(skel, os.path.join(dst_dir, 'new'))
+                duration = min(timeit.repeat(
+                    lambda: func(skel, os.path.join(dst_dir, 'new')),
+                    number=1, repeat=3))
+            finally:
+                shutil.rmtree(dst_dir)
+            print("%-14s %s - existing tree: %.1f ms" % (
+                name,
+                ', '.join(
+                    '%s: %d' % (call, counter.counts[call],)
+                    for call in CALLS),
+                duration * 1000))
+    finally:
+        shutil.rmtree(src_dir)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
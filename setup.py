@@ -46,7 +46,7 @@ setup(
     packages=['skeleton', 'skeleton.tests', 'skeleton.examples'],
     test_suite='skeleton.tests',
     include_package_data=True,
-    zip_safe=False,
+    zip_safe=True,
     install_requires=[],
     extras_require={
         'virtualenv-templates':  [
@@ -55,6 +55,9 @@ setup(
             ],
     },
     entry_points={
+        'console_scripts': [
+            'skeleton = skeleton.cli:main',
+            ],
         'virtualenvwrapper.project.template': [
             'package = skeleton.examples.basicpackage:virtualenv_warpper_hook',
             ],
@@ -5,6 +5,7 @@ similar to the template part of PasteScript but without any dependencies.
 """
 
 from skeleton.core import (
-    Skeleton, Var, Bool, FileNameKeyError, TemplateKeyError
+    Skeleton, Var, Bool, FileNameKeyError, TemplateKeyError, WriteCancelled,
+    RequirementCycleError, PlanError
     )
 from skeleton.utils import insert_into_file
@@ -0,0 +1,492 @@
+"""
+Output backends.
+
+Skeletons create their directories and files through a backend:
+
+- `FileSystemBackend` (the default, `FILE_SYSTEM`) writes them to disk;
+- `MemoryBackend` keeps their content and mode in memory, to serve or
+  archive a generated project without writing it to disk;
+- `ArchiveBackend` streams them into a tar or zip archive
+  (see `Skeleton.write_archive`).
+
+Usage::
+
+    backend = MemoryBackend()
+    MySkeleton(**variables).write('project', backend=backend)
+    backend.read('project/setup.py')
+
+"""
+from __future__ import with_statement
+import errno
+import gzip
+import io
+import os
+import stat
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+
+from skeleton.utils import (
+    get_loggger, copy_file, link_file, remove_file, open_new_file,
+    set_fd_mode, default_mode)
+
+
+_LOG = get_loggger(__name__)
+
+
+class FileSystemBackend(object):
+    """Backend writing files and directories to the file system."""
+
+    def mkdir(self, path):
+        """Create the directory at `path` unless it already exists.
+
+        Return True if it was created.
+        """
+        try:
+            os.mkdir(path)
+        except (OSError,), exc:
+            if exc.errno != errno.EEXIST:
+                raise
+            return False
+        return True
+
+    def chmod(self, path, mode):
+        """Set the mode of `path`."""
+        os.chmod(path, mode)
+
+    def copy_file(self, src, dst, mode=None):
+        """Copy the file system file `src` to `dst` and set its mode.
+
+        Return the copy strategy used (see `skeleton.utils.copy_file`).
+        """
+        return copy_file(src, dst, mode)
+
+    def link_file(self, src, dst, mode=None):
+        """Hard link `dst` to the file system file `src` (or copy it).
+
+        Return the strategy used (see `skeleton.utils.link_file`).
+        """
+        return link_file(src, dst, mode)
+
+    def open(self, path, mode=None):
+        """Open `path` for writing, in binary mode, and set its mode.
+
+        The mode is set on the open file, and only if `path` doesn't have it
+        yet. An existing file keeps its mode if `mode` is None.
+        """
+        fd, current_mode = open_new_file(path)
+        try:
+            if mode is not None:
+                set_fd_mode(fd, mode, current_mode, path)
+            return os.fdopen(fd, 'wb')
+        except:
+            os.close(fd)
+            raise
+
+    def write(self, path, content, mode=None):
+        """Write the `content` bytes to `path` (see `open`)."""
+        with self.open(path, mode) as opened_file:
+            opened_file.write(content)
+
+    def read(self, path):
+        """Return the content of the file at `path`."""
+        with open(path, 'rb') as opened_file:
+            return opened_file.read()
+
+    def remove(self, path):
+        """Remove the file at `path` if it exists."""
+        remove_file(path)
+
+
+#: Default backend of the skeletons.
+FILE_SYSTEM = FileSystemBackend()
+
+
+class MemoryBackend(object):
+    """Backend keeping files and directories in memory.
+
+    `files` maps each file path to a [content, mode] list and
+    `directories` maps each directory path to its mode; paths are
+    normalized with `os.path.normpath`. Static files are read from the
+    skeleton when they are copied.
+
+    It is thread-safe.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.directories = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, path):
+        path = os.path.normpath(path)
+        return path in self.files or path in self.directories
+
+    def __iter__(self):
+        """Iterate over the directory and file paths, sorted."""
+        return iter(sorted(list(self.files) + list(self.directories)))
+
+    def __len__(self):
+        return len(self.files) + len(self.directories)
+
+    def mkdir(self, path):
+        """Create a directory unless it already exists.
+
+        Return True if it was created.
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            if path in self.files:
+                raise OSError(errno.EEXIST, "File exists", path)
+            if path in self.directories:
+                return False
+            self.directories[path] = default_mode(is_dir=True)
+            return True
+
+    def chmod(self, path, mode):
+        """Set the mode of a file or directory."""
+        path = os.path.normpath(path)
+        with self._lock:
+            if path in self.files:
+                self.files[path][1] = mode
+            elif path in self.directories:
+                self.directories[path] = mode
+            else:
+                raise OSError(errno.ENOENT, "No such file or directory", path)
+
+    def copy_file(self, src, dst, mode=None):
+        """Copy the file system file `src` to `dst`."""
+        with open(src, 'rb') as src_file:
+            self.write(dst, src_file.read(), mode)
+        return 'memory'
+
+    def link_file(self, src, dst, mode=None):
+        """Copy the file system file `src` to `dst` (files cannot be linked
+        in memory).
+        """
+        return self.copy_file(src, dst, mode)
+
+    def open(self, path, mode=None):
+        """Return a binary file object; its content is saved when it is
+        closed.
+        """
+        return _MemoryFile(self, path, mode)
+
+    def write(self, path, content, mode=None):
+        """Save the `content` bytes of the file at `path`.
+
+        An existing file keeps its mode if `mode` is None; new ones get the
+        default mode.
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            if path in self.directories:
+                raise IOError(errno.EISDIR, "Is a directory", path)
+            if mode is None:
+                mode = self.files.get(path, (None, default_mode()))[1]
+            self.files[path] = [content, mode]
+
+    def read(self, path):
+        """Return the content of the file at `path`."""
+        try:
+            return self.files[os.path.normpath(path)][0]
+        except KeyError:
+            raise IOError(errno.ENOENT, "No such file or directory", path)
+
+    def mode(self, path):
+        """Return the mode of the file or directory at `path`."""
+        path = os.path.normpath(path)
+        if path in self.directories:
+            return self.directories[path]
+        try:
+            return self.files[path][1]
+        except KeyError:
+            raise IOError(errno.ENOENT, "No such file or directory", path)
+
+    def remove(self, path):
+        """Remove the file at `path` if it exists."""
+        with self._lock:
+            self.files.pop(os.path.normpath(path), None)
+
+
+class _MemoryFile(io.BytesIO):
+    """File object of a `MemoryBackend` file."""
+
+    def __init__(self, backend, path, mode):
+        io.BytesIO.__init__(self)
+        self._backend = backend
+        self._path = path
+        self._mode = mode
+
+    def close(self):
+        if not self.closed:
+            self._backend.write(self._path, self.getvalue(), self._mode)
+        io.BytesIO.close(self)
+
+
+#: Formats supported by `ArchiveBackend`.
+ARCHIVE_FORMATS = ('tar', 'tar.gz', 'zip',)
+
+# 1980-01-01
+_ZIP_MIN_MTIME = 315532800
+
+
+class ArchiveBackend(object):
+    """Backend streaming files and directories into a tar or zip archive.
+
+    `fileobj` is the binary file object the archive is written to; zip
+    archives need a seekable one. Entries are named after their path
+    relative to `root`.
+
+    Entries are only added when the archive is closed, so that files can
+    be read back, rewritten (e.g. by `insert_into_file`), chmod'ed or
+    removed after the skeleton write. Static files are not buffered: only
+    their source path is recorded, and they are streamed from it by chunks
+    when the archive is closed. Rendered (or edited) files are kept in
+    memory. Nothing is written to disk but the archive. Entries are added
+    in name order, directories first.
+
+    All entries get the `mtime` timestamp (the current time by default;
+    zip archives don't support timestamps before 1980), and belong to root.
+
+    The archive is only complete once `close()` is called.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, fileobj, format='tar.gz', root='', mtime=None):
+        if format not in ARCHIVE_FORMATS:
+            raise ValueError("Unknown archive format: %r" % (format,))
+        self.format = format
+        self.root = root
+        self.mtime = int(time.time() if mtime is None else mtime)
+        self.directories = {}
+        self.files = {}
+        self._lock = threading.Lock()
+        self._gzip = None
+        if format == 'zip':
+            self._archive = zipfile.ZipFile(
+                fileobj, 'w', zipfile.ZIP_DEFLATED)
+            return
+
+        if format == 'tar.gz':
+            # the gzip header holds a timestamp too
+            self._gzip = fileobj = gzip.GzipFile(
+                filename='', mode='wb', fileobj=fileobj, mtime=self.mtime)
+        self._archive = tarfile.open(fileobj=fileobj, mode='w|')
+
+    def close(self):
+        """Add the directories and the files, and close the archive."""
+        try:
+            for name in sorted(self.directories):
+                self._add_directory(name, self.directories[name])
+            for name in sorted(self.files):
+                content, mode, src = self.files[name]
+                if src is None:
+                    self._add_file(
+                        name, io.BytesIO(content), len(content), mode)
+                    continue
+                with open(src, 'rb') as src_file:
+                    self._add_file(
+                        name, src_file, os.fstat(src_file.fileno()).st_size,
+                        mode)
+        finally:
+            self.files.clear()
+            self._archive.close()
+            if self._gzip is not None:
+                self._gzip.close()
+
+    def mkdir(self, path):
+        """Record a directory; return True if it is new."""
+        name = self._name(path)
+        with self._lock:
+            if name in self.files:
+                raise OSError(errno.EEXIST, "File exists", path)
+            if name is None or name in self.directories:
+                return False
+            self.directories[name] = default_mode(is_dir=True)
+            return True
+
+    def chmod(self, path, mode):
+        """Set the mode of a file or directory."""
+        name = self._name(path)
+        with self._lock:
+            if name in self.files:
+                self.files[name][1] = mode
+            elif name in self.directories:
+                self.directories[name] = mode
+            else:
+                raise OSError(errno.ENOENT, "No such file or directory", path)
+
+    def copy_file(self, src, dst, mode=None):
+        """Copy the file system file `src` to `dst`; it is only read when
+        the archive is closed.
+        """
+        self._save(dst, None, mode, os.path.abspath(src))
+        return 'archive'
+
+    def link_file(self, src, dst, mode=None):
+        """Copy the file system file `src` to `dst` (files cannot be linked
+        in an archive).
+        """
+        return self.copy_file(src, dst, mode)
+
+    def open(self, path, mode=None):
+        """Return a binary file object; its content is saved when it is
+        closed.
+        """
+        return _ArchiveFile(self, path, mode)
+
+    def write(self, path, content, mode=None):
+        """Save the `content` bytes of the file at `path`."""
+        self._save(path, content, mode)
+
+    def read(self, path):
+        """Return the content of the file at `path`."""
+        try:
+            content, _mode, src = self.files[self._name(path)]
+        except KeyError:
+            raise IOError(errno.ENOENT, "No such file or directory", path)
+        if src is None:
+            return content
+        with open(src, 'rb') as src_file:
+            return src_file.read()
+
+    def remove(self, path):
+        """Remove the file at `path` if it exists."""
+        with self._lock:
+            self.files.pop(self._name(path), None)
+
+    def _save(self, path, content, mode, src=None):
+        """Save the file at `path`: its `content` bytes, or the path of the
+        file system file `src` to copy.
+
+        An existing file keeps its mode if `mode` is None; new ones get the
+        default mode.
+        """
+        name = self._name(path)
+        with self._lock:
+            if name in self.directories:
+                raise IOError(errno.EISDIR, "Is a directory", path)
+            if mode is None:
+                mode = self.files.get(name, (None, default_mode()))[1]
+            self.files[name] = [content, mode, src]
+
+    def _name(self, path):
+        """Return the name of the entry of `path` (None for the root)."""
+        name = os.path.relpath(path, self.root or os.curdir)
+        if name == os.curdir:
+            return None
+        return name.replace(os.sep, '/')
+
+    def _add_file(self, name, fileobj, size, mode):
+        """Add the `size` bytes of `fileobj` to the archive."""
+        if self.format == 'zip':
+            info = zipfile.ZipInfo(name, self._zip_date_time())
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = (stat.S_IFREG | mode) << 16
+            _write_zip_entry(
+                self._archive, info, fileobj, size, self.chunk_size)
+            return
+
+        info = self._tar_info(name, mode)
+        info.size = size
+        self._archive.addfile(info, fileobj)
+
+    def _add_directory(self, name, mode):
+        """Add a directory entry to the archive."""
+        if self.format == 'zip':
+            info = zipfile.ZipInfo(name + '/', self._zip_date_time())
+            info.external_attr = ((stat.S_IFDIR | mode) << 16) | 0x10
+            self._archive.writestr(info, b'')
+            return
+
+        info = self._tar_info(name, mode)
+        info.type = tarfile.DIRTYPE
+        self._archive.addfile(info)
+
+    def _zip_date_time(self):
+        """Return the timestamp of the zip entries."""
+        return time.gmtime(max(self.mtime, _ZIP_MIN_MTIME))[:6]
+
+    def _tar_info(self, name, mode):
+        """Return the TarInfo of an entry."""
+        info = tarfile.TarInfo(name)
+        info.mode = mode
+        info.mtime = self.mtime
+        info.uid = info.gid = 0
+        info.uname = info.gname = 'root'
+        return info
+
+
+class _ArchiveFile(io.BytesIO):
+    """File object of an `ArchiveBackend` file."""
+
+    def __init__(self, backend, path, mode):
+        io.BytesIO.__init__(self)
+        self._backend = backend
+        self._path = path
+        self._mode = mode
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # don't save a partial file
+            io.BytesIO.close(self)
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self._backend._save(self._path, self.getvalue(), self._mode)
+        io.BytesIO.close(self)
+
+
+def _write_zip_entry(archive, info, fileobj, size, chunk_size=64 * 1024):
+    """Add the `size` bytes of `fileobj` to the zip `archive`, by chunks.
+
+    `ZipFile.write` only adds file system files, with their stat
+    attributes, and `ZipFile.writestr` needs the whole content.
+    """
+    if sys.version_info >= (3, 6):
+        with archive.open(info, 'w') as entry:
+            while True:
+                chunk = fileobj.read(chunk_size)
+                if not chunk:
+                    return
+                entry.write(chunk)
+
+    # Same as ZipFile.write, the header is written again once the CRC and
+    # the compressed size are known.
+    info.flag_bits = 0x00
+    info.header_offset = archive.fp.tell()
+    info.CRC = crc = 0
+    info.file_size = info.compress_size = size
+    archive._writecheck(info)
+    archive._didModify = True
+    archive.fp.write(info.FileHeader())
+
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compress_size = 0
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        crc = zlib.crc32(chunk, crc) & 0xffffffff
+        chunk = compressor.compress(chunk)
+        compress_size += len(chunk)
+        archive.fp.write(chunk)
+    chunk = compressor.flush()
+    compress_size += len(chunk)
+    archive.fp.write(chunk)
+
+    info.CRC = crc
+    info.compress_size = compress_size
+    position = archive.fp.tell()
+    archive.fp.seek(info.header_offset, 0)
+    archive.fp.write(info.FileHeader())
+    archive.fp.seek(position, 0)
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
@@ -0,0 +1,144 @@
+"""
+The `skeleton` command.
+
+- `skeleton serve` runs a render server (see `skeleton.server`);
+- `skeleton render module:ClassName dst_dir [name=value ...]` asks the
+  server to write a skeleton;
+- `skeleton write-many module:ClassName dst_pattern` writes a skeleton for
+  each row of variables read from stdin (see `Skeleton.write_many`) and
+  prints a JSON result line for each row.
+"""
+import csv
+import json
+import logging
+import optparse
+import sys
+
+from skeleton.plan import import_skeleton
+from skeleton.server import serve, render, RenderError
+
+
+USAGE = """%prog serve [options]
+       %prog render [options] module:ClassName dst_dir [name=value ...]
+       %prog write-many [options] module:ClassName dst_pattern < rows"""
+
+COMMANDS = ('serve', 'render', 'write-many',)
+
+
+def configure_parser():
+    """Return the parser of the `skeleton` command options."""
+    parser = optparse.OptionParser(usage=USAGE)
+    parser.add_option("-q", "--quiet",
+        action="store_const", const=logging.FATAL, dest="verbose")
+    parser.add_option("-v", "--verbose",
+        action="store_const", const=logging.INFO, dest="verbose")
+    parser.add_option("-d", "--debug",
+        action="store_const", const=logging.DEBUG, dest="verbose")
+    parser.set_default('verbose', logging.ERROR)
+    parser.add_option("-s", "--socket",
+        dest="socket", metavar="PATH",
+        help="path of the server socket (default: $SKELETON_SOCKET or "
+            "skeleton-<uid>.sock in the temporary directory)")
+    parser.add_option("--preload",
+        action="append", dest="preload", metavar="module:ClassName",
+        default=[],
+        help="skeleton to load when the server starts (serve)")
+    parser.add_option("-w", "--workers",
+        type="int", dest="workers", metavar="N",
+        help="number of threads copying and formatting files (render), or "
+            "writing rows (write-many)")
+    parser.add_option("--incremental",
+        action="store_true", dest="incremental",
+        help="only write the files which content or mode changed "
+            "(render and write-many)")
+    parser.add_option("--csv",
+        action="store_true", dest="csv",
+        help="read the rows as CSV, with a header line, instead of JSON "
+            "lines (write-many)")
+    return parser
+
+
+def read_rows(fileobj, is_csv=False):
+    """Yield the rows of variables read from `fileobj`: one JSON object per
+    line, or CSV lines with a header line.
+    """
+    if is_csv:
+        for row in csv.DictReader(fileobj):
+            yield row
+        return
+    for line in fileobj:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_many(skeleton, dst_pattern, options, stdin=None, stdout=None):
+    """Write the skeleton for each row read from `stdin` and print the
+    results to `stdout`.
+
+    Return 1 if a row failed, 0 otherwise.
+    """
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+    kw = {}
+    if options.incremental:
+        kw['incremental'] = True
+    status = 0
+    results = import_skeleton(skeleton).write_many(
+        read_rows(stdin, options.csv), dst_pattern,
+        workers=options.workers, **kw)
+    for result in results:
+        if result['status'] != 'ok':
+            status = 1
+        stdout.write(json.dumps(result, sort_keys=True) + '\n')
+        stdout.flush()
+    return status
+
+
+def main(argv=None):
+    """Run the `skeleton` command."""
+    parser = configure_parser()
+    options, args = parser.parse_args(argv)
+    if not args or args[0] not in COMMANDS:
+        parser.error("expected a serve, render or write-many command")
+
+    logging.basicConfig(
+        level=options.verbose, format="%(levelname)s - %(message)s")
+
+    if args[0] == 'serve':
+        if len(args) != 1:
+            parser.error("incorrect number of arguments")
+        serve(options.socket, options.preload)
+        return 0
+
+    if args[0] == 'write-many':
+        if len(args) != 3:
+            parser.error("incorrect number of arguments")
+        return write_many(args[1], args[2], options)
+
+    if len(args) < 3:
+        parser.error("incorrect number of arguments")
+    variables = {}
+    for arg in args[3:]:
+        name, sep, value = arg.partition('=')
+        if not sep:
+            parser.error("invalid variable %r (expected name=value)" % arg)
+        variables[name] = value
+
+    write_options = {}
+    if options.workers is not None:
+        write_options['workers'] = options.workers
+    if options.incremental:
+        write_options['incremental'] = True
+    try:
+        response = render(
+            args[1], args[2], variables, options.socket, **write_options)
+    except (RenderError, IOError,), exc:
+        sys.stderr.write("%s\n" % exc)
+        return 1
+    logging.info(
+        "Wrote %s in %.1f ms", args[1], response['duration'] * 1000)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
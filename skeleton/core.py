@@ -1,23 +1,60 @@
 """
 Core skeleton component
 """
+from __future__ import with_statement
+from contextlib import closing
 import codecs
 import collections
-import datetime
+import errno
 import functools
+import hashlib
 import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import optparse
 import os
+import pickle
+import Queue
 import shutil
+import stat
 import sys
-import weakref
-
+import tempfile
+import threading
+import time
+
+from skeleton.backends import FILE_SYSTEM, FileSystemBackend, ArchiveBackend
+from skeleton.plan import Plan, PlanSection, Operation
+from skeleton.profiling import WriteProfile
+from skeleton.resources import get_loader, open_resource, stat_resource
+from skeleton.manifest import (
+    get_manifest, file_digest, fileobj_digest, OutputManifest, DigestFile)
+from skeleton.templates import (
+    TEMPLATE_CACHE, init_render_worker, render_chunk, render_stream,
+    render_mmap, is_utf8, VariableRecorder, VariableSnapshot)
 from skeleton.utils import (
-    get_loggger, get_file_mode, vars_to_optparser, prompt)
+    get_loggger, get_file_mode, vars_to_optparser, prompt, copy_file)
+from skeleton.variables import VariableStore, get_variable_schema
 
 
 _LOG = get_loggger(__name__)
 
+_REAL_SRC = {}
+
+
+if sys.version_info[0] < 3:
+    # the Python 2 syntax is hidden from 2to3, which would turn it into
+    # `exc_info[0](exc_info[1])`
+    exec("""def _reraise(exc_info):
+    \"\"\"Raise the exception of the `exc_info` tuple, with its traceback.
+    \"\"\"
+    raise exc_info[0], exc_info[1], exc_info[2]
+""")
+else:
+    def _reraise(exc_info):
+        """Raise the exception of the `exc_info` tuple, with its traceback.
+        """
+        raise exc_info[1].with_traceback(exc_info[2])
+
 
 class SkeletonError(Exception):
     """Root exception"""
@@ -68,11 +105,131 @@ class ValidateError(SkeletonError):
     """
 
 
+class WriteCancelled(SkeletonError):
+    """Raised by Skeleton.write when its `cancel_event` is set.
+    """
+
+
+class RequirementCycleError(SkeletonError):
+    """Raised by Skeleton.write when skeletons require each other.
+
+    `cycle` is the list of the skeleton classes of the cycle, starting and
+    ending with the same class.
+    """
+
+    def __init__(self, cycle):
+        super(RequirementCycleError, self).__init__(
+            "Requirement cycle: %s" % ' -> '.join(
+                skel_class.__name__ for skel_class in cycle))
+        self.cycle = cycle
+
+
+class PlanError(SkeletonError):
+    """Raised by Skeleton.execute when the plan of a skeleton doesn't hold
+    everything its write does (see `Skeleton.executable_plan`).
+    """
+
+
+class WriteTask(object):
+    """Skeleton write running in a background thread.
+
+    Returned by `Skeleton.write_async` and `Skeleton.run_async`.
+    Callbacks added with `add_done_callback` are called from the background
+    thread; with an event loop, use them to wake it up
+    (e.g. asyncio's `loop.call_soon_threadsafe`).
+    """
+
+    def __init__(self, func, args=(), kw=None, semaphore=None):
+        self.cancel_event = threading.Event()
+        self._func = func
+        self._args = args
+        self._kw = dict(kw or {}, cancel_event=self.cancel_event)
+        self._semaphore = semaphore
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        """Start the background thread."""
+        self._thread.start()
+        return self
+
+    def _run(self):
+        """Run the write, waiting for a slot first if the number of
+        concurrent writes is limited.
+        """
+        try:
+            if self._semaphore is not None:
+                self._semaphore.acquire()
+            try:
+                self._result = self._func(*self._args, **self._kw)
+            finally:
+                if self._semaphore is not None:
+                    self._semaphore.release()
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Call `callback(task)` once the write has finished.
+
+        The callback is called immediately if the write is finished already.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        """Stop the write before it creates any other file or directory.
+        """
+        self.cancel_event.set()
+
+    def cancelled(self):
+        """Tell if the write was stopped by `cancel()`."""
+        return (self._exc_info is not None
+            and isinstance(self._exc_info[1], WriteCancelled))
+
+    def done(self):
+        """Tell if the write has finished."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the write to finish; return True if it has finished."""
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the write to finish and return its result.
+
+        Raises the exception raised by the write (`WriteCancelled` if it has
+        been cancelled), or a `SkeletonError` if the timeout expired.
+        """
+        if not self.wait(timeout):
+            raise SkeletonError("The write is not finished.")
+        if self._exc_info is not None:
+            _reraise(self._exc_info)
+        return self._result
+
+
 def run_requirements_last(skel_method):
     """Decorator for Skeleton methods
 
     The return wrapper will run the same method of the required
     skeleton instances after the wrapped method exists.
+
+    Skeleton doesn't use it any more (see `run_requirements_first`); it is
+    kept for the subclasses decorating their own methods with it.
     """
     def wrapper(self, *args, **kw):
         """Method wrapper."""
@@ -85,22 +242,191 @@ def run_requirements_last(skel_method):
     return wrapper
 
 
-def run_requirements_first(skel_method):
+def check_variables_first(skel_method):
     """Decorator for Skeleton methods
 
-    The return wrapper will first run the same method of the required
-    skeleton instances.
+    The returned wrapper checks the variables of the skeleton and of the
+    skeletons it requires, in a single pass, before running the method. It
+    doesn't check them again when the method of a required skeleton is run
+    by the `RequirementGraph` of a parent skeleton.
     """
     def wrapper(self, *args, **kw):
         """Method wrapper."""
-        for skel in self.required_skeletons_instances:
-            if hasattr(skel, skel_method.__name__):
-                getattr(skel, skel_method.__name__)(*args, **kw)
+        if not self._requirements_scheduled:
+            self.check_variables()
         return skel_method(self, *args, **kw)
     functools.update_wrapper(wrapper, skel_method)
     return wrapper
 
 
+def run_requirements_first(skel_method):
+    """Decorator for Skeleton methods
+
+    The return wrapper will first run the same method of the skeletons
+    required by the skeleton, directly or not, in the order of their
+    `RequirementGraph`.
+    """
+    def wrapper(self, *args, **kw):
+        """Method wrapper."""
+        if self._requirements_scheduled:
+            # the requirements are run by the graph of a parent skeleton
+            return skel_method(self, *args, **kw)
+        results = RequirementGraph(self).run(skel_method.__name__, args, kw)
+        results.append(skel_method(self, *args, **kw))
+        return merge_results(results)
+    functools.update_wrapper(wrapper, skel_method)
+    return wrapper
+
+
+class RequirementGraph(object):
+    """Graph of the skeletons required by the `root` skeleton, directly or
+    not.
+
+    A skeleton class required by several skeletons is a single node (the
+    skeleton instance created by the first skeleton requiring it). `nodes`
+    lists the required skeletons, each one after the skeletons it requires;
+    `dependencies` maps each skeleton class to the set of the classes it
+    requires.
+
+    Raises a `RequirementCycleError` if skeletons require each other.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.nodes = []
+        self.dependencies = {}
+        self._visit(root, [])
+        # the root is run by the caller
+        self.nodes.pop()
+
+    def _visit(self, skel, path):
+        """Add `skel` and its requirements to the graph (depth first).
+
+        `path` is the list of the classes of the skeletons requiring `skel`.
+        """
+        skel_class = skel.__class__
+        if skel_class in path:
+            raise RequirementCycleError(
+                path[path.index(skel_class):] + [skel_class])
+        if skel_class in self.dependencies:
+            return
+
+        path.append(skel_class)
+        dependencies = set()
+        for required in skel.required_skeletons_instances:
+            self._visit(required, path)
+            dependencies.add(required.__class__)
+        path.pop()
+        self.dependencies[skel_class] = dependencies
+        self.nodes.append(skel)
+
+    def run(self, method_name, args, kw):
+        """Run the `method_name` method of each required skeleton with the
+        `args` and `kw` arguments, requirements first, and return the
+        results in the order of `nodes`.
+
+        If the `workers` keyword is greater than 1, skeletons which don't
+        depend on each other run at the same time (at most `workers` of
+        them), unless they might write the same files (see
+        `Skeleton._output_files`).
+        """
+        nodes = [
+            skel for skel in self.nodes if hasattr(skel, method_name)]
+        for skel in nodes:
+            skel._requirements_scheduled = True
+        try:
+            workers = kw.get('workers')
+            if not workers or workers < 2 or len(nodes) < 2:
+                return [getattr(skel, method_name)(*args, **kw)
+                    for skel in nodes]
+            return self._run_concurrently(
+                nodes, method_name, args, kw, workers)
+        finally:
+            for skel in nodes:
+                skel._requirements_scheduled = False
+
+    def _run_concurrently(self, nodes, method_name, args, kw, workers):
+        """Run the nodes with a pool of `workers` threads."""
+        results = [None] * len(nodes)
+        pending = list(enumerate(nodes))
+        running = {}
+        # skeletons without the method are done
+        done = set(self.dependencies) - set(
+            skel.__class__ for skel in nodes)
+        failed = []
+        finished = Queue.Queue()
+        # the files each node writes, computed once
+        outputs = {}
+
+        def run_node(index, skel):
+            """Run a node and report its result."""
+            try:
+                finished.put(
+                    (index, getattr(skel, method_name)(*args, **kw), None,))
+            except Exception:
+                finished.put((index, None, sys.exc_info(),))
+
+        pool = ThreadPool(workers)
+        try:
+            while running or (pending and not failed):
+                for item in list(pending):
+                    if failed or len(running) >= workers:
+                        break
+                    index, skel = item
+                    skel_class = skel.__class__
+                    if not self.dependencies[skel_class] <= done:
+                        continue
+                    if index not in outputs:
+                        outputs[index] = skel._output_files(*args, **kw)
+                    if any(_may_overlap(outputs[index], other)
+                        for other in running.values()):
+                        continue
+                    pending.remove(item)
+                    running[index] = outputs[index]
+                    pool.apply_async(run_node, (index, skel,))
+
+                index, result, exc_info = finished.get()
+                del running[index]
+                if exc_info is not None:
+                    failed.append(exc_info)
+                    continue
+                results[index] = result
+                done.add(nodes[index].__class__)
+        finally:
+            pool.close()
+            pool.join()
+
+        if failed:
+            _reraise(failed[0])
+        return results
+
+
+def _may_overlap(files, other_files):
+    """Tell if two sets of files (None if unknown) might intersect."""
+    if files is None or other_files is None:
+        return True
+    return not files.isdisjoint(other_files)
+
+
+def merge_results(results):
+    """Merge the results of a method of a skeleton and of its required
+    skeletons.
+
+    None results are ignored; results with a `merge` method (like the
+    `Plan` returned by a dry run) are merged in order. Otherwise, the last
+    result is returned.
+    """
+    merged = None
+    for result in results:
+        if result is None:
+            continue
+        if merged is not None and hasattr(merged, 'merge'):
+            merged = merged.merge(result)
+        else:
+            merged = result
+    return merged
+
+
 class Skeleton(collections.MutableMapping):
     """Skeleton Class.
 
@@ -123,7 +449,8 @@ class Skeleton(collections.MutableMapping):
     required_skeletons attribute.
     """
 
-    #: Path to skeleton folder, relative to Skeleton module
+    #: Path to skeleton folder, relative to Skeleton module (the module
+    #: and the skeleton can be inside a zip archive)
     src = None
 
     #: List of variable required by templates
@@ -138,21 +465,90 @@ class Skeleton(collections.MutableMapping):
     template_suffix = '_tmpl'
     run_dry = False
 
+    #: Cache of compiled templates (shared by all skeletons by default).
+    #: Set it to None to read and parse templates on each write.
+    template_cache = TEMPLATE_CACHE
+
+    #: Minimum size (in bytes) of the templates of a skeleton for
+    #: write(processes=N) to render them in a process pool.
+    process_min_size = 256 * 1024
+
+    #: Size (in bytes) of the batches of templates sent to each
+    #: worker process.
+    process_chunk_size = 64 * 1024
+
+    #: Templates bigger than this size (in bytes) are rendered by chunks
+    #: instead of being loaded in memory (and are not cached).
+    stream_min_size = 4 * 1024 * 1024
+
+    #: Limits the number of writes run at the same time by `write_async`
+    #: and `run_async` (shared by all skeletons; None for no limit).
+    async_semaphore = threading.BoundedSemaphore(4)
+
+    #: Directory where to save the skeleton manifests (see
+    #: `skeleton.manifest`); they are only kept in memory if it's None.
+    manifest_cache_dir = None
+
+    #: How static files are created: 'copy' (the default, which might use
+    #: a copy-on-write clone anyway), 'hardlink' or 'reflink'.
+    link_static = 'copy'
+
+    #: Directory holding the files static files are hard linked to
+    #: (by default, they are linked to the skeleton files).
+    link_cache_dir = None
+
+    #: Only write the files which content or mode changed (see `write`).
+    incremental = False
+
+    #: Backend creating the files and directories (see `skeleton.backends`).
+    backend = FILE_SYSTEM
+
+    #: Name of the manifest incremental writes keep in the destination
+    #: directory.
+    output_manifest_name = '.skeleton-manifest.json'
+
+    #: Tell if the plan of a dry run holds everything the write does, so
+    #: that it can be executed later (see `execute`). None means it does
+    #: unless `write` is overwritten; set it to True if `write` only sets
+    #: variables before calling `Skeleton.write`.
+    executable_plan = None
+
+    _cancel_event = None
+    _link_static = None
+    _incremental = False
+    _backend = None
+    _dst_dir = None
+    _output_manifest = None
+    _name_dependencies = None
+    _zipped = False
+    _snapshot = None
+    _manifest = None
+    _requirements_scheduled = False
+    _profile = None
+
     def __init__(self, skeleton=None, **kw):
         self._required_skeletons_instances = None
-        self._defaults = {}
 
+        defaults = self.variable_schema().defaults
         if isinstance(skeleton, Skeleton):
-            self.set_variables = weakref.proxy(skeleton)
+            self._store = VariableStore(defaults, skeleton._store)
         else:
-            self.set_variables = {'year': datetime.datetime.utcnow().year}
+            self._store = VariableStore(defaults)
             if skeleton is not None:
-                self.set_variables.update(skeleton)
-        self.set_variables.update(kw)
+                for key in skeleton:
+                    self._store.set(key, skeleton[key], 'cli')
+        for key, value in kw.items():
+            self._store.set(key, value, 'cli')
 
-        for var in self.variables:
-            if var.default is not None:
-                self._defaults[var.name] = var.default
+    @classmethod
+    def variable_schema(cls):
+        """Return the `skeleton.variables.VariableSchema` of the class: the
+        variables declared by the class and by the classes it requires,
+        directly or not.
+
+        It's built once per class, without instantiating any skeleton.
+        """
+        return get_variable_schema(cls)
 
     @property
     def required_skeletons_instances(self):
@@ -170,6 +566,9 @@ class Skeleton(collections.MutableMapping):
     def real_src(self):
         """
         Absolute Path to skeleton directory (read-only).
+
+        The path is resolved once per Skeleton class. It can be the path
+        of a directory inside a zip archive (see `skeleton.resources`).
         """
         if self.src is None:
             raise AttributeError(
@@ -177,74 +576,165 @@ class Skeleton(collections.MutableMapping):
                 self.__class__.__name__
                 )
 
+        key = (self.__class__, self.src,)
+        skel_path = _REAL_SRC.get(key)
+        if skel_path is not None:
+            return skel_path
+
         mod = sys.modules[self.__class__.__module__]
         mod_dir = os.path.dirname(mod.__file__)
         skel_path = os.path.join(mod_dir, self.src)
 
-        if not os.path.exists(skel_path):
+        if not os.path.exists(skel_path) and get_loader(skel_path) is None:
             raise AttributeError("No skeleton at %r" % skel_path)
+        _REAL_SRC[key] = skel_path
         return skel_path
 
+    @property
+    def manifest(self):
+        """
+        Manifest of the skeleton directory (see `skeleton.manifest`).
+        """
+        return get_manifest(
+            self.real_src, self.template_suffix, self.manifest_cache_dir)
+
+    @property
+    def set_variables(self):
+        """
+        Variables set on the skeleton or on the skeleton requiring it
+        (read-only; set them on the skeleton).
+        """
+        return self._store.set_values
+
     def __contains__(self, key):
-        return key in self.set_variables or key in self._defaults
+        return key in self._store
 
     def __delitem__(self, key):
-        self.set_variables.__delitem__(key)
+        del self._store[key]
 
     def __getitem__(self, key):
-        try:
-            return self.set_variables[key]
-        except KeyError:
-            pass
-        try:
-            return self._defaults[key]
-        except KeyError:
-            pass
-        raise KeyError("%s is not set and has no default value" % key)
+        return self._store[key]
 
     def __iter__(self):
-        return iter(self.keys())
+        return iter(self._store)
 
     def __len__(self):
-        return len(self.set_variables) + len(self._defaults)
+        return len(self._store)
 
     def __setitem__(self, key, value):
-        self.set_variables[key] = value
+        self._store.set(key, value)
+
+    def layer_of(self, key):
+        """Return the name of the layer the value of the variable `key`
+        comes from: 'cli', 'computed', 'parent', 'defaults' or 'builtins'
+        (see `skeleton.variables`).
 
-    def keys(self):
+        Raise a KeyError if the variable is not set and has no default.
         """
-        Return names of variables that are set or have a value
+        return self._store.layer_of(key)
+
+    def _variables_version(self):
+        """Return a number changing each time a variable of the skeleton,
+        or of the skeleton it gets its variables from, is set or deleted.
         """
-        return list(set(self.set_variables.keys() + self._defaults.keys()))
+        return self._store.version
+
+    def _take_snapshot(self):
+        """Return a `VariableSnapshot` of the variables.
 
-    def update(self, *args, **kw):
+        The variable store is copied as a whole unless `__getitem__` is
+        overwritten.
         """
-        Update the set_variables attribute
+        if (getattr(self.__getitem__, '__func__', None)
+            is Skeleton.__dict__['__getitem__']):
+            return self._store.snapshot()
+        return VariableSnapshot(self, self._variables_version())
+
+    @property
+    def _values(self):
+        """Variables used to render the skeleton.
+
+        During a write, it's the `VariableSnapshot` taken when the write
+        started: the variables (set, inherited from the parent skeleton or
+        default) are resolved once instead of once per file. If a variable
+        is set or deleted during the write, a new snapshot is taken. Outside
+        a write, it's the skeleton itself.
         """
-        self.set_variables.update(*args, **kw)
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self
+        version = self._variables_version()
+        if snapshot.version != version:
+            _LOG.debug(
+                "%s variables changed during the write; taking a new "
+                "snapshot", self.__class__.__name__)
+            snapshot = self._snapshot = self._take_snapshot()
+        return snapshot
 
-    @run_requirements_last
     def check_variables(self):
         """
         Raise a KeyError if any required variable is missing.
+
+        The variables of the skeletons it requires, directly or not, are
+        checked too, in a single pass over the `RequirementGraph`. The
+        result is memoized per skeleton class until a variable is set or
+        deleted: a skeleton class already checked with the same variables
+        is skipped.
         """
+        for skel in RequirementGraph(self).nodes:
+            if (getattr(skel.check_variables, '__func__', None)
+                is Skeleton.__dict__['check_variables']):
+                skel._check_own_variables()
+            else:
+                # it might check other skeletons
+                skel.check_variables()
+        self._check_own_variables()
+
+    def _check_own_variables(self):
+        """Raise a KeyError if a variable of the skeleton (not of its
+        requirements) is missing, unless the skeleton class has been checked
+        since the variables last changed.
+        """
+        checked = self._store.set_values.checked
+        version = self._variables_version()
+        if checked.get(self.__class__) == version:
+            return
         for var in self.variables:
             self.__getitem__(var.name)
+        checked[self.__class__] = version
 
-    @run_requirements_last
     def get_missing_variables(self):
         """
         Prompt user for any missing variable
         (even the ones with a default value).
+
+        The variables of the skeletons it requires, directly or not, are
+        prompted for too (see `variable_schema`). Required skeletons
+        overriding this method have their method called afterward.
         """
-        for var in self.variables:
-            if var.name not in self.set_variables:
-                self[var.name] = var.do_prompt()
+        schema = self.variable_schema()
+        for var in schema.variables:
+            if self._store.layer_of(var.name, 'defaults') == 'defaults':
+                self._store.set(var.name, var.do_prompt(), 'cli')
             else:
                 _LOG.debug("Variable %r already set", var.name)
 
+        base = Skeleton.__dict__['get_missing_variables']
+        overriding = set(
+            skel_class for skel_class in schema.classes[1:]
+            if getattr(skel_class.get_missing_variables, '__func__', None)
+                is not base)
+        if not overriding:
+            return
+        for skel in RequirementGraph(self).nodes:
+            if skel.__class__ in overriding:
+                skel.get_missing_variables()
+
+    @check_variables_first
     @run_requirements_first
-    def write(self, dst_dir, run_dry=False):
+    def write(self, dst_dir, run_dry=False, workers=None, processes=None,
+        cancel_event=None, link_static=None, incremental=None, backend=None,
+        profile=False):
         """Apply skeleton to `dst_dir`.
 
         Copy files and folders from the `src` folder to the `dst_dir`.
@@ -257,53 +747,223 @@ class Skeleton(collections.MutableMapping):
         If the file name ends by "_tmpl" its content will be formatted by the
         template formatter.
 
+        If `run_dry` is True, nothing is written; it returns a
+        `skeleton.plan.Plan` listing the operations of the write (and of the
+        writes of the required skeletons), built from the skeleton manifest.
+        The plan can be executed later with `skeleton.plan.execute(plan)`.
+
+        If `workers` is greater than 1, files are copied and formatted by a
+        pool of `workers` threads (directories are still created first).
+        If several files fail, the error of the first one in the skeleton
+        walk order is raised.
+
+        If `processes` is greater than 1, templates are rendered by a pool
+        of `processes` processes, unless the skeleton templates are smaller
+        than `process_min_size` or `template_formatter` is overwritten.
+
+        `cancel_event` is an optional `threading.Event`; once it is set,
+        the write stops before creating another file or directory and
+        raises `WriteCancelled`.
+
+        `link_static` overwrites the `link_static` attribute:
+
+        - 'copy': static files are copied;
+        - 'hardlink': static files are hard links to the skeleton files,
+          or to the copy of them in `link_cache_dir` if it is set. A file is
+          copied instead if it cannot be linked;
+        - 'reflink': static files are copy-on-write clones of the skeleton
+          files when the file system supports it; copied otherwise.
+
+        Hard linked files share their content and their permissions with the
+        file they are linked to: don't edit them in place. Files in
+        `link_cache_dir` are named after their content digest *and* their
+        mode, so that files only differing by their permissions never share
+        their inode.
+
+        If `incremental` (or the `incremental` attribute) is True, templates
+        are rendered in memory and compared with the existing files (size
+        first, then digest); only files which content or mode changed are
+        written, so the others keep their modification time. The state of
+        the files is recorded in `output_manifest_name`, in `dst_dir`, so
+        that the next incremental write doesn't need to read files that
+        kept their size and modification time.
+
+        Incremental writes also record the variables each file depends on
+        (the variables used by its template and by its path). A template is
+        not even rendered if its file, the template and the values of those
+        variables didn't change since the last write.
+
+        `backend` overwrites the `backend` attribute, which creates the
+        files and directories; use a `skeleton.backends.MemoryBackend` to
+        keep them in memory. Incremental writes need a file system backend.
+
+        If `profile` is True (and `run_dry` isn't), each phase of the write
+        is timed; it returns a `skeleton.profiling.WriteProfile` holding the
+        operation counts, bytes and durations per phase and per skeleton
+        class (merged with the profiles of the required skeletons).
+
         Raises:
 
-        - `KeyError` if a variable is missing and doesn't have a default.
+        - `KeyError` if a variable is missing and doesn't have a default;
+          the variables of all the required skeletons are checked before
+          anything is written (see `check_variables`).
+        - `RequirementCycleError` if skeletons require each other.
         - `TemplateKeyError` if it found an unexpected variable in a template.
         - `FileNameKeyError` if it found an unexpected variable in a file name.
         - IOError if it cannot read the skeleton files, or cannot create
           files and folder.
+        - `WriteCancelled` if `cancel_event` has been set.
         """
         self.run_dry = run_dry
+        try:
+            self._set_write_options(
+                cancel_event, link_static, incremental, backend)
+
+            _LOG.info(
+                "Rendering %s skeleton at %r...",
+                self.__class__.__name__,
+                dst_dir)
+
+            if profile and not run_dry:
+                self._profile = WriteProfile()
+            self._snapshot = self._take_snapshot()
+            self._load_manifest()
+            section = self._plan(dst_dir)
+            if run_dry:
+                for operation in section.operations:
+                    _LOG.info("%s", operation.describe())
+                return Plan([section])
+            self._execute(section, workers, processes)
+            return self._profile
+        finally:
+            self._snapshot = None
+            self._manifest = None
+            self._profile = None
+            self._reset_write_options()
+
+    def execute(self, section, workers=None, processes=None,
+        cancel_event=None, link_static=None, incremental=None, backend=None):
+        """Execute the operations of a plan section.
+
+        The section should come from a plan returned by
+        `write(dst_dir, run_dry=True)` (see `skeleton.plan.execute`); the
+        options are the ones of `write`.
+
+        Raises `PlanError` if the skeleton plans are not executable (see
+        `check_executable_plan`).
+        """
+        self.check_executable_plan()
+        self.run_dry = False
+        try:
+            self._set_write_options(
+                cancel_event, link_static, incremental, backend)
+            self._snapshot = self._take_snapshot()
+            self._load_manifest()
+            self._execute(section, workers, processes)
+        finally:
+            self._snapshot = None
+            self._manifest = None
+            self._reset_write_options()
 
-        _LOG.info(
-            "Rendering %s skeleton at %r...",
-            self.__class__.__name__,
-            dst_dir)
-
-        self.check_variables()
-
-        if not os.path.exists(dst_dir):
-            self._mkdir(dst_dir)
-
-        real_src = self.real_src
-        real_src_len = len(real_src)
-        _LOG.debug("Getting skeleton from %r" % real_src)
-
-        for dir_path, dir_names, file_names in os.walk(real_src):
-            rel_dir_path = dir_path[real_src_len:].lstrip(r'\/')
-
-            #copy files
-            for file_name in file_names:
-                src = os.path.join(dir_path, file_name)
-                dst = os.path.join(
-                    dst_dir,
-                    rel_dir_path,
-                    self._format_file_name(file_name, dir_path)
-                    )
-                self._copy_file(src, dst)
-
-            #copy directories
-            for dir_name in dir_names:
-                src = os.path.join(dir_path, dir_name)
-                dst = os.path.join(
-                    dst_dir,
-                    rel_dir_path,
-                    self.template_formatter(dir_name))
-                self._mkdir(dst, like=src)
+    @classmethod
+    def check_executable_plan(cls):
+        """Raise a `PlanError` if the plans of the skeleton cannot be
+        executed: its `write` is overwritten (e.g. to create files after
+        the skeleton write), and `executable_plan` isn't True.
+        """
+        executable = cls.executable_plan
+        if executable is None:
+            executable = (getattr(cls.write, '__func__', cls.write)
+                is Skeleton.__dict__['write'])
+        if not executable:
+            raise PlanError(
+                "%s overwrites write; its plan doesn't hold all its "
+                "operations and cannot be executed" % cls.__name__)
+
+    def write_archive(self, fileobj, format='tar.gz', root='',
+        deterministic=False, **kw):
+        """Write the skeleton into an archive.
+
+        The files are added to the archive, a 'tar', 'tar.gz' or 'zip'
+        archive written to the `fileobj` binary file object, once the write
+        (including what an overwritten `write` does after `Skeleton.write`)
+        is done: rendered files are kept in memory until then, and static
+        files are streamed from the skeleton (see
+        `skeleton.backends.ArchiveBackend`). `root` is the directory of the
+        archive holding the files.
+
+        The entries are added in name order. If `deterministic` is True,
+        they all get a null timestamp, so that writing the same skeleton
+        with the same variables gives the same archive.
+
+        The other keywords are the ones of `write`.
+        """
+        backend = ArchiveBackend(
+            fileobj, format, mtime=0 if deterministic else None)
+        try:
+            return self.write(root or os.curdir, backend=backend, **kw)
+        finally:
+            backend.close()
 
-    def run(self, dst_dir, run_dry=False):
+    @classmethod
+    def write_many(cls, rows, dst_pattern, workers=None, **kw):
+        """Write the skeleton once for each mapping of variables of the
+        `rows` iterable.
+
+        `dst_pattern` is formatted with the variables of each row to get its
+        destination directory (e.g. "projects/{project_name}"). With more
+        than one worker, rows are written by a pool of `workers` threads.
+        All rows share the skeleton manifests and the compiled templates.
+        The other keywords are the ones of `write`.
+
+        Yield a result dict for each row, in the rows order, with the row
+        'index', its 'dst_dir', its 'status' ('ok' or 'error') and the
+        'duration' of its write in seconds; failed rows also have the
+        'error' class name and the error 'message'. A failed row doesn't
+        stop the others.
+        """
+        def write_row(indexed_row):
+            """Write one row and return its result."""
+            index, row = indexed_row
+            start = time.time()
+            result = {'index': index, 'dst_dir': None, 'status': 'ok'}
+            try:
+                skel = cls(**dict(
+                    (str(name), value,) for name, value in row.items()))
+                result['dst_dir'] = skel._format_string(dst_pattern)
+                skel.write(result['dst_dir'], **kw)
+            except (Exception,), exc:
+                _LOG.debug("Row %d failed", index, exc_info=True)
+                result.update(
+                    status='error',
+                    error=exc.__class__.__name__,
+                    message=str(exc))
+            result['duration'] = time.time() - start
+            return result
+
+        if not workers or workers < 2:
+            for indexed_row in enumerate(rows):
+                yield write_row(indexed_row)
+            return
+
+        # the first row builds the manifests and compiles the templates
+        # before the other rows use them
+        rows = enumerate(rows)
+        for indexed_row in rows:
+            yield write_row(indexed_row)
+            break
+
+        pool = ThreadPool(workers)
+        try:
+            for result in pool.imap(write_row, rows):
+                yield result
+        except:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+
+    def run(self, dst_dir, run_dry=False, **kw):
         """Like write() but prompt user for missing variables.
 
         Raises:
@@ -314,7 +974,30 @@ class Skeleton(collections.MutableMapping):
           files and folder.
         """
         self.get_missing_variables()
-        self.write(dst_dir, run_dry=run_dry)
+        return self.write(dst_dir, run_dry=run_dry, **kw)
+
+    def write_async(self, dst_dir, run_dry=False, **kw):
+        """Like write() but run it in a background thread.
+
+        Return a started `WriteTask`; its `cancel()` method stops the write
+        (and the write of required skeletons) before the next file or
+        directory is created.
+
+        At most `async_semaphore` writes run at the same time; the others
+        wait for their turn.
+        """
+        return WriteTask(
+            self.write, (dst_dir,), dict(kw, run_dry=run_dry),
+            semaphore=self.async_semaphore).start()
+
+    def run_async(self, dst_dir, run_dry=False, **kw):
+        """Like run() but run it in a background thread.
+
+        Return a started `WriteTask` (see `write_async`).
+        """
+        return WriteTask(
+            self.run, (dst_dir,), dict(kw, run_dry=run_dry),
+            semaphore=self.async_semaphore).start()
 
     @classmethod
     def cmd(cls, argv=None, **kw):
@@ -334,15 +1017,26 @@ class Skeleton(collections.MutableMapping):
             format="%(levelname)s - %(message)s"
             )
 
-        for var in skel.variables:
-            value = getattr(options, var.name)
+        for var in skel.variable_schema().variables:
+            value = getattr(options, var.name, None)
             if value is not None:
-                skel[var.name] = value
-
-        skel.run(args[0])
+                skel._store.set(var.name, value, 'cli')
+
+        result = skel.run(
+            args[0],
+            workers=options.workers_,
+            processes=options.processes_,
+            link_static=options.link_static_,
+            incremental=options.incremental_,
+            profile=options.profile_)
+        if options.profile_ and result is not None:
+            sys.stdout.write(result.summary() + '\n')
 
     def configure_parser(self):
         """Configure parser for Skeleton.cmd().
+
+        It has an option for each variable of the skeleton and of the
+        skeletons it requires.
         """
         parser = optparse.OptionParser(usage="%prog [options] dst_dir")
         parser.add_option("-q", "--quiet",
@@ -352,8 +1046,26 @@ class Skeleton(collections.MutableMapping):
         parser.add_option("-d", "--debug",
             action="store_const", const=logging.DEBUG, dest="verbose_")
         parser.set_default('verbose_', logging.ERROR)
-
-        parser = vars_to_optparser(self.variables, parser=parser)
+        parser.add_option("-w", "--workers",
+            type="int", dest="workers_", metavar="N",
+            help="number of threads copying and formatting files")
+        parser.add_option("-p", "--processes",
+            type="int", dest="processes_", metavar="N",
+            help="number of processes rendering templates")
+        parser.add_option("--link-static",
+            type="choice", choices=['copy', 'hardlink', 'reflink'],
+            dest="link_static_", metavar="MODE",
+            help="create static files by copy (the default), hard link "
+                "or reflink")
+        parser.add_option("--incremental",
+            action="store_true", dest="incremental_",
+            help="only write the files which content or mode changed")
+        parser.add_option("--profile",
+            action="store_true", dest="profile_",
+            help="print the time spent in each phase of the write")
+
+        parser = vars_to_optparser(
+            self.variable_schema().variables, parser=parser)
         return parser
 
     def template_formatter(self, template):
@@ -361,36 +1073,378 @@ class Skeleton(collections.MutableMapping):
 
         Raises a KeyError if a variable is missing.
         """
-        return template.format(**self)
+        return template.format(**self._values)
+
+    def _use_template_cache(self):
+        """Tell if templates can be rendered from the template cache.
+
+        A skeleton overwriting `template_formatter` always gets
+        its templates formatted by it.
+        """
+        return (self.template_cache is not None
+            and getattr(self.template_formatter, '__func__', None)
+                is Skeleton.__dict__['template_formatter'])
+
+    def _format_string(self, template, variables=None):
+        """Format a file or directory name.
+
+        `variables` is the mapping used by the template cache (the
+        variables of the write by default).
+        """
+        if self._use_template_cache():
+            return self.template_cache.get_string(template).render(
+                self._values if variables is None else variables)
+        return self.template_formatter(template)
 
-    def _format_file_name(self, file_name, dir_path):
+    def _format_file_name(self, file_name, dir_path, variables=None):
         try:
-            return self.template_formatter(file_name)
+            return self._format_string(file_name, variables)
         except (KeyError,), exc:
             raise FileNameKeyError(
                 exc.args[0],
                 os.path.join(dir_path, file_name)
                 )
 
+    def _run_jobs(self, func, jobs, workers=None):
+        """Call `func(*job)` for each job of the `jobs` list.
+
+        With more than one worker, the jobs are run by a thread pool; once a
+        job failed, the jobs following it are skipped and the exception
+        of the first failed job is raised.
+        """
+        if not workers or workers < 2 or len(jobs) < 2:
+            for job in jobs:
+                func(*job)
+            return
+
+        failed = [len(jobs)]
+
+        def run_job(indexed_job):
+            """Run a job and return the exception info if it fails."""
+            index, job = indexed_job
+            if index > failed[0]:
+                return None
+            try:
+                func(*job)
+            except Exception:
+                failed[0] = min(failed[0], index)
+                return sys.exc_info()
+
+        pool = ThreadPool(min(workers, len(jobs)))
+        try:
+            results = pool.map(run_job, list(enumerate(jobs)))
+        finally:
+            pool.close()
+            pool.join()
+
+        for exc_info in results:
+            if exc_info is not None:
+                _reraise(exc_info)
+
+    def _render_in_processes(self, templates, processes):
+        """Render the `templates` files with a pool of worker processes.
+
+        `templates` is a list of (path, size) tuples.
+
+        The variables are sent once to each worker and the templates are sent
+        by batches of about `process_chunk_size` bytes.
+
+        Return a dict mapping each template path to a (content, exception,
+        variable_names) tuple (see `render_chunk`); return an empty dict
+        when the templates should be rendered in process.
+        """
+        if len(templates) < 2 or not self._use_template_cache():
+            return {}
+
+        if sum(size for _, size in templates) < self.process_min_size:
+            _LOG.debug("Templates too small for a process pool")
+            return {}
+
+        try:
+            variables = dict(self._values)
+            pickle.dumps(variables, pickle.HIGHEST_PROTOCOL)
+        except (Exception,), exc:
+            _LOG.debug("Cannot send variables to a process pool: %s", exc)
+            return {}
+
+        chunks = [[]]
+        chunk_size = 0
+        for src, size in templates:
+            if chunk_size >= self.process_chunk_size:
+                chunks.append([])
+                chunk_size = 0
+            chunks[-1].append(src)
+            chunk_size += size
+
+        _LOG.debug(
+            "Rendering %d templates in %d batches with %d processes",
+            len(templates), len(chunks), processes)
+        pool = multiprocessing.Pool(
+            min(processes, len(chunks)),
+            initializer=init_render_worker,
+            initargs=(variables,))
+        try:
+            results = pool.map(
+                render_chunk,
+                [(self.file_encoding, chunk,) for chunk in chunks],
+                chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        rendered = {}
+        for chunk, chunk_results in zip(chunks, results):
+            rendered.update(zip(chunk, chunk_results))
+        return rendered
+
+    def _set_write_options(
+        self, cancel_event, link_static, incremental, backend):
+        """Set the `write` options shared with `execute`.
+
+        They are only kept for the current write (see
+        `_reset_write_options`); the options not given fall back on the
+        `link_static`, `incremental` and `backend` attributes.
+        """
+        self._cancel_event = cancel_event
+        self._check_cancelled()
+        self._link_static = (
+            self.link_static if link_static is None else link_static)
+        if self._link_static not in ('copy', 'hardlink', 'reflink',):
+            raise ValueError(
+                "Unknown link_static mode: %r" % (self._link_static,))
+        self._incremental = (
+            self.incremental if incremental is None else incremental)
+        self._backend = self.backend if backend is None else backend
+        if self._incremental and not isinstance(
+            self._backend, FileSystemBackend):
+            raise ValueError("Incremental writes need a file system backend")
+
+    def _reset_write_options(self):
+        """Forget the options of the write which ended."""
+        self._cancel_event = None
+        self._link_static = None
+        self._incremental = False
+        self._backend = None
+
+    def _plan(self, dst_dir):
+        """Return the `PlanSection` of a write to `dst_dir`.
+
+        The operations are listed from the skeleton manifest: directories
+        to create (parents first), files to copy or render, and directory
+        modes to set (children first).
+        """
+        real_src = self.real_src
+        _LOG.debug("Getting skeleton from %r" % real_src)
+
+        # directories are listed before their content in the manifest
+        directories = [Operation('mkdir', None, dst_dir)]
+        files = []
+        modes = []
+        dst_dirs = {'': dst_dir}
+        track = self._incremental and not self.run_dry
+        self._name_dependencies = {'': set()}
+        values = self._values
+        profile = self._profile
+        manifest = self._manifest
+        if manifest is None:
+            manifest = self.manifest
+        for entry in manifest:
+            rel_dir_path, name = os.path.split(entry.path)
+            parent = dst_dirs[rel_dir_path]
+            variables = VariableRecorder(values) if track else values
+
+            if profile is not None:
+                start = time.time()
+            if entry.is_dir:
+                dst = os.path.join(
+                    parent, self._format_string(name, variables))
+            else:
+                dst = os.path.join(parent, self._format_file_name(
+                    name, os.path.join(real_src, rel_dir_path), variables))
+            if profile is not None:
+                self._record_phase('format_name', start)
+
+            if entry.is_dir:
+                dst_dirs[entry.path] = dst
+                directories.append(Operation('mkdir', entry.path, dst))
+                modes.append(Operation('chmod', entry.path, dst, entry.mode))
+            else:
+                if self._is_template(dst):
+                    files.append(Operation(
+                        'render', entry.path,
+                        dst[:-len(self.template_suffix)],
+                        entry.mode, entry.size))
+                else:
+                    files.append(Operation(
+                        'copy', entry.path, dst, entry.mode, entry.size))
+            if track:
+                self._name_dependencies[entry.path] = (
+                    self._name_dependencies[rel_dir_path] | variables.names)
+
+        modes.reverse()
+        return PlanSection(
+            self.__class__, dst_dir, dict(values),
+            directories + files + modes)
+
+    def _output_files(self, dst_dir, *args, **kw):
+        """Return the set of the files a write to `dst_dir` would create.
+
+        Return None if they cannot be known in advance: the skeleton
+        overwrites `write`, or its plan cannot be built.
+
+        Incremental writes to the same directory load and save the same
+        output manifest; it's counted as one of the files they write.
+        """
+        if (getattr(self.write, '__func__', None)
+            is not Skeleton.__dict__['write']):
+            return None
+        try:
+            section = self._plan(dst_dir)
+        except (AttributeError, KeyError, IOError, OSError,):
+            return None
+        files = set(
+            os.path.normpath(operation.dst)
+            for operation in section.operations
+            if operation.action in ('copy', 'render',))
+        incremental = kw.get('incremental')
+        if incremental is None:
+            incremental = self.incremental
+        if incremental:
+            files.add(os.path.normpath(
+                os.path.join(dst_dir, self.output_manifest_name)))
+        return frozenset(files)
+
+    def _execute(self, section, workers=None, processes=None):
+        """Execute the operations of the plan `section`."""
+        real_src = self.real_src
+        self._zipped = not get_loader(real_src).is_file_system
+        if self._name_dependencies is None:
+            self._name_dependencies = {}
+
+        directories = []
+        jobs = []
+        modes = []
+        for operation in section.operations:
+            if operation.action == 'mkdir':
+                directories.append(operation.dst)
+            elif operation.action == 'chmod':
+                modes.append((operation.dst, operation.mode,))
+            else:
+                jobs.append([
+                    operation.action,
+                    os.path.join(real_src, operation.src),
+                    operation.dst,
+                    None])
+
+        #create directories
+        self._create_directories(directories)
+
+        if self._incremental:
+            self._dst_dir = section.dst_dir
+            manifest_path = os.path.join(
+                section.dst_dir, self.output_manifest_name)
+            self._output_manifest = OutputManifest.load(manifest_path)
+        try:
+            #render templates in worker processes
+            if processes and processes > 1:
+                sizes = dict(
+                    (os.path.join(real_src, operation.src), operation.size,)
+                    for operation in section.operations
+                    if operation.action == 'render')
+                templates = [
+                    (job[1], sizes[job[1]],)
+                    for job in jobs
+                    if job[0] == 'render'
+                        and sizes[job[1]] <= self.stream_min_size
+                        and not self._is_up_to_date(job[1], job[2])]
+                if self._profile is not None:
+                    start = time.time()
+                rendered = self._render_in_processes(templates, processes)
+                # templates the pool didn't render are rendered (and
+                # recorded) in process
+                if self._profile is not None and rendered:
+                    self._record_phase('render', start, sum(
+                        size for path, size in templates if path in rendered))
+                for job in jobs:
+                    job[3] = rendered.get(job[1])
+
+            #copy files
+            self._run_jobs(self._write_file, jobs, workers)
+        finally:
+            if self._output_manifest is not None:
+                self._output_manifest.save(manifest_path)
+                self._output_manifest = None
+
+        #set directory modes once their content is written
+        self._set_directory_modes(modes)
+
+    def _check_cancelled(self):
+        """Raise WriteCancelled if the write has been cancelled."""
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            raise WriteCancelled(
+                "%s skeleton write cancelled" % self.__class__.__name__)
+
     def _mkdir(self, path, like=None):
-        """Create a directory (using os.mkdir)
+        """Create a directory (using the backend) unless it already exists.
 
-        Only log the event if self.run_dry is True.
+        Only log the event if self.run_dry is True. Return True if the
+        directory was created.
+
+        `write` sets the directory modes from the manifest; `like` (a path
+        to copy the mode from, see `_set_mode`) is kept for subclasses.
         """
+        self._check_cancelled()
         _LOG.info("Create directory %r", path)
-        if not self.run_dry and not os.path.exists(path):
-            os.mkdir(path)
+        created = False
+        if not self.run_dry:
+            created = self._backend.mkdir(path)
         if like is not None:
             self._set_mode(path, like)
+        return created
 
-    def _copy_file(self, src, dst):
-        """Copy src file to dst and format dst if src is a template.
-
-        The template suffix should be removed from dst.
+    def _create_directories(self, directories):
+        """Create the `directories` paths, which parents come before their
+        children.
         """
-        if dst.endswith(self.template_suffix):
+        for path in directories:
+            if self._profile is not None:
+                start = time.time()
+            self._mkdir(path)
+            if self._profile is not None:
+                self._record_phase('mkdir', start)
+
+    def _set_directory_modes(self, modes):
+        """Set the modes of the (path, mode) `modes` list, which children
+        come before their parent.
+
+        The modes come from the skeleton manifest, the skeleton directories
+        are not stat'ed again.
+        """
+        for path, mode in modes:
+            _LOG.info("Set mode of %r to '%o'", path, mode)
+            if self.run_dry:
+                continue
+            if self._profile is not None:
+                start = time.time()
+            self._backend.chmod(path, mode)
+            if self._profile is not None:
+                self._record_phase('chmod', start)
+
+    def _is_template(self, path):
+        """Tell if the file at `path` is a template."""
+        return path.endswith(self.template_suffix)
+
+    def _write_file(self, action, src, dst, rendered=None):
+        """Copy src file to dst ('copy' action) or format it into dst
+        ('render' action).
+
+        `rendered` is an optional (content, exception, variable_names) tuple
+        holding the result of the template rendering.
+        """
+        self._check_cancelled()
+        if action == 'render':
             try:
-                self._format_file(src, dst[:-len(self.template_suffix)])
+                self._format_file(src, dst, rendered)
             except (KeyError,), exc:
                 raise TemplateKeyError(exc.args[0], src)
         else:
@@ -402,37 +1456,398 @@ class Skeleton(collections.MutableMapping):
         Only log the event if self.run_dry is True.
         """
         _LOG.info("Copy %r to %r", src, dst)
+        mode = self._source_mode(src)
+        _LOG.info("Set mode of %r to '%o'", dst, mode)
         if not self.run_dry:
-            shutil.copyfile(src, dst)
-        self._set_mode(dst, like=src)
+            if self._output_manifest is not None:
+                dependencies = {'source_stat': self._source_stat(src)}
+                digest = self._static_digest(src, dst, dependencies)
+                size = dependencies['source_stat'][0]
+                if self._is_unchanged(
+                    dst, size, digest, mode, dependencies=dependencies):
+                    return
+            if self._profile is not None:
+                start = time.time()
+            if self._zipped:
+                strategy = self._copy_resource(src, dst, mode)
+            elif self._link_static == 'hardlink':
+                strategy = self._backend.link_file(
+                    self._link_source(src), dst, mode)
+            else:
+                strategy = self._backend.copy_file(src, dst, mode)
+                if self._link_static == 'reflink' and strategy != 'reflink':
+                    _LOG.debug("Cannot clone %r; it was copied", src)
+            if self._profile is not None:
+                entry = self._manifest_entry(src)
+                self._record_phase(
+                    'copy', start, entry.size if entry else 0)
+            _LOG.debug("Copied %r with the %s strategy", dst, strategy)
+            if self._output_manifest is not None:
+                self._record_output(dst, digest, mode, dependencies)
+
+    def _copy_resource(self, src, dst, mode):
+        """Copy the skeleton file `src`, a member of a zip archive, to
+        `dst`; it cannot be linked or cloned.
+        """
+        if self._link_static != 'copy':
+            _LOG.debug("Cannot link %r from a zip archive; it was copied", src)
+            # dst might be linked to a static file of another skeleton
+            self._backend.remove(dst)
+        with closing(open_resource(src)) as fd_src:
+            with self._backend.open(dst, mode) as fd_dst:
+                shutil.copyfileobj(fd_src, fd_dst)
+        return 'zip'
+
+    def _load_manifest(self):
+        """Get the skeleton manifest once for the current write.
+
+        `manifest` stats every skeleton directory to check the manifest is
+        still valid; `_plan` and `_manifest_entry` use the manifest of the
+        write instead.
+        """
+        if self._profile is not None:
+            start = time.time()
+        self._manifest = self.manifest
+        if self._profile is not None:
+            self._record_phase('walk', start)
+
+    def _manifest_entry(self, src):
+        """Return the manifest entry of the skeleton file `src`."""
+        manifest = self._manifest
+        if manifest is None:
+            manifest = self.manifest
+        return manifest.get(src[len(self.real_src):].lstrip(r'\/'))
+
+    def _source_stat(self, src):
+        """Return the [size, modification time] of the skeleton file `src`.
+
+        The skeleton manifest is only rebuilt when a skeleton directory
+        changes; a file edited in place is only noticed by stat'ing it.
+        """
+        stat_result = stat_resource(src)
+        return [stat_result.st_size, stat_result.st_mtime]
+
+    def _static_digest(self, src, dst, dependencies):
+        """Return the digest of the static file `src` copied to `dst`.
+
+        It's the digest recorded for `dst` in the output manifest if `src`
+        kept the size and modification time recorded with it; otherwise
+        `src` is read.
+        """
+        record = self._output_manifest.get(self._output_path(dst))
+        if (record is not None and len(record) > 4 and record[4]
+            and record[4].get('source_stat') == dependencies['source_stat']):
+            return record[2]
+        with closing(open_resource(src)) as fd_src:
+            return fileobj_digest(fd_src)
+
+    def _source_mode(self, src):
+        """Return the mode of the skeleton file `src`, from the manifest
+        (`src` is only stat'ed if it's not a skeleton file).
+        """
+        entry = self._manifest_entry(src)
+        if entry is None:
+            return get_file_mode(src)
+        return entry.mode
+
+    def _is_up_to_date(self, src, dst):
+        """Tell if the template `src` doesn't need to be rendered into `dst`
+        (incremental writes only).
+
+        It doesn't if `dst` kept the size, modification time and mode
+        recorded in the output manifest, and if the template (its digest,
+        size and modification time) and the values of the variables it
+        depends on didn't change since.
+        """
+        if self._output_manifest is None:
+            return False
+        record = self._output_manifest.get(self._output_path(dst))
+        if record is None or len(record) < 5 or not record[4]:
+            return False
+        dependencies = record[4]
+        entry = self._manifest_entry(src)
+        if (entry is None or entry.digest != dependencies.get('source')
+            or entry.mode != record[3]
+            or self._source_stat(src) != dependencies.get('source_stat')):
+            return False
+
+        try:
+            stat_result = os.stat(dst)
+        except (OSError,), exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return False
+        if [stat_result.st_size, stat_result.st_mtime,
+            stat.S_IMODE(stat_result.st_mode)] != record[:2] + record[3:4]:
+            return False
 
-    def _format_file(self, src, dst):
+        try:
+            values = self._values_digest(dependencies['variables'])
+        except (KeyError,):
+            return False
+        if values != dependencies['values']:
+            return False
+        _LOG.info("Skip %r; its variables didn't change", dst)
+        return True
+
+    def _dependencies(self, src, names):
+        """Return the dependencies record of the template `src` which used
+        the `names` variables (None if they are unknown).
+        """
+        entry = self._manifest_entry(src)
+        if names is None or entry is None:
+            return None
+        names = sorted(set(names) | self._name_dependencies.get(
+            src[len(self.real_src):].lstrip(r'\/'), set()))
+        return {
+            'source': entry.digest,
+            'source_stat': self._source_stat(src),
+            'variables': names,
+            'values': self._values_digest(names),
+            }
+
+    def _values_digest(self, names):
+        """Return the digest of the values of the `names` variables."""
+        digest = hashlib.sha1()
+        values = self._values
+        for name in names:
+            # names loaded from JSON are unicode strings (on python 2)
+            digest.update(('%s=%r\n' % (name, values[name],)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _is_unchanged(self, dst, size, digest, mode, allow_links=True,
+        dependencies=None):
+        """Tell if `dst` already has the `size` and `digest` content
+        (incremental writes only).
+
+        Its digest is read from the output manifest if `dst` kept its
+        recorded size and modification time; `dst` is only read if it has
+        the right size. The mode of an unchanged file is fixed if needed.
+        Files with several links are changed if `allow_links` is False.
+        """
+        try:
+            stat_result = os.stat(dst)
+        except (OSError,), exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return False
+        if stat_result.st_size != size:
+            return False
+        if not allow_links and stat_result.st_nlink > 1:
+            return False
+
+        record = self._output_manifest.get(self._output_path(dst))
+        if record is not None and record[:2] == [
+            stat_result.st_size, stat_result.st_mtime]:
+            current_digest = record[2]
+        else:
+            current_digest = file_digest(dst)
+        if current_digest != digest:
+            return False
+
+        _LOG.info("Skip unchanged %r", dst)
+        if stat.S_IMODE(stat_result.st_mode) != mode:
+            os.chmod(dst, mode)
+        self._record_output(dst, digest, mode, dependencies)
+        return True
+
+    def _record_output(self, dst, digest, mode, dependencies=None):
+        """Record the state of the file just written at `dst` in the output
+        manifest.
+        """
+        stat_result = os.stat(dst)
+        self._output_manifest.record(
+            self._output_path(dst),
+            stat_result.st_size, stat_result.st_mtime, digest, mode,
+            dependencies)
+
+    def _output_path(self, dst):
+        """Return the path of `dst` relative to the destination directory.
+        """
+        return os.path.relpath(dst, self._dst_dir)
+
+    def _link_source(self, src):
+        """Return the path of the file to hard link to create a copy of the
+        static file `src`.
+
+        It's either `src` itself or, if `link_cache_dir` is set, a copy of it
+        in the cache directory.
+        """
+        if self.link_cache_dir is None:
+            return src
+
+        entry = self._manifest_entry(src)
+        cached = os.path.join(
+            self.link_cache_dir, '%s-%04o' % (entry.digest, entry.mode,))
+        if not os.path.exists(cached):
+            fd, tmp_path = tempfile.mkstemp(dir=self.link_cache_dir)
+            os.close(fd)
+            try:
+                copy_file(src, tmp_path, entry.mode)
+                os.rename(tmp_path, cached)
+            except:
+                os.remove(tmp_path)
+                raise
+        return cached
+
+    def _format_file(self, src, dst, rendered=None):
         """Copy src to dst and format it.
 
+        Templates bigger than `stream_min_size` are formatted by chunks.
+        UTF-8 templates are formatted without decoding and encoding their
+        literal text.
+
         Raises a KeyError if a variable is missing.
         """
         _LOG.info("Creating %r from %r template...", dst, src)
+        mode = self._source_mode(src)
+        _LOG.info("Set mode of %r to '%o'", dst, mode)
         if not self.run_dry:
-            fd_src = None
-            fd_dst = None
-            try:
-                fd_src = codecs.open(src, encoding=self.file_encoding)
-                fd_dst = codecs.open(dst, 'w', encoding=self.file_encoding)
-                fd_dst.write(self.template_formatter(fd_src.read()))
-            finally:
-                if fd_src is not None:
-                    fd_src.close()
-                if fd_dst is not None:
-                    fd_dst.close()
-        self._set_mode(dst, like=src)
+            if self._is_up_to_date(src, dst):
+                return
+            tracking = self._output_manifest is not None
+            profile = self._profile
+            variables = self._values
+            if tracking:
+                variables = VariableRecorder(variables)
+
+            if (rendered is None and self._use_template_cache()
+                and self._manifest_entry(src).size > self.stream_min_size):
+                digest = None
+                if tracking:
+                    digest_file = DigestFile()
+                    self._render_large_file(src, digest_file, variables)
+                    digest = digest_file.hexdigest()
+                    dependencies = self._dependencies(src, variables.names)
+                    if self._is_unchanged(
+                        dst, digest_file.size, digest, mode,
+                        allow_links=self._link_static != 'hardlink',
+                        dependencies=dependencies):
+                        return
+                if self._link_static == 'hardlink':
+                    # dst might be linked to a static file of another
+                    # skeleton
+                    self._backend.remove(dst)
+                if profile is not None:
+                    start = time.time()
+                self._format_large_file(src, dst, mode)
+                if profile is not None:
+                    self._record_phase(
+                        'render', start, self._manifest_entry(src).size)
+                if digest is not None:
+                    self._record_output(dst, digest, mode, dependencies)
+                return
+
+            names = None
+            if rendered is not None:
+                content, exc, names = rendered
+                if exc is not None:
+                    raise exc
+            elif self._use_template_cache():
+                if profile is not None:
+                    start = time.time()
+                compiled = self.template_cache.get_file(
+                    src, self.file_encoding)
+                if profile is not None:
+                    self._record_phase(
+                        'read', start, self._manifest_entry(src).size)
+                    start = time.time()
+                if is_utf8(self.file_encoding):
+                    content = compiled.render_bytes(
+                        variables, self.file_encoding)
+                else:
+                    content = compiled.render(variables)
+                if tracking:
+                    names = variables.names
+            else:
+                if profile is not None:
+                    start = time.time()
+                with closing(open_resource(src)) as fd_src:
+                    template = fd_src.read()
+                if profile is not None:
+                    self._record_phase('read', start, len(template))
+                    start = time.time()
+                content = self.template_formatter(
+                    template.decode(self.file_encoding))
+
+            if not isinstance(content, bytes):
+                content = content.encode(self.file_encoding)
+            if profile is not None and rendered is None:
+                self._record_phase('render', start, len(content))
+
+            digest = None
+            if tracking:
+                digest = hashlib.sha1(content).hexdigest()
+                dependencies = self._dependencies(src, names)
+                if self._is_unchanged(
+                    dst, len(content), digest, mode,
+                    allow_links=self._link_static != 'hardlink',
+                    dependencies=dependencies):
+                    return
+            if self._link_static == 'hardlink':
+                # dst might be linked to a static file of another skeleton
+                self._backend.remove(dst)
+            if profile is not None:
+                start = time.time()
+            with self._backend.open(dst, mode) as fd_dst:
+                fd_dst.write(content)
+            if profile is not None:
+                self._record_phase('write', start, len(content))
+            if digest is not None:
+                self._record_output(dst, digest, mode, dependencies)
+
+    def _format_large_file(self, src, dst, mode):
+        """Format src into dst by chunks (memory mapping UTF-8 templates).
+
+        The partially written dst is removed if the formatting fails.
+        """
+        _LOG.debug("Formatting %r by chunks", src)
+        try:
+            with self._backend.open(dst, mode) as fd_dst:
+                self._render_large_file(src, fd_dst)
+        except:
+            self._backend.remove(dst)
+            raise
+
+    def _render_large_file(self, src, fd_dst, variables=None):
+        """Format src by chunks into the binary file object `fd_dst`.
+
+        `variables` is the variable mapping (self by default). Templates
+        in a zip archive cannot be memory mapped.
+        """
+        if variables is None:
+            variables = self._values
+        if is_utf8(self.file_encoding) and not self._zipped:
+            render_mmap(src, fd_dst, variables)
+            return
+
+        with closing(open_resource(src)) as fd_src:
+            reader = codecs.getreader(self.file_encoding)(fd_src)
+            writer = codecs.getwriter(self.file_encoding)(fd_dst)
+            render_stream(reader, writer, variables)
 
     def _set_mode(self, path, like):
         """
         Set mode of `path` with the mode of `like`.
+
+        `write` takes the modes from the skeleton manifest and doesn't call
+        it; it's kept for subclasses.
         """
-        _LOG.info("Set mode of %r to '%o'", path, get_file_mode(like))
+        mode = get_file_mode(like)
+        _LOG.info("Set mode of %r to '%o'", path, mode)
         if not self.run_dry:
-            shutil.copymode(like, path)
+            if self._profile is not None:
+                start = time.time()
+            self._backend.chmod(path, mode)
+            if self._profile is not None:
+                self._record_phase('chmod', start)
+
+    def _record_phase(self, phase, start, size=0):
+        """Record an operation of the `phase` phase, started at `start`,
+        in the write profile.
+        """
+        self._profile.add(
+            self.__class__.__name__, phase, time.time() - start, size)
 
 
 class Var(object):
@@ -7,8 +7,10 @@ from __future__ import with_statement
 
 import logging
 import os
+import time
 
 from skeleton import Skeleton, Var
+from skeleton.profiling import WriteProfile
 from skeleton.utils import get_loggger, insert_into_file
 from skeleton.examples.licenses import LicenseChoice
 
@@ -55,18 +57,28 @@ class BasicPackage(Skeleton):
                         'GNU Library or Lesser General Public License (LGPL)'),
         }
 
-    def write(self, dst_dir, run_dry=False):
+    def write(self, dst_dir, run_dry=False, **kw):
         """Create package(s) dynamically.
 
         Overwrite the write method to add the NSPackages and Packages entry
         before skeleton write, and create the list of package they hold after
         the skeleton write.
 
+        The package creation is recorded as a 'post_process' phase in
+        the write profile.
+
         """
         self._set_packages_and_namespaces()
-        super(BasicPackage, self).write(dst_dir, run_dry=run_dry)
-        self._create_packages(dst_dir)
-        self._add_classifier(dst_dir)
+        result = super(BasicPackage, self).write(
+            dst_dir, run_dry=run_dry, **kw)
+        backend = kw.get('backend') or self.backend
+        start = time.time()
+        self._create_packages(dst_dir, backend)
+        self._add_classifier(dst_dir, backend)
+        if isinstance(result, WriteProfile):
+            result.add(
+                self.__class__.__name__, 'post_process', time.time() - start)
+        return result
 
     def _set_packages_and_namespaces(self):
         """
@@ -84,9 +96,10 @@ class BasicPackage(Skeleton):
             self['ns_packages'].append(parent_package)
             self['packages'].append(parent_package)
 
-    def _create_packages(self, dst_dir):
+    def _create_packages(self, dst_dir, backend=None):
         """
-        Create a packages listed in self['Packages']
+        Create a packages listed in self['Packages'] (with `backend`, or
+        the `backend` attribute)
         """
         packages = self.get('packages', [])
         packages.sort()
@@ -94,9 +107,9 @@ class BasicPackage(Skeleton):
             init_body = ''
             if package in self.get('ns_packages', []):
                 init_body = NS_HEADER
-            self._create_package(dst_dir, package, init_body)
+            self._create_package(dst_dir, package, init_body, backend)
 
-    def _create_package(self, dst_dir, package, init_body=''):
+    def _create_package(self, dst_dir, package, init_body='', backend=None):
         """Create a package - directory and __init__.py file.
 
         The parent package should already exist.
@@ -107,12 +120,14 @@ class BasicPackage(Skeleton):
         _LOG.info("Creating package %s" % package)
         if self.run_dry:
             return
-        os.mkdir(path)
-        with open(os.path.join(path, '__init__.py'), 'w') as init_file:
-            init_file.write(init_body)
+        backend = backend or self.backend
+        backend.mkdir(path)
+        backend.write(
+            os.path.join(path, '__init__.py'), init_body.encode('UTF-8'))
 
-    def _add_classifier(self, dst_dir):
-        """Add license classifiers
+    def _add_classifier(self, dst_dir, backend=None):
+        """Add license classifiers (with `backend`, or the `backend`
+        attribute)
 
         """
         setup = os.path.join(dst_dir, 'setup.py')
@@ -123,11 +138,15 @@ class BasicPackage(Skeleton):
             "License :: OSI Approved",
             self.licence_classifiers[license_name],
             ]
+        _LOG.info("Adding license classifiers to %r", setup)
+        if self.run_dry:
+            return
 
         insert_into_file(
             setup,
             "Classifiers",
-            '\n'.join(['%r,' % cla for cla in classifiers])
+            '\n'.join(['%r,' % cla for cla in classifiers]),
+            backend=backend or self.backend
             )
 
 
@@ -41,15 +41,20 @@ class BSD(Skeleton):
             ),
         ]
 
-    def write(self, dst_dir, run_dry=False):
+    # write only sets a variable
+    executable_plan = True
+
+    def write(self, dst_dir, run_dry=False, **kw):
         """Set the ThirdClause if an organization name has been given.
 
+        It's set before the skeleton write takes the snapshot of the
+        variables its files are rendered with.
         """
         if self.get('organization'):
             self['third_clause'] = self.template_formatter(BSD_THIRD_CLAUSE)
         else:
             self['third_clause'] = ''
-        super(BSD, self).write(dst_dir, run_dry=run_dry)
+        return super(BSD, self).write(dst_dir, run_dry=run_dry, **kw)
 
 
 class GPL(Skeleton):
@@ -121,8 +126,8 @@ class LicenseChoice(Skeleton):
         super(LicenseChoice, self).get_missing_variables()
         self.license_skel.get_missing_variables()
 
-    def write(self, dst, run_dry=False):
+    def write(self, dst, run_dry=False, **kw):
         """Apply the license skeleton
 
         """
-        self.license_skel.write(dst, run_dry=run_dry)
+        return self.license_skel.write(dst, run_dry=run_dry, **kw)
@@ -0,0 +1,326 @@
+"""
+Index of the files and directories of a skeleton.
+
+Skeletons are walked once (through their loader, see
+`skeleton.resources`); the resulting manifest is kept in memory
+(and optionally on disk) and is only rebuilt when the modification time of
+one of the skeleton directories changed (a file or a directory was added,
+removed or renamed).
+
+Editing a file in place doesn't change its directory modification time;
+use `clear_manifests()` (or touch the directory) after such an edit.
+
+`OutputManifest` records the files written by incremental writes in a
+destination directory.
+"""
+from __future__ import with_statement
+from contextlib import closing
+import errno
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+
+from skeleton.resources import get_loader
+from skeleton.utils import get_loggger
+
+
+_LOG = get_loggger(__name__)
+
+_MANIFESTS = {}
+_LOCK = threading.Lock()
+
+
+class ManifestEntry(object):
+    """File or directory of a skeleton.
+
+    `path` is relative to the skeleton root and uses the OS path separator.
+    """
+    __slots__ = ('path', 'is_dir', 'is_template', 'mode', 'size', 'digest',)
+
+    def __init__(self, path, is_dir, is_template, mode, size, digest=None):
+        self.path = path
+        self.is_dir = is_dir
+        self.is_template = is_template
+        self.mode = mode
+        self.size = size
+        self.digest = digest
+
+    def __repr__(self):
+        return '<%s %r mode=%o>' % (
+            self.__class__.__name__, self.path, self.mode,)
+
+    def to_list(self):
+        """Return the entry as a JSON serializable list."""
+        return [
+            self.path, self.is_dir, self.is_template,
+            self.mode, self.size, self.digest,
+            ]
+
+
+class Manifest(object):
+    """Ordered list of the entries of a skeleton.
+
+    Directories come first (a directory before the directories it contains),
+    then files; both in walk order, sorted by name at each level.
+    """
+
+    def __init__(self, root, template_suffix, entries, dir_mtimes):
+        self.root = root
+        self.template_suffix = template_suffix
+        self.entries = entries
+        self.dir_mtimes = dir_mtimes
+        self._index = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def get(self, path, default=None):
+        """Return the entry for the relative `path`."""
+        if self._index is None:
+            self._index = dict(
+                (entry.path, entry,) for entry in self.entries)
+        return self._index.get(path, default)
+
+    @classmethod
+    def build(cls, root, template_suffix):
+        """Walk the skeleton at `root` and return its manifest.
+
+        `root` can be a directory inside a zip archive.
+        """
+        loader = get_loader(root)
+        if loader is None:
+            raise IOError(
+                errno.ENOENT, "No skeleton directory at %r" % (root,))
+        entries = []
+        dir_mtimes = {}
+        for rel_dir_path, dir_names, file_names in loader.walk():
+            dir_mtimes[rel_dir_path] = loader.stat(rel_dir_path).st_mtime
+            dir_names.sort()
+
+            for dir_name in dir_names:
+                path = os.path.join(rel_dir_path, dir_name)
+                entries.append(ManifestEntry(
+                    path, True, False,
+                    stat.S_IMODE(loader.stat(path).st_mode), 0))
+
+            for file_name in sorted(file_names):
+                path = os.path.join(rel_dir_path, file_name)
+                stat_result = loader.stat(path)
+                with closing(loader.open(path)) as opened_file:
+                    digest = fileobj_digest(opened_file)
+                entries.append(ManifestEntry(
+                    path,
+                    False,
+                    file_name.endswith(template_suffix),
+                    stat.S_IMODE(stat_result.st_mode),
+                    stat_result.st_size,
+                    digest))
+
+        # directories first, in walk order
+        entries.sort(key=lambda entry: not entry.is_dir)
+        _LOG.debug("Built manifest of %r (%d entries)", root, len(entries))
+        return cls(root, template_suffix, entries, dir_mtimes)
+
+    def is_valid(self):
+        """Check none of the skeleton directories has been modified (or,
+        for a skeleton in a zip archive, that the archive hasn't been
+        modified).
+        """
+        try:
+            loader = get_loader(self.root)
+            if loader is None:
+                return False
+            for rel_dir_path, mtime in self.dir_mtimes.items():
+                if loader.stat(rel_dir_path).st_mtime != mtime:
+                    return False
+        except (OSError, IOError,):
+            return False
+        return True
+
+    def to_dict(self):
+        """Return the manifest as a JSON serializable dict."""
+        return {
+            'root': self.root,
+            'template_suffix': self.template_suffix,
+            'entries': [entry.to_list() for entry in self.entries],
+            'dir_mtimes': self.dir_mtimes,
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a manifest from a dict returned by `to_dict`."""
+        return cls(
+            data['root'],
+            data['template_suffix'],
+            [ManifestEntry(*entry) for entry in data['entries']],
+            data['dir_mtimes'])
+
+    def save(self, path):
+        """Save the manifest as JSON at `path` (atomically)."""
+        save_json(self.to_dict(), path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a manifest saved with `save`.
+
+        Return None if the file is missing or invalid.
+        """
+        try:
+            with open(path) as manifest_file:
+                return cls.from_dict(json.load(manifest_file))
+        except (IOError, ValueError, KeyError, TypeError,), exc:
+            _LOG.debug("Cannot load manifest %r: %s", path, exc)
+            return None
+
+
+class OutputManifest(object):
+    """Size, modification time, digest and mode of the files written in a
+    destination directory, keyed by their path relative to it.
+
+    It lets incremental writes find out if a file changed without reading
+    it: a file with the recorded size and modification time is assumed to
+    have the recorded digest.
+    """
+
+    def __init__(self, files=None):
+        self.files = {} if files is None else files
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, path):
+        """Return the (size, mtime, digest, mode, dependencies) record of
+        `path`, or None.
+
+        `dependencies` is None or a dict holding the digest of the template
+        of the file ('source'), the variables the file depends on
+        ('variables') and the digest of their values ('values').
+        """
+        return self.files.get(path)
+
+    def record(self, path, size, mtime, digest, mode, dependencies=None):
+        """Record the state of the file at the relative `path`."""
+        with self._lock:
+            self.files[path] = [size, mtime, digest, mode, dependencies]
+
+    def to_dict(self):
+        """Return the manifest as a JSON serializable dict."""
+        with self._lock:
+            return {'files': dict(self.files)}
+
+    def save(self, path):
+        """Save the manifest as JSON at `path` (atomically)."""
+        save_json(self.to_dict(), path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a manifest saved with `save`.
+
+        Return an empty manifest if the file is missing or invalid.
+        """
+        try:
+            with open(path) as manifest_file:
+                files = json.load(manifest_file)['files']
+            if not isinstance(files, dict):
+                raise TypeError("files should be a dict")
+        except (IOError, ValueError, KeyError, TypeError,), exc:
+            _LOG.debug("Cannot load output manifest %r: %s", path, exc)
+            files = None
+        return cls(files)
+
+
+class DigestFile(object):
+    """Write-only file object only computing the digest and the size of
+    what is written to it.
+    """
+
+    def __init__(self, algorithm='sha1'):
+        self.size = 0
+        self._digest = hashlib.new(algorithm)
+
+    def write(self, data):
+        """Add `data` to the digest."""
+        self.size += len(data)
+        self._digest.update(data)
+
+    def hexdigest(self):
+        """Return the digest of the data written so far."""
+        return self._digest.hexdigest()
+
+
+def save_json(data, path):
+    """Save `data` as JSON at `path` (atomically)."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(data, tmp_file)
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+def file_digest(path, algorithm='sha1'):
+    """Return the hex digest of the content of the file at `path`."""
+    with open(path, 'rb') as opened_file:
+        return fileobj_digest(opened_file, algorithm)
+
+
+def fileobj_digest(fileobj, algorithm='sha1'):
+    """Return the hex digest of the content of the binary file object
+    `fileobj`.
+    """
+    digest = hashlib.new(algorithm)
+    while True:
+        chunk = fileobj.read(64 * 1024)
+        if not chunk:
+            break
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_manifest(root, template_suffix, cache_dir=None):
+    """Return the manifest of the skeleton at `root`.
+
+    The manifest is cached in memory, and in `cache_dir` if it is set. It is
+    rebuilt if any directory of the skeleton has been modified.
+    """
+    key = (root, template_suffix,)
+    manifest = _MANIFESTS.get(key)
+    if manifest is not None and manifest.is_valid():
+        return manifest
+
+    manifest = None
+    cache_path = None
+    if cache_dir is not None:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        cache_path = os.path.join(cache_dir, 'skeleton-%s.json' % digest)
+        manifest = Manifest.load(cache_path)
+        if manifest is not None and (
+            manifest.root != root or not manifest.is_valid()):
+            manifest = None
+
+    if manifest is None:
+        manifest = Manifest.build(root, template_suffix)
+        if cache_path is not None:
+            try:
+                manifest.save(cache_path)
+            except (IOError, OSError,), exc:
+                _LOG.debug("Cannot save manifest %r: %s", cache_path, exc)
+
+    with _LOCK:
+        _MANIFESTS[key] = manifest
+    return manifest
+
+
+def clear_manifests():
+    """Remove all the manifests cached in memory."""
+    with _LOCK:
+        _MANIFESTS.clear()
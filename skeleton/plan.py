@@ -0,0 +1,181 @@
+"""
+Write plans.
+
+`Skeleton.write(dst_dir, run_dry=True)` doesn't touch the file system; it
+returns a `Plan` listing the operations the write would do. A plan can be
+saved (`Plan.to_dict()` returns a JSON serializable dict) and executed
+later, possibly in another process, with `execute(plan)`.
+"""
+import sys
+
+from skeleton.utils import get_loggger
+
+
+_LOG = get_loggger(__name__)
+
+
+class Operation(object):
+    """Operation of a plan.
+
+    - `action` is 'mkdir', 'copy', 'render' or 'chmod';
+    - `src` is the path of the source file or directory, relative to the
+      skeleton root (None for the destination directory);
+    - `dst` is the path of the file or directory to create;
+    - `mode` is the mode of the file or directory (None for 'mkdir');
+    - `size` is the size in bytes of the source file (0 for directories).
+    """
+    __slots__ = ('action', 'src', 'dst', 'mode', 'size',)
+
+    def __init__(self, action, src, dst, mode=None, size=0):
+        self.action = action
+        self.src = src
+        self.dst = dst
+        self.mode = mode
+        self.size = size
+
+    def __repr__(self):
+        return '<%s %s %r>' % (
+            self.__class__.__name__, self.action, self.dst,)
+
+    def __eq__(self, other):
+        return (isinstance(other, Operation)
+            and self.to_list() == other.to_list())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def describe(self):
+        """Return a description of the operation, for the logs."""
+        if self.action == 'mkdir':
+            return "Create directory %r" % (self.dst,)
+        elif self.action == 'copy':
+            return "Copy %r to %r" % (self.src, self.dst,)
+        elif self.action == 'render':
+            return "Create %r from %r template" % (self.dst, self.src,)
+        return "Set mode of %r to '%o'" % (self.dst, self.mode,)
+
+    def to_list(self):
+        """Return the operation as a JSON serializable list."""
+        return [self.action, self.src, self.dst, self.mode, self.size]
+
+
+class PlanSection(object):
+    """Operations of one skeleton.
+
+    `variables` is a snapshot of the skeleton variables when the plan was
+    made. `skeleton` is the skeleton class, or its "module:ClassName" path.
+    """
+
+    def __init__(self, skeleton, dst_dir, variables, operations):
+        self.skeleton = skeleton
+        self.dst_dir = dst_dir
+        self.variables = variables
+        self.operations = operations
+
+    def __repr__(self):
+        return '<%s %s %d operations>' % (
+            self.__class__.__name__,
+            self.skeleton_path, len(self.operations),)
+
+    @property
+    def skeleton_path(self):
+        """Return the "module:ClassName" path of the skeleton class."""
+        if isinstance(self.skeleton, basestring):
+            return self.skeleton
+        return '%s:%s' % (self.skeleton.__module__, self.skeleton.__name__,)
+
+    def get_skeleton_class(self):
+        """Return the skeleton class, importing it if necessary."""
+        if not isinstance(self.skeleton, basestring):
+            return self.skeleton
+        return import_skeleton(self.skeleton)
+
+    def to_dict(self):
+        """Return the section as a JSON serializable dict."""
+        return {
+            'skeleton': self.skeleton_path,
+            'dst_dir': self.dst_dir,
+            'variables': self.variables,
+            'operations': [op.to_list() for op in self.operations],
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a section from a dict returned by `to_dict`."""
+        return cls(
+            data['skeleton'],
+            data['dst_dir'],
+            data['variables'],
+            [Operation(*op) for op in data['operations']])
+
+
+class Plan(object):
+    """Operations of a skeleton write and of the writes of its required
+    skeletons, in order.
+    """
+
+    def __init__(self, sections=None):
+        self.sections = [] if sections is None else sections
+
+    def __repr__(self):
+        return '<%s %d sections>' % (
+            self.__class__.__name__, len(self.sections),)
+
+    def __iter__(self):
+        for section in self.sections:
+            for operation in section.operations:
+                yield operation
+
+    def __len__(self):
+        return sum(len(section.operations) for section in self.sections)
+
+    @property
+    def size(self):
+        """Return the number of bytes to copy or render."""
+        return sum(operation.size for operation in self)
+
+    def merge(self, other):
+        """Return a new plan executing this plan and then `other`."""
+        return Plan(self.sections + other.sections)
+
+    def to_dict(self):
+        """Return the plan as a JSON serializable dict."""
+        return {'sections': [section.to_dict() for section in self.sections]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a plan from a dict returned by `to_dict`."""
+        return cls([
+            PlanSection.from_dict(section) for section in data['sections']])
+
+    def execute(self, **kw):
+        """Execute the plan (see `execute`)."""
+        execute(self, **kw)
+
+
+def import_skeleton(path):
+    """Return the skeleton class at the "module:ClassName" `path`."""
+    module_name, class_name = path.split(':')
+    __import__(module_name)
+    return getattr(sys.modules[module_name], class_name)
+
+
+def execute(plan, **kw):
+    """Execute the operations of `plan`.
+
+    Each section is executed by an instance of its skeleton class created
+    with the variables of the section. The keyword arguments are the
+    `write` options of the skeleton (`workers`, `processes`,
+    `cancel_event`, `link_static` and `incremental`).
+
+    Nothing is executed if the plan of one of the sections cannot be (see
+    `Skeleton.check_executable_plan`).
+    """
+    for section in plan.sections:
+        section.get_skeleton_class().check_executable_plan()
+    for section in plan.sections:
+        skel = section.get_skeleton_class()(section.variables)
+        _LOG.info(
+            "Executing the %d operations of %s skeleton...",
+            len(section.operations), section.skeleton_path)
+        skel.execute(section, **kw)
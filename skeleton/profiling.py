@@ -0,0 +1,202 @@
+"""
+Write profiles.
+
+`Skeleton.write(dst_dir, profile=True)` times each phase of the write and
+returns a `WriteProfile`: the number of operations, the bytes and the
+durations of each phase, per skeleton class. The phases are:
+
+- 'walk': getting the skeleton manifest (the source walk, unless the
+  manifest is cached);
+- 'format_name': formatting a file or directory name;
+- 'read': reading (and compiling) a template;
+- 'render': rendering a template (and writing it, for the templates
+  rendered by chunks or in worker processes);
+- 'write': writing a rendered template;
+- 'copy': copying (or linking) a static file;
+- 'mkdir': creating the directories;
+- 'chmod': setting the mode of the directories (and of the paths given
+  to `Skeleton._set_mode` by subclasses);
+- 'post_process': the work done by a skeleton after its files are
+  written (e.g. `insert_into_file` calls).
+
+Writes which don't profile only pay for an attribute check per hook.
+"""
+from __future__ import with_statement
+import math
+import threading
+
+
+#: Phases of a write, in the order of the summary.
+PHASES = (
+    'walk', 'format_name', 'read', 'render', 'write', 'copy', 'mkdir',
+    'chmod', 'post_process',)
+
+
+class PhaseStats(object):
+    """Count, bytes and durations (in seconds) of the operations of a
+    phase.
+    """
+    __slots__ = ('count', 'bytes', 'durations',)
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.durations = []
+
+    def __repr__(self):
+        return '<%s count=%d bytes=%d total=%.6f>' % (
+            self.__class__.__name__, self.count, self.bytes, self.total,)
+
+    def add(self, duration, size=0):
+        """Record an operation."""
+        self.count += 1
+        self.bytes += size
+        self.durations.append(duration)
+
+    def update(self, other):
+        """Add the operations of the `other` stats."""
+        self.count += other.count
+        self.bytes += other.bytes
+        self.durations.extend(other.durations)
+
+    @property
+    def total(self):
+        """Cumulative duration."""
+        return sum(self.durations)
+
+    def percentile(self, percent):
+        """Return the duration `percent`% of the operations didn't exceed
+        (nearest rank); 0 if there is no operation.
+        """
+        if not self.durations:
+            return 0
+        durations = sorted(self.durations)
+        rank = int(math.ceil(percent / 100.0 * len(durations))) - 1
+        return durations[max(0, min(rank, len(durations) - 1))]
+
+    def to_dict(self):
+        """Return the stats as a JSON serializable dict."""
+        return {
+            'count': self.count,
+            'bytes': self.bytes,
+            'total': self.total,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': max(self.durations or [0]),
+            }
+
+
+class WriteProfile(object):
+    """Stats of the phases of a write, per skeleton class name.
+
+    `stats` maps (skeleton class name, phase) tuples to `PhaseStats`.
+    Operations can be recorded from several threads.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self._skeletons = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.skeletons,)
+
+    @property
+    def skeletons(self):
+        """Names of the skeleton classes profiled, in the order of their
+        first operation.
+        """
+        return list(self._skeletons)
+
+    def add(self, skeleton, phase, duration, size=0):
+        """Record an operation of the `phase` phase of the `skeleton`
+        class name, which took `duration` seconds and processed `size`
+        bytes.
+        """
+        if phase not in PHASES:
+            raise ValueError("Unknown phase: %r" % (phase,))
+        with self._lock:
+            self._get(skeleton, phase).add(duration, size)
+
+    def _get(self, skeleton, phase):
+        """Return the stats of a phase of a skeleton, creating them."""
+        key = (skeleton, phase,)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = PhaseStats()
+            if skeleton not in self._skeletons:
+                self._skeletons.append(skeleton)
+        return stats
+
+    def merge(self, other):
+        """Return a new profile with the operations of this profile and of
+        `other`.
+        """
+        merged = WriteProfile()
+        for profile in (self, other,):
+            for skeleton in profile._skeletons:
+                for phase in PHASES:
+                    stats = profile.stats.get((skeleton, phase,))
+                    if stats is not None:
+                        merged._get(skeleton, phase).update(stats)
+        return merged
+
+    def phases(self, skeleton=None):
+        """Return a dict mapping each phase to its `PhaseStats`, for a
+        skeleton class name or for all of them.
+        """
+        phases = {}
+        for (name, phase), stats in self.stats.items():
+            if skeleton is not None and name != skeleton:
+                continue
+            phases.setdefault(phase, PhaseStats()).update(stats)
+        return phases
+
+    @property
+    def total(self):
+        """Cumulative duration of all the operations (the duration of the
+        write if the operations didn't run concurrently).
+        """
+        return sum(stats.total for stats in self.stats.values())
+
+    def to_dict(self):
+        """Return the profile as a JSON serializable dict, mapping each
+        skeleton class name to the stats of its phases.
+        """
+        return dict(
+            (skeleton, dict(
+                (phase, stats.to_dict(),)
+                for (name, phase), stats in self.stats.items()
+                if name == skeleton),)
+            for skeleton in self._skeletons)
+
+    def summary(self):
+        """Return the profile as a text table, with a row per skeleton
+        class and phase (durations in milliseconds).
+        """
+        header = ('skeleton', 'phase', 'count', 'bytes', 'total', 'p50',
+            'p95', 'max',)
+        rows = []
+        for skeleton in self._skeletons:
+            for phase in PHASES:
+                stats = self.stats.get((skeleton, phase,))
+                if stats is None:
+                    continue
+                data = stats.to_dict()
+                rows.append((skeleton, phase, str(stats.count),
+                    str(stats.bytes)) + tuple(
+                        '%.2f' % (data[name] * 1000,)
+                        for name in ('total', 'p50', 'p95', 'max',)))
+        rows.append(
+            ('total', '', '', '', '%.2f' % (self.total * 1000,), '', '', '',))
+
+        widths = [
+            max(len(row[index]) for row in [header] + rows)
+            for index in range(len(header))]
+        lines = []
+        for row in [header] + rows:
+            cells = [
+                cell.ljust(width) if index < 2 else cell.rjust(width)
+                for index, (cell, width) in enumerate(zip(row, widths))]
+            lines.append('  '.join(cells).rstrip())
+        return '\n'.join(lines)
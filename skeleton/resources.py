@@ -0,0 +1,323 @@
+"""
+Skeleton sources.
+
+A skeleton directory is read through a loader: `FileSystemLoader` for a
+directory on the file system, `ZipLoader` for a directory inside a zip
+archive (a zipped package, a wheel or a zipapp). Zip archives are not
+extracted; the members of an archive are indexed in memory once
+(`ZipIndex`) and read from the archive.
+
+`stat_resource(path)` and `open_resource(path)` accept the path of a file
+on the file system or of a member of a zip archive
+("/path/to/app.zip/package/skeleton/file.txt").
+"""
+from __future__ import with_statement
+import errno
+import io
+import os
+import stat
+import threading
+import zipfile
+
+from skeleton.utils import get_loggger, default_mode
+
+
+_LOG = get_loggger(__name__)
+
+_ZIP_INDEXES = {}
+_LOCK = threading.Lock()
+
+
+class ResourceStat(object):
+    """Status of a zip archive member, with the `os.stat` result
+    attributes used by skeletons.
+    """
+    __slots__ = ('st_mode', 'st_size', 'st_mtime',)
+
+    def __init__(self, st_mode, st_size, st_mtime):
+        self.st_mode = st_mode
+        self.st_size = st_size
+        self.st_mtime = st_mtime
+
+
+class FileSystemLoader(object):
+    """Skeleton directory on the file system.
+
+    Paths given to the loader methods are relative to `root`.
+    """
+    is_file_system = True
+
+    def __init__(self, root):
+        self.root = root
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.root,)
+
+    def walk(self):
+        """Walk the skeleton directory top-down.
+
+        Yield a (rel_dir_path, dir_names, file_names) tuple for each
+        directory; sorting `dir_names` in place sorts the walk.
+        """
+        root_len = len(self.root)
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            yield dir_path[root_len:].lstrip(r'\/'), dir_names, file_names
+
+    def stat(self, path):
+        """Return the `os.stat` result of `path`."""
+        return os.stat(os.path.join(self.root, path))
+
+    def open(self, path):
+        """Open the file at `path` for reading (in binary mode)."""
+        return open(os.path.join(self.root, path), 'rb')
+
+
+class ZipLoader(object):
+    """Skeleton directory inside a zip archive.
+
+    `prefix` is the path of the skeleton directory in the archive. Paths
+    given to the loader methods are relative to the skeleton directory.
+    """
+    is_file_system = False
+
+    def __init__(self, index, prefix=''):
+        self.index = index
+        self.prefix = prefix
+        self.root = os.path.join(index.archive, prefix).rstrip(os.sep)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.root,)
+
+    def walk(self):
+        """Walk the skeleton directory top-down (see
+        `FileSystemLoader.walk`).
+
+        Only the index is read.
+        """
+        pending = ['']
+        while pending:
+            rel_dir_path = pending.pop(0)
+            dir_names, file_names = self.index.directories[
+                self._member(rel_dir_path)]
+            dir_names = sorted(dir_names)
+            yield rel_dir_path, dir_names, sorted(file_names)
+            pending[:0] = [
+                os.path.join(rel_dir_path, name) for name in dir_names]
+
+    def stat(self, path):
+        """Return the status of the member at `path`.
+
+        Its modification time is the one of the archive.
+        """
+        return self.index.stat(self._member(path))
+
+    def open(self, path):
+        """Open the member at `path` for reading (in binary mode)."""
+        return self.index.open(self._member(path))
+
+    def _member(self, path):
+        return os.path.join(self.prefix, path).rstrip(os.sep)
+
+
+class ZipIndex(object):
+    """In-memory index of the members of the zip archive at `archive`.
+
+    The archive central directory is read once; finding, listing and
+    reading a member don't scan the archive again.
+
+    Member paths use the OS path separator. Directories without their own
+    entry in the archive are indexed too. Members without a mode get the
+    default mode for the current umask.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        stat_result = os.stat(archive)
+        self.mtime = stat_result.st_mtime
+        self.size = stat_result.st_size
+        self.files = {}
+        self.directories = {'': (set(), set(),)}
+        self._modes = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._zip = zipfile.ZipFile(archive)
+        for info in self._zip.infolist():
+            self._add(info)
+        _LOG.debug(
+            "Indexed %r (%d files)", archive, len(self.files))
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.archive,)
+
+    def is_valid(self):
+        """Check the archive hasn't been modified since it was indexed."""
+        try:
+            stat_result = os.stat(self.archive)
+        except (OSError,):
+            return False
+        return (stat_result.st_mtime, stat_result.st_size,) == (
+            self.mtime, self.size,)
+
+    def stat(self, path):
+        """Return the `ResourceStat` of the member at `path`."""
+        if path in self.files:
+            return ResourceStat(
+                stat.S_IFREG | self._modes[path],
+                self.files[path].file_size, self.mtime)
+        if path in self.directories:
+            return ResourceStat(
+                stat.S_IFDIR | self._modes.get(
+                    path, default_mode(is_dir=True)),
+                0, self.mtime)
+        raise OSError(
+            errno.ENOENT, os.strerror(errno.ENOENT),
+            os.path.join(self.archive, path))
+
+    def open(self, path):
+        """Return a binary file object holding the content of the member
+        at `path`.
+        """
+        info = self.files.get(path)
+        if info is None:
+            raise IOError(
+                errno.ENOENT, os.strerror(errno.ENOENT),
+                os.path.join(self.archive, path))
+        with self._lock:
+            if self._pid != os.getpid():
+                # the archive file offset is shared with the parent process
+                self._zip = zipfile.ZipFile(self.archive)
+                self._pid = os.getpid()
+            return io.BytesIO(self._zip.read(info))
+
+    def close(self):
+        """Close the archive."""
+        self._zip.close()
+
+    def _add(self, info):
+        """Index the archive member `info`."""
+        is_dir = info.filename.endswith('/')
+        path = info.filename.strip('/').replace('/', os.sep)
+        if not path:
+            return
+        mode = stat.S_IMODE(info.external_attr >> 16)
+        if is_dir:
+            self._add_directory(path)
+            if mode:
+                self._modes[path] = mode
+            return
+
+        parent, name = os.path.split(path)
+        self._add_directory(parent)
+        self.directories[parent][1].add(name)
+        self.files[path] = info
+        self._modes[path] = mode or default_mode()
+
+    def _add_directory(self, path):
+        """Index the directory `path` and its missing parents."""
+        name = None
+        while True:
+            known = path in self.directories
+            if not known:
+                self.directories[path] = (set(), set(),)
+            if name is not None:
+                self.directories[path][0].add(name)
+            if known:
+                return
+            path, name = os.path.split(path)
+
+
+def get_zip_index(archive):
+    """Return the index of the zip archive at `archive`.
+
+    Indexes are kept in memory; an index is rebuilt if its archive has been
+    modified.
+    """
+    index = _ZIP_INDEXES.get(archive)
+    if index is not None and index.is_valid():
+        return index
+    index = ZipIndex(archive)
+    with _LOCK:
+        _ZIP_INDEXES[archive] = index
+    return index
+
+
+def clear_zip_indexes():
+    """Remove all the zip archive indexes kept in memory."""
+    with _LOCK:
+        for index in _ZIP_INDEXES.values():
+            index.close()
+        _ZIP_INDEXES.clear()
+
+
+def split_archive_path(path):
+    """Split `path` into the path of the zip archive containing it and the
+    path of the member in the archive.
+
+    Return (None, None) if `path` is not inside a zip archive.
+    """
+    for archive in list(_ZIP_INDEXES):
+        if path.startswith(archive + os.sep):
+            return archive, path[len(archive):].strip(os.sep)
+
+    archive = path
+    while not os.path.isfile(archive):
+        parent = os.path.dirname(archive)
+        if parent == archive:
+            return None, None
+        archive = parent
+    if archive == path or not zipfile.is_zipfile(archive):
+        return None, None
+    return archive, path[len(archive):].strip(os.sep)
+
+
+def get_loader(path):
+    """Return the loader of the skeleton directory at `path`.
+
+    Return None if there is no directory at `path`.
+    """
+    if os.path.isdir(path):
+        return FileSystemLoader(path)
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return None
+    index = get_zip_index(archive)
+    if member not in index.directories:
+        return None
+    return ZipLoader(index, member)
+
+
+def _zip_member(path, exc):
+    """Return the index of the zip archive containing `path` and the path
+    of the member; raise `exc` if `path` is not in a zip archive.
+    """
+    if exc.errno not in (errno.ENOENT, errno.ENOTDIR,):
+        raise exc
+    archive, member = split_archive_path(path)
+    if archive is None:
+        raise exc
+    index = _ZIP_INDEXES.get(archive)
+    if index is None:
+        index = get_zip_index(archive)
+    return index, member
+
+
+def stat_resource(path):
+    """Return the status of the file at `path`, which can be a member of
+    a zip archive.
+    """
+    try:
+        return os.stat(path)
+    except (OSError,), exc:
+        index, member = _zip_member(path, exc)
+        return index.stat(member)
+
+
+def open_resource(path):
+    """Open the file at `path`, which can be a member of a zip archive,
+    for reading (in binary mode).
+    """
+    try:
+        return open(path, 'rb')
+    except (IOError,), exc:
+        index, member = _zip_member(path, exc)
+        return index.open(member)
@@ -0,0 +1,249 @@
+"""
+Render daemon.
+
+`serve(path)` runs a server on the Unix socket at `path`. The server keeps
+the skeleton classes, their manifests and the compiled templates in memory
+between requests; `render(skeleton, dst_dir, variables)` asks it to write a
+skeleton, without paying for the imports and the skeleton walk.
+
+The protocol is one JSON object per line. A request looks like::
+
+    {"skeleton": "skeleton.examples.mkmodule:BasicModule",
+     "dst_dir": "/path/to/project",
+     "variables": {"module_name": "foo"},
+     "options": {"workers": 4, "incremental": true}}
+
+The options are the `Skeleton.write` options ("run_dry", "workers",
+"processes", "link_static" and "incremental"). The response is
+`{"status": "ok", "duration": seconds}` (with the "plan" of the write for
+dry runs), or `{"status": "error", "error": exception class name,
+"message": message}`. A connection can send several requests.
+"""
+from __future__ import with_statement
+import errno
+import json
+import os
+import socket
+import SocketServer
+import stat
+import tempfile
+import time
+
+from skeleton.core import SkeletonError
+from skeleton.manifest import get_manifest
+from skeleton.plan import import_skeleton
+from skeleton.utils import get_loggger
+
+
+_LOG = get_loggger(__name__)
+
+#: `Skeleton.write` options a request can set.
+WRITE_OPTIONS = (
+    'run_dry', 'workers', 'processes', 'link_static', 'incremental',)
+
+
+class RenderError(SkeletonError):
+    """Raised by `RenderClient.render` when the server failed to write
+    the skeleton.
+
+    `error` is the name of the class of the exception raised in the server.
+    """
+
+    def __init__(self, error, message):
+        super(RenderError, self).__init__("%s: %s" % (error, message,))
+        self.error = error
+        self.message = message
+
+
+def default_socket_path():
+    """Return the path of the server socket: $SKELETON_SOCKET, or a
+    per user socket in the temporary directory.
+    """
+    path = os.environ.get('SKELETON_SOCKET')
+    if path:
+        return path
+    return os.path.join(
+        tempfile.gettempdir(), 'skeleton-%d.sock' % os.getuid())
+
+
+def handle_request(request):
+    """Write the skeleton of the decoded `request` and return the response
+    dict.
+    """
+    start = time.time()
+    try:
+        options = request.get('options') or {}
+        unknown = set(options) - set(WRITE_OPTIONS)
+        if unknown:
+            raise ValueError(
+                "Unknown options: %s" % ', '.join(sorted(unknown)))
+        skel_class = import_skeleton(request['skeleton'])
+        skel = skel_class(**dict(
+            (str(name), value,)
+            for name, value in (request.get('variables') or {}).items()))
+        result = skel.write(
+            request['dst_dir'],
+            **dict((str(name), value,) for name, value in options.items()))
+    except (Exception,), exc:
+        _LOG.debug("Request failed", exc_info=True)
+        return {
+            'status': 'error',
+            'error': exc.__class__.__name__,
+            'message': str(exc),
+            }
+
+    response = {'status': 'ok', 'duration': time.time() - start}
+    if options.get('run_dry') and result is not None:
+        response['plan'] = result.to_dict()
+    return response
+
+
+class RenderHandler(SocketServer.StreamRequestHandler):
+    """Read JSON requests, one per line, and write the responses."""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if not isinstance(request, dict):
+                    raise ValueError("not a JSON object")
+            except (ValueError,), exc:
+                response = {
+                    'status': 'error',
+                    'error': exc.__class__.__name__,
+                    'message': "Invalid request: %s" % exc,
+                    }
+            else:
+                response = handle_request(request)
+                _LOG.info(
+                    "%s %r: %s",
+                    request.get('skeleton'), request.get('dst_dir'),
+                    response['status'])
+            self.wfile.write(
+                (json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class RenderServer(
+    SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Server writing skeletons, each connection in its own thread."""
+    daemon_threads = True
+
+    def __init__(self, path, preload=()):
+        _remove_socket(path)
+        SocketServer.UnixStreamServer.__init__(self, path, RenderHandler)
+        for skeleton_path in preload:
+            self.preload(skeleton_path)
+
+    def server_bind(self):
+        """Bind the socket and make it private to the user before it
+        listens: any client can make the server import skeleton classes
+        and write files.
+        """
+        SocketServer.UnixStreamServer.server_bind(self)
+        os.chmod(self.server_address, 0o600)
+
+    def preload(self, skeleton_path):
+        """Import the skeleton class at `skeleton_path` and build the
+        manifest of its skeleton.
+        """
+        skel_class = import_skeleton(skeleton_path)
+        skel = skel_class()
+        get_manifest(
+            skel.real_src, skel.template_suffix, skel.manifest_cache_dir)
+        _LOG.info("Preloaded %s", skeleton_path)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        _remove_socket(self.server_address)
+
+
+def _remove_socket(path):
+    """Remove the socket left at `path` by a previous server."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except (OSError,), exc:
+        if exc.errno != errno.ENOENT:
+            raise
+
+
+def serve(path=None, preload=()):
+    """Serve render requests on the Unix socket at `path` (see
+    `default_socket_path`) until interrupted.
+
+    `preload` lists the "module:ClassName" paths of skeleton classes to load
+    before the first request.
+    """
+    if path is None:
+        path = default_socket_path()
+    server = RenderServer(path, preload)
+    _LOG.info("Serving on %r", path)
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt,):
+        pass
+    finally:
+        server.server_close()
+
+
+class RenderClient(object):
+    """Connection to a render server.
+
+    It can be used in a with statement to close the connection.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = default_socket_path()
+        self.path = path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._file = self._socket.makefile('rwb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        self.close()
+
+    def render(self, skeleton, dst_dir, variables=None, **options):
+        """Ask the server to write the skeleton at the "module:ClassName"
+        `skeleton` path to `dst_dir`.
+
+        The keyword arguments are `Skeleton.write` options (see
+        `WRITE_OPTIONS`). Return the response dict; raise a `RenderError` if
+        the write failed.
+        """
+        request = {
+            'skeleton': skeleton,
+            'dst_dir': os.path.abspath(dst_dir),
+            'variables': variables or {},
+            'options': options,
+            }
+        self._file.write((json.dumps(request) + '\n').encode('utf-8'))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise IOError(
+                errno.ECONNRESET, "The render server closed the connection")
+        response = json.loads(line.decode('utf-8'))
+        if response['status'] != 'ok':
+            raise RenderError(response['error'], response['message'])
+        return response
+
+    def close(self):
+        """Close the connection."""
+        self._file.close()
+        self._socket.close()
+
+
+def render(skeleton, dst_dir, variables=None, path=None, **options):
+    """Ask the server at `path` to write a skeleton (see
+    `RenderClient.render`).
+    """
+    with RenderClient(path) as client:
+        return client.render(skeleton, dst_dir, variables, **options)
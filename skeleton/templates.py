@@ -0,0 +1,513 @@
+"""
+Compiled templates and the process-wide template cache.
+
+A template is parsed once with `string.Formatter.parse` into literal and
+field segments; rendering a compiled template only resolves its fields.
+"""
+from __future__ import with_statement
+from contextlib import closing
+import codecs
+import mmap
+import os
+import string
+import threading
+
+from skeleton.resources import stat_resource, open_resource
+from skeleton.utils import get_loggger
+
+
+_LOG = get_loggger(__name__)
+
+
+class MappingFormatter(string.Formatter):
+    """Formatter looking up named fields directly in a mapping.
+
+    Unlike `str.format(**mapping)`, the mapping is not expanded into a new
+    dict; each field is looked up with `mapping[key]` when it is rendered.
+    """
+
+    def get_value(self, key, args, kwargs):
+        if isinstance(key, (int, long)):
+            return args[key]
+        try:
+            return kwargs[key]
+        except KeyError:
+            # The mapping might raise a KeyError with a message;
+            # the callers expect the variable name.
+            raise KeyError(key)
+
+
+_FORMATTER = MappingFormatter()
+
+
+class VariableRecorder(object):
+    """Mapping wrapper recording the names of the variables looked up.
+
+    Rendering a template with a recorder tells which variables the template
+    depends on (`names`).
+    """
+
+    def __init__(self, variables):
+        self.variables = variables
+        self.names = set()
+
+    def __getitem__(self, key):
+        value = self.variables[key]
+        self.names.add(key)
+        return value
+
+
+class VariableSnapshot(dict):
+    """Read-only copy of a variable mapping.
+
+    Every variable is looked up once when the snapshot is taken; rendering
+    with a snapshot is a plain dict lookup per field. `version` identifies
+    the state of the variables the snapshot was taken from. The copy is
+    shallow: mutable values are shared.
+    """
+
+    def __init__(self, variables, version=None):
+        super(VariableSnapshot, self).__init__(
+            (key, variables[key],) for key in variables)
+        self.version = version
+
+    def __repr__(self):
+        return '<%s version=%r %s>' % (
+            self.__class__.__name__, self.version,
+            super(VariableSnapshot, self).__repr__(),)
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self), self.version,))
+
+    def _read_only(self, *args, **kw):
+        raise TypeError("%s is read-only" % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+class CompiledTemplate(object):
+    """Parsed template.
+
+    `segments` is the list of (literal_text, field_name, format_spec,
+    conversion) tuples returned by `string.Formatter.parse`.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.segments = list(_FORMATTER.parse(source))
+        self._encoded_literals = {}
+
+    def __repr__(self):
+        return '<%s %d segments>' % (
+            self.__class__.__name__, len(self.segments),)
+
+    def render(self, variables):
+        """Return the template formatted with the `variables` mapping.
+
+        Like `str.format`, fields are converted to the type of the template
+        (a unicode value in a byte string template is encoded to ASCII, a
+        byte string value in a unicode template is decoded from ASCII).
+
+        Raises a KeyError if a variable is missing.
+        """
+        text_type = type(self.source)
+        result = []
+        append = result.append
+        for literal, field_name, format_spec, conversion in self.segments:
+            if literal:
+                append(literal)
+            if field_name is not None:
+                value = format_field(
+                    variables, field_name, format_spec, conversion)
+                if not isinstance(value, text_type):
+                    value = text_type(value)
+                append(value)
+        return self.source[:0].join(result)
+
+    def render_bytes(self, variables, encoding):
+        """Like `render` but return the encoded content.
+
+        The literal segments are only encoded once (per encoding). `encoding`
+        must be a stateless encoding like UTF-8.
+        """
+        literals = self._encoded_literals.get(encoding)
+        if literals is None:
+            literals = [
+                segment[0].encode(encoding) for segment in self.segments]
+            self._encoded_literals[encoding] = literals
+
+        result = []
+        append = result.append
+        for literal, segment in zip(literals, self.segments):
+            if literal:
+                append(literal)
+            if segment[1] is not None:
+                append(format_field(variables, *segment[1:]).encode(encoding))
+        return b''.join(result)
+
+
+def format_field(variables, field_name, format_spec, conversion):
+    """Return the formatted value of a template field."""
+    formatter = _FORMATTER
+    obj = formatter.get_field(field_name, (), variables)[0]
+    if conversion:
+        obj = formatter.convert_field(obj, conversion)
+    if format_spec and '{' in format_spec:
+        format_spec = formatter.vformat(format_spec, (), variables)
+    return formatter.format_field(obj, format_spec)
+
+
+def is_utf8(encoding):
+    """Tell if `encoding` is a name of the UTF-8 codec."""
+    return codecs.lookup(encoding).name == 'utf-8'
+
+
+class _LRUCache(object):
+    """Mapping keeping its `max_size` most recently used entries.
+
+    The entries are the links of a circular doubly linked list, most
+    recently used last; lookups, stores and evictions are O(1). It's not
+    thread-safe.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._links = {}
+        # links are [previous, next, key, value] lists
+        self._root = []
+        self.clear()
+
+    def __len__(self):
+        return len(self._links)
+
+    def clear(self):
+        """Remove all entries."""
+        self._links.clear()
+        root = self._root
+        root[:] = [root, root, None, None]
+
+    def get(self, key):
+        """Return the value of `key` (None if it is missing) and mark it as
+        the most recently used.
+        """
+        link = self._links.get(key)
+        if link is None:
+            return None
+        self._unlink(link)
+        self._append(link)
+        return link[3]
+
+    def put(self, key, value):
+        """Store the `key` entry; return the list of the keys evicted."""
+        link = self._links.get(key)
+        if link is not None:
+            self._unlink(link)
+            link[3] = value
+        else:
+            link = [None, None, key, value]
+            self._links[key] = link
+        self._append(link)
+
+        evicted = []
+        root = self._root
+        while len(self._links) > self.max_size:
+            oldest = root[1]
+            self._unlink(oldest)
+            del self._links[oldest[2]]
+            evicted.append(oldest[2])
+        return evicted
+
+    def _append(self, link):
+        root = self._root
+        last = root[0]
+        link[0] = last
+        link[1] = root
+        last[1] = root[0] = link
+
+    def _unlink(self, link):
+        previous, next_ = link[0], link[1]
+        previous[1] = next_
+        next_[0] = previous
+
+
+class TemplateCache(object):
+    """Thread-safe LRU cache of compiled templates.
+
+    Template files are keyed by their path, encoding, modification time and
+    size, so that an edited template is compiled again. Template strings
+    (file and directory names) are keyed by their value. Files and strings
+    are kept in separate caches of `max_size` entries each, so that the
+    names of a skeleton don't evict its templates.
+
+    `hits`, `misses` and `evictions` count the cache lookups.
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files = _LRUCache(max_size)
+        self._strings = _LRUCache(max_size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._files) + len(self._strings)
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._files.clear()
+            self._strings.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        return {
+            'size': len(self),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            }
+
+    def get_string(self, template):
+        """Return the compiled version of the `template` string.
+        """
+        compiled = self._lookup(self._strings, template)
+        if compiled is None:
+            compiled = CompiledTemplate(template)
+            self._store(self._strings, template, compiled)
+        return compiled
+
+    def get_file(self, path, encoding):
+        """Return the compiled content of the template file at `path`.
+
+        The file is only read and parsed if it has not been cached yet or
+        if it changed since it was cached. It can be a member of a zip
+        archive (see `skeleton.resources`).
+        """
+        stat_result = stat_resource(path)
+        key = (path, encoding, stat_result.st_mtime, stat_result.st_size,)
+        compiled = self._lookup(self._files, key)
+        if compiled is None:
+            with closing(open_resource(path)) as fd_src:
+                compiled = CompiledTemplate(fd_src.read().decode(encoding))
+            self._store(self._files, key, compiled)
+        return compiled
+
+    def _lookup(self, cache, key):
+        with self._lock:
+            compiled = cache.get(key)
+            if compiled is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return compiled
+
+    def _store(self, cache, key, compiled):
+        with self._lock:
+            evicted = cache.put(key, compiled)
+            self.evictions += len(evicted)
+        for key in evicted:
+            _LOG.debug("Evicted %r from the template cache", key)
+
+
+#: Cache shared by all skeletons of the process.
+TEMPLATE_CACHE = TemplateCache()
+
+
+def complete_length(text):
+    """Return the length of the longest prefix of `text` ending on a
+    template segment boundary (it doesn't end inside a field or between
+    two braces of an escaped brace).
+    """
+    length = len(text)
+    pos = 0
+    while True:
+        next_open = text.find('{', pos)
+        next_close = text.find('}', pos)
+        if next_open < 0 and next_close < 0:
+            return length
+        if next_open < 0 or (0 <= next_close < next_open):
+            # "}}" or a single "}" (which will fail to format)
+            if next_close + 1 == length:
+                return next_close
+            pos = next_close + (2 if text[next_close + 1] == '}' else 1)
+            continue
+
+        if next_open + 1 == length:
+            return next_open
+        if text[next_open + 1] == '{':
+            pos = next_open + 2
+            continue
+
+        # field, with nested fields in its format spec
+        field_start = next_open
+        depth = 1
+        pos = next_open + 1
+        while depth:
+            next_open = text.find('{', pos)
+            next_close = text.find('}', pos)
+            if next_close < 0:
+                return field_start
+            if 0 <= next_open < next_close:
+                depth += 1
+                pos = next_open + 1
+            else:
+                depth -= 1
+                pos = next_close + 1
+
+
+def render_stream(src, dst, variables, chunk_size=64 * 1024,
+    max_field_size=64 * 1024):
+    """Format the template file object `src` into the file object `dst`.
+
+    The template is read by chunks of `chunk_size` characters; memory use
+    doesn't depend on the template size.
+
+    Raises a KeyError if a variable is missing, and a ValueError if a field
+    is longer than `max_field_size` (most likely an unescaped "{").
+    """
+    pending = None
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            if pending:
+                dst.write(CompiledTemplate(pending).render(variables))
+            return
+
+        pending = chunk if pending is None else pending + chunk
+        cut = complete_length(pending)
+        if cut:
+            dst.write(CompiledTemplate(pending[:cut]).render(variables))
+            pending = pending[cut:]
+        elif len(pending) > max_field_size:
+            raise ValueError(
+                "Template field longer than %d characters" % max_field_size)
+
+
+def render_mmap(path, dst, variables, span_size=1024 * 1024):
+    """Format the UTF-8 template file at `path` into the binary file
+    object `dst`.
+
+    The template is memory mapped; the literal text is copied to `dst`
+    without being decoded and encoded, only the fields are decoded,
+    formatted and encoded (UTF-8 never uses "{" and "}" bytes in multi-bytes
+    characters). Literal text is copied by spans of at most `span_size`
+    bytes.
+
+    Raises a KeyError if a variable is missing and a ValueError if a brace
+    is not escaped.
+    """
+    with open(path, 'rb') as src:
+        size = os.fstat(src.fileno()).st_size
+        if not size:
+            return
+        mapped = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            _render_mapped(mapped, size, dst, variables, span_size)
+        finally:
+            mapped.close()
+
+
+def _render_mapped(mapped, size, dst, variables, span_size):
+    """Format the memory mapped template `mapped` into `dst`."""
+    fields = {}
+    pos = 0
+    next_open = mapped.find(b'{')
+    next_close = mapped.find(b'}')
+    while pos < size:
+        # -1 means there are no more braces
+        if 0 <= next_open < pos:
+            next_open = mapped.find(b'{', pos)
+        if 0 <= next_close < pos:
+            next_close = mapped.find(b'}', pos)
+
+        if next_open < 0 and next_close < 0:
+            _write_span(mapped, pos, size, dst, span_size)
+            return
+
+        if next_open < 0 or 0 <= next_close < next_open:
+            _write_span(mapped, pos, next_close, dst, span_size)
+            if mapped[next_close + 1:next_close + 2] != b'}':
+                raise ValueError("Single '}' encountered in format string")
+            dst.write(b'}')
+            pos = next_close + 2
+            continue
+
+        _write_span(mapped, pos, next_open, dst, span_size)
+        if mapped[next_open + 1:next_open + 2] == b'{':
+            dst.write(b'{')
+            pos = next_open + 2
+            continue
+
+        end = _field_end(mapped, next_open)
+        field = mapped[next_open:end]
+        compiled = fields.get(field)
+        if compiled is None:
+            compiled = CompiledTemplate(field.decode('utf-8'))
+            fields[field] = compiled
+        dst.write(compiled.render(variables).encode('utf-8'))
+        pos = end
+
+
+def _field_end(mapped, start):
+    """Return the position following the closing brace of the field
+    starting at `start`.
+    """
+    depth = 1
+    pos = start + 1
+    while depth:
+        next_open = mapped.find(b'{', pos)
+        next_close = mapped.find(b'}', pos)
+        if next_close < 0:
+            raise ValueError("Single '{' encountered in format string")
+        if 0 <= next_open < next_close:
+            depth += 1
+            pos = next_open + 1
+        else:
+            depth -= 1
+            pos = next_close + 1
+    return pos
+
+
+def _write_span(mapped, start, end, dst, span_size):
+    """Write mapped[start:end] to dst by spans of `span_size` bytes."""
+    while start < end:
+        stop = min(end, start + span_size)
+        dst.write(mapped[start:stop])
+        start = stop
+
+
+_WORKER_VARIABLES = {}
+
+
+def init_render_worker(variables):
+    """Initialize a worker process of a rendering pool.
+
+    Set the variables used by `render_chunk`.
+    """
+    global _WORKER_VARIABLES
+    _WORKER_VARIABLES = variables
+
+
+def render_chunk(job):
+    """Render a list of template files in a worker process.
+
+    `job` is a (encoding, paths) tuple. Return a list of (content, exception,
+    variable_names) tuples, one for each path; `variable_names` is the list
+    of the variables the template depends on.
+    """
+    encoding, paths = job
+    results = []
+    for path in paths:
+        recorder = VariableRecorder(_WORKER_VARIABLES)
+        try:
+            compiled = TEMPLATE_CACHE.get_file(path, encoding)
+            results.append(
+                (compiled.render(recorder), None, sorted(recorder.names),))
+        except (Exception,), exc:
+            results.append((None, exc, None,))
+    return results
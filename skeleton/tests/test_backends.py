@@ -0,0 +1,203 @@
+"""
+Tests for skeleton.backends
+"""
+from __future__ import with_statement
+from contextlib import closing
+import io
+import os
+import tarfile
+import unittest
+import zipfile
+
+from skeleton.backends import MemoryBackend, ArchiveBackend, FILE_SYSTEM
+from skeleton.tests.test_core import DynamicContent
+from skeleton.tests.utils import TestCase, TempDir
+from skeleton.utils import insert_into_file
+
+
+class TestMemoryBackend(TestCase):
+    """Tests for skeleton.backends.MemoryBackend"""
+
+    def test_files_and_directories(self):
+        """Tests MemoryBackend keeps the files content and mode"""
+        backend = MemoryBackend()
+        self.assertTrue(backend.mkdir('foo'))
+        self.assertFalse(backend.mkdir('foo/'))
+
+        with backend.open(os.path.join('foo', 'bar.txt'), 0o600) as bar:
+            bar.write('bar'.encode('ascii'))
+        backend.chmod('foo', 0o700)
+
+        self.assertEqual(
+            list(backend), ['foo', os.path.join('foo', 'bar.txt')])
+        self.assertEqual(backend.read('foo/bar.txt'), 'bar'.encode('ascii'))
+        self.assertEqual(backend.mode('foo/bar.txt'), 0o600)
+        self.assertEqual(backend.mode('foo'), 0o700)
+        self.assertRaises(IOError, backend.read, 'foo/baz.txt')
+
+        backend.remove('foo/bar.txt')
+        self.assertFalse('foo/bar.txt' in backend)
+
+    def test_write_skeleton(self):
+        """Tests Skeleton.write() with a memory backend"""
+        backend = MemoryBackend()
+        skel = DynamicContent(baz='foo')
+        with TempDir() as tmp_dir:
+            skel.write(tmp_dir.path, backend=backend)
+            self.assertEqual(os.listdir(tmp_dir.path), [])
+
+        self.assertEqual(
+            backend.read(tmp_dir.join('bar', 'baz.txt')).strip(),
+            'foo foo bar'.encode('ascii'))
+        self.assertEqual(
+            backend.mode(tmp_dir.join('foo.txt')),
+            skel.manifest.get('foo.txt').mode)
+        self.assertTrue(tmp_dir.join('bar') in backend)
+
+    def test_write_options_not_kept(self):
+        """Tests the backend of a write isn't used by the next writes"""
+        skel = DynamicContent(baz='foo')
+        with TempDir() as tmp_dir:
+            skel.write('mem', backend=MemoryBackend())
+            skel.write(tmp_dir.join('disk'))
+            self.assertTrue(tmp_dir.exists('disk', 'bar', 'baz.txt'))
+
+            skel.write_archive(io.BytesIO())
+            skel.write(tmp_dir.join('after-archive'), link_static='hardlink')
+            skel.write(tmp_dir.join('copy'))
+            self.assertEqual(
+                os.stat(tmp_dir.join('copy', 'foo.txt')).st_nlink, 1)
+        self.assertEqual(skel.backend, FILE_SYSTEM)
+        self.assertEqual(skel.link_static, 'copy')
+
+    def test_incremental_write(self):
+        """Tests incremental writes need a file system backend"""
+        self.assertRaises(
+            ValueError,
+            DynamicContent(baz='foo').write,
+            'foo', incremental=True, backend=MemoryBackend())
+
+    def test_insert_into_file(self):
+        """Tests insert_into_file() with a memory backend"""
+        backend = MemoryBackend()
+        backend.write('foo.txt', 'foo\n# -*- Bar -*-\nbaz\n'.encode('ascii'))
+        insert_into_file('foo.txt', 'Bar', 'bar', backend=backend)
+        self.assertEqual(
+            backend.read('foo.txt').decode('ascii').splitlines(),
+            ['foo', '# -*- Bar -*-', 'bar', 'baz'])
+
+
+class TestArchiveBackend(TestCase):
+    """Tests for skeleton.backends.ArchiveBackend and
+    Skeleton.write_archive()
+    """
+
+    def test_write_tar_archive(self):
+        """Tests Skeleton.write_archive() with a tar.gz archive"""
+        skel = DynamicContent(baz='foo')
+        archive = io.BytesIO()
+        skel.write_archive(archive, 'tar.gz', root='project')
+
+        archive.seek(0)
+        with closing(tarfile.open(fileobj=archive)) as tar:
+            names = tar.getnames()
+            self.assertEqual(
+                sorted(names),
+                ['project', 'project/bar', 'project/bar/baz.txt',
+                    'project/foo.txt'])
+            baz = tar.getmember('project/bar/baz.txt')
+            self.assertEqual(
+                baz.mode, skel.manifest.get('bar/baz.txt_tmpl').mode)
+            self.assertEqual(
+                tar.extractfile(baz).read().strip(),
+                'foo foo bar'.encode('ascii'))
+
+    def test_write_zip_archive(self):
+        """Tests Skeleton.write_archive() with a zip archive"""
+        skel = DynamicContent(baz='foo')
+        archive = io.BytesIO()
+        skel.write_archive(archive, 'zip')
+
+        archive.seek(0)
+        with closing(zipfile.ZipFile(archive)) as zip_file:
+            self.assertEqual(zip_file.testzip(), None)
+            self.assertEqual(
+                sorted(zip_file.namelist()),
+                ['bar/', 'bar/baz.txt', 'foo.txt'])
+            with open(os.path.join(skel.real_src, 'foo.txt'), 'rb') as foo:
+                self.assertEqual(zip_file.read('foo.txt'), foo.read())
+            self.assertEqual(
+                zip_file.getinfo('foo.txt').external_attr >> 16 & 0o777,
+                skel.manifest.get('foo.txt').mode)
+
+    def test_deterministic_archives(self):
+        """Tests Skeleton.write_archive() writes identical archives"""
+        for archive_format in ('tar.gz', 'zip',):
+            archives = []
+            for _ in range(2):
+                archive = io.BytesIO()
+                DynamicContent(baz='foo').write_archive(
+                    archive, archive_format, deterministic=True, workers=4)
+                archives.append(archive.getvalue())
+            self.assertEqual(archives[0], archives[1])
+
+    def test_static_files_not_buffered(self):
+        """Tests static files are streamed from the skeleton when the
+        archive is closed; only rendered files are kept in memory.
+        """
+        skel = DynamicContent(baz='foo')
+        archive = io.BytesIO()
+        backend = ArchiveBackend(archive, 'tar')
+        skel.write(os.curdir, backend=backend)
+
+        content, _mode, src = backend.files['foo.txt']
+        self.assertEqual(content, None)
+        self.assertEqual(src, os.path.join(skel.real_src, 'foo.txt'))
+        rendered = backend.read('bar/baz.txt')
+        self.assertEqual(
+            sum(len(content) for content, _mode, _src
+                in backend.files.values() if content is not None),
+            len(rendered))
+        backend.close()
+
+        archive.seek(0)
+        with closing(tarfile.open(fileobj=archive)) as tar:
+            with open(src, 'rb') as foo:
+                self.assertEqual(
+                    tar.extractfile('foo.txt').read(), foo.read())
+            self.assertEqual(tar.extractfile('bar/baz.txt').read(), rendered)
+
+    def test_read(self):
+        """Tests files can be read back and edited until the archive is
+        closed.
+        """
+        archive = io.BytesIO()
+        backend = ArchiveBackend(archive, 'tar')
+        backend.write('foo.txt', 'foo\n# -*- Bar -*-\n'.encode('ascii'))
+        insert_into_file('foo.txt', 'Bar', 'bar', backend=backend)
+        self.assertEqual(
+            backend.read('foo.txt').decode('ascii').splitlines(),
+            ['foo', '# -*- Bar -*-', 'bar'])
+        self.assertRaises(IOError, backend.read, 'bar.txt')
+        backend.chmod('foo.txt', 0o600)
+        backend.write('bar.txt', b'bar')
+        backend.remove('bar.txt')
+        backend.close()
+
+        archive.seek(0)
+        with closing(tarfile.open(fileobj=archive)) as tar:
+            self.assertEqual(tar.getnames(), ['foo.txt'])
+            self.assertEqual(tar.getmember('foo.txt').mode, 0o600)
+
+
+def suite():
+    """Get all backend related tests"""
+    tests = unittest.TestSuite()
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestMemoryBackend))
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestArchiveBackend))
+    return tests
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,12 +2,19 @@
 Tests for skeleton core components
 
 """
+from __future__ import with_statement
 import datetime
+import os
+import stat
+import threading
+import time
 import unittest
 
-from skeleton.tests.utils import TestCase, TempDir
+from skeleton.tests.utils import TestCase, TempDir, Mock
+from skeleton.templates import TemplateCache
+from skeleton.manifest import get_manifest, OutputManifest
 from skeleton.core import Skeleton, Var, TemplateKeyError, FileNameKeyError, \
-    Bool
+    Bool, WriteCancelled, RequirementCycleError, RequirementGraph
 
 
 THIS_YEAR = datetime.datetime.utcnow().year
@@ -296,6 +303,787 @@ class TestSkeleton(TestCase):
             with open(tmp_dir.join('foo.txt')) as foo_file:
                 self.assertEqual(foo_file.read().strip(), 'foo')
 
+    def test_write_with_workers(self):
+        """Tests Skeleton.write() with a thread pool"""
+        skel = StaticWithRequirement(file_name="fooz")
+        with TempDir() as tmp_dir:
+            skel.write(tmp_dir.path, workers=4)
+
+            self.assertTrue(tmp_dir.exists('foo.txt'))
+            self.assertTrue(tmp_dir.exists('bar/baz.txt'))
+            self.assertTrue(tmp_dir.exists('bar/empty'))
+            self.assertTrue(tmp_dir.exists('fooz.txt'))
+
+    def test_write_with_workers_fails(self):
+        """Tests Skeleton.write() with a thread pool raises the error of
+        the first file to fail.
+        """
+        with TempDir() as src_dir:
+            os.mkdir(src_dir.join('c'))
+            for name in ('a_tmpl', 'b_tmpl', 'c/d_tmpl'):
+                with open(src_dir.join(name), 'w') as template:
+                    template.write('{%s}' % name[-6])
+
+            class Failing(Skeleton):
+                """Skeleton with templates using undeclared variables"""
+                src = src_dir.path
+
+            for _ in range(5):
+                with TempDir() as tmp_dir:
+                    try:
+                        Failing().write(tmp_dir.path, workers=3)
+                        self.fail("An exception should be raised")
+                    except (TemplateKeyError,), exc:
+                        self.assertEqual(exc.variable_name, 'a')
+
+    def test_write_dry_with_workers(self):
+        """Tests Skeleton.write() dry run with a thread pool"""
+        skel = DynamicContent(baz="<replaced>")
+        with TempDir() as tmp_dir:
+            skel.write(tmp_dir.path, run_dry=True, workers=4)
+            self.assertFalse(tmp_dir.exists('foo.txt'))
+            self.assertFalse(tmp_dir.exists('bar'))
+
+    def test_write_with_processes(self):
+        """Tests Skeleton.write() rendering templates in a process pool"""
+        with TempDir() as src_dir:
+            for name in ('a.txt_tmpl', 'b.txt_tmpl', 'c.txt'):
+                with open(src_dir.join(name), 'w') as template:
+                    template.write('{baz} %s' % name)
+
+            class Templates(Skeleton):
+                """Skeleton rendered in worker processes"""
+                src = src_dir.path
+                variables = [Var('baz')]
+                process_min_size = 0
+                process_chunk_size = 1
+
+            with TempDir() as tmp_dir:
+                Templates(baz='foo').write(tmp_dir.path, processes=2)
+                self.assertEqual(
+                    open(tmp_dir.join('a.txt')).read(), 'foo a.txt_tmpl')
+                self.assertEqual(
+                    open(tmp_dir.join('b.txt')).read(), 'foo b.txt_tmpl')
+                self.assertEqual(
+                    open(tmp_dir.join('c.txt')).read(), '{baz} c.txt')
+
+    def test_write_with_processes_fails(self):
+        """Tests Skeleton.write() with a process pool raises
+        TemplateKeyError.
+        """
+        with TempDir() as src_dir:
+            for name in ('a_tmpl', 'b_tmpl'):
+                with open(src_dir.join(name), 'w') as template:
+                    template.write('{%s}' % name[0])
+
+            class Failing(Skeleton):
+                """Skeleton with templates using undeclared variables"""
+                src = src_dir.path
+                process_min_size = 0
+
+            with TempDir() as tmp_dir:
+                try:
+                    Failing().write(tmp_dir.path, processes=2)
+                    self.fail("An exception should be raised")
+                except (TemplateKeyError,), exc:
+                    self.assertEqual(exc.variable_name, 'a')
+                    self.assertTrue(exc.file_path.endswith('a_tmpl'))
+
+    def test_write_variable_snapshot(self):
+        """Tests Skeleton.write() resolves each variable once"""
+
+        class Counting(DynamicFileName):
+            """Count the variable lookups"""
+            lookups = 0
+
+            def __getitem__(self, key):
+                Counting.lookups += 1
+                return super(Counting, self).__getitem__(key)
+
+        skel = Counting(baz='foo')
+        with TempDir() as tmp_dir:
+            skel.write(tmp_dir.path)
+            self.assertTrue(tmp_dir.exists('bar', 'foo.txt'))
+        # check_variables, then one lookup per variable for the snapshot
+        self.assertEqual(
+            Counting.lookups, len(skel.variables) + len(skel))
+
+    def test_write_variables_changed(self):
+        """Tests a variable set during the write is used by the files
+        written after.
+        """
+
+        class Changing(DynamicContent):
+            """Set baz once foo.txt is copied"""
+
+            def _copy_static_file(self, src, dst):
+                super(Changing, self)._copy_static_file(src, dst)
+                self['baz'] = 'changed'
+
+        with TempDir() as tmp_dir:
+            Changing(baz='foo').write(tmp_dir.path)
+            with open(tmp_dir.join('bar', 'baz.txt')) as baz:
+                self.assertEqual(baz.read().strip(), 'foo changed bar')
+
+    def test_write_many(self):
+        """Tests Skeleton.write_many()"""
+        rows = [{'baz': name} for name in ('a', 'b', 'c', 'd',)]
+        rows[2] = {}
+        with TempDir() as tmp_dir:
+            results = list(DynamicContent.write_many(
+                rows, tmp_dir.join('{baz}'), workers=2))
+
+            self.assertEqual([r['index'] for r in results], [0, 1, 2, 3])
+            self.assertEqual(
+                [r['status'] for r in results], ['ok', 'ok', 'error', 'ok'])
+            self.assertEqual(results[2]['error'], 'KeyError')
+            self.assertEqual(results[3]['dst_dir'], tmp_dir.join('d'))
+            self.assertTrue(results[3]['duration'] >= 0)
+            with open(tmp_dir.join('d', 'bar', 'baz.txt')) as baz:
+                self.assertEqual(baz.read().strip(), 'foo d bar')
+
+    def test_write_async(self):
+        """Tests Skeleton.write_async()"""
+        skel = StaticWithRequirement(file_name="fooz")
+        done = []
+        with TempDir() as tmp_dir:
+            task = skel.write_async(tmp_dir.path, workers=2)
+            task.add_done_callback(done.append)
+            task.result(timeout=10)
+
+            self.assertTrue(task.done())
+            self.assertFalse(task.cancelled())
+            self.assertEqual(done, [task])
+            self.assertTrue(tmp_dir.exists('foo.txt'))
+            self.assertTrue(tmp_dir.exists('fooz.txt'))
+
+    def test_write_async_fails(self):
+        """Tests WriteTask.result() raises the write exception"""
+        skel = MissingVariable()
+        with TempDir() as tmp_dir:
+            task = skel.write_async(tmp_dir.path)
+            self.assertRaises(TemplateKeyError, task.result, 10)
+
+    def test_write_async_cancel(self):
+        """Tests WriteTask.cancel() stops the write"""
+
+        class Cancelled(Static):
+            """Cancel the write after the first file"""
+
+            def _copy_static_file(self, src, dst):
+                super(Cancelled, self)._copy_static_file(src, dst)
+                self._cancel_event.set()
+
+        skel = Cancelled()
+        with TempDir() as tmp_dir:
+            task = skel.write_async(tmp_dir.path)
+            self.assertRaises(WriteCancelled, task.result, 10)
+            self.assertTrue(task.cancelled())
+            self.assertTrue(tmp_dir.exists('foo.txt'))
+            self.assertFalse(tmp_dir.exists('bar/baz.txt'))
+
+    def test_run_async_cancelled_before_start(self):
+        """Tests a write cancelled while waiting for its turn"""
+        semaphore = threading.BoundedSemaphore(1)
+        semaphore.acquire()
+        skel = DynamicContent(baz="<replaced>")
+        skel.async_semaphore = semaphore
+        with TempDir() as tmp_dir:
+            task = skel.run_async(tmp_dir.path)
+            task.cancel()
+            semaphore.release()
+            self.assertRaises(WriteCancelled, task.result, 10)
+            self.assertFalse(tmp_dir.exists('foo.txt'))
+
+    def test_write_hardlink(self):
+        """Tests Skeleton.write() hard links static files"""
+        skel = DynamicContent(baz="<replaced>")
+        with TempDir() as tmp_dir:
+            skel.write(tmp_dir.path, link_static='hardlink')
+
+            self.assertTrue(os.path.samefile(
+                tmp_dir.join('foo.txt'),
+                os.path.join(skel.real_src, 'foo.txt')))
+            self.assertEqual(os.stat(tmp_dir.join('bar/baz.txt')).st_nlink, 1)
+
+            # a copy over the link must not truncate the skeleton file
+            skel.write(tmp_dir.path)
+            self.assertEqual(
+                open(os.path.join(skel.real_src, 'foo.txt')).read().strip(),
+                'foo')
+
+    def test_write_over_hardlinks(self):
+        """Tests a copy over files hard linked by a previous write doesn't
+        modify the files they are linked to.
+        """
+        with TempDir() as src_dir:
+            os.makedirs(src_dir.join('a'))
+            os.makedirs(src_dir.join('b'))
+            for path, content in (
+                (('a', 'README.txt'), 'A\n'), (('a', 'LICENSE'), 'A license'),
+                (('b', 'README.txt_tmpl'), 'B {name}\n'),
+                (('b', 'LICENSE'), 'B license'),):
+                with open(src_dir.join(*path), 'w') as src_file:
+                    src_file.write(content)
+
+            class A(Skeleton):
+                """Static files"""
+                src = src_dir.join('a')
+
+            class B(Skeleton):
+                """Same file names"""
+                src = src_dir.join('b')
+                variables = [Var('name')]
+
+            with TempDir() as tmp_dir:
+                A().write(tmp_dir.path, link_static='hardlink')
+                B(name='x').write(tmp_dir.path)
+
+                for path, content in (
+                    (('a', 'README.txt'), 'A\n'),
+                    (('a', 'LICENSE'), 'A license'),):
+                    with open(src_dir.join(*path)) as src_file:
+                        self.assertEqual(src_file.read(), content)
+                    self.assertEqual(os.stat(src_dir.join(*path)).st_nlink, 1)
+                with open(tmp_dir.join('README.txt')) as readme:
+                    self.assertEqual(readme.read(), 'B x\n')
+                with open(tmp_dir.join('LICENSE')) as license_file:
+                    self.assertEqual(license_file.read(), 'B license')
+
+    def test_write_with_new_umask(self):
+        """Tests the modes are set when the umask changed after the
+        skeleton modules were imported.
+        """
+        with TempDir() as src_dir:
+            os.makedirs(src_dir.join('bin'))
+            os.chmod(src_dir.join('bin'), 0o755)
+            for path, mode in (
+                (('foo.txt',), 0o644), (('bin', 'foo_tmpl'), 0o755),):
+                with open(src_dir.join(*path), 'w') as src_file:
+                    src_file.write('foo {name}\n')
+                os.chmod(src_dir.join(*path), mode)
+
+            class Modes(Skeleton):
+                """Files and directory with umask 022 modes"""
+                src = src_dir.path
+                variables = [Var('name')]
+
+            with TempDir() as tmp_dir:
+                umask = os.umask(0o077)
+                try:
+                    Modes(name='bar').write(tmp_dir.path)
+                finally:
+                    os.umask(umask)
+                for path, mode in (
+                    (('foo.txt',), 0o644), (('bin',), 0o755),
+                    (('bin', 'foo'), 0o755),):
+                    self.assertEqual(
+                        stat.S_IMODE(os.stat(tmp_dir.join(*path)).st_mode),
+                        mode)
+
+    def test_write_stat_count(self):
+        """Tests a write doesn't stat the skeleton directories for each
+        file (the skeleton manifest is validated once per write).
+        """
+        with TempDir() as src_dir:
+            for dir_index in range(10):
+                dir_path = src_dir.join('dir%d' % dir_index)
+                os.mkdir(dir_path)
+                for file_index in range(10):
+                    name = 'file%d.txt' % file_index
+                    if file_index % 2:
+                        name += '_tmpl'
+                    with open(os.path.join(dir_path, name), 'w') as src_file:
+                        src_file.write('{year}\n')
+
+            class Tree(Skeleton):
+                """Skeleton with 10 directories of 10 files"""
+                src = src_dir.path
+
+            with TempDir() as tmp_dir:
+                Tree().write(tmp_dir.join('warm'))
+                stat_mock = Mock()
+                stat_mock.side_effect = os.stat
+                os.stat = stat_mock
+                try:
+                    Tree().write(tmp_dir.join('dst'))
+                finally:
+                    os.stat = stat_mock.side_effect
+                self.assertTrue(tmp_dir.exists('dst', 'dir9', 'file9.txt'))
+        self.assertTrue(
+            stat_mock.call_count <= 100, "%d stats" % stat_mock.call_count)
+
+    def test_write_hardlink_cache(self):
+        """Tests Skeleton.write() hard links static files to a cache"""
+        with TempDir() as src_dir:
+            for name, mode in (('a.txt', 0o644), ('b.txt', 0o755)):
+                with open(src_dir.join(name), 'w') as static:
+                    static.write('same content')
+                os.chmod(src_dir.join(name), mode)
+
+            class Linked(Skeleton):
+                """Skeleton with files only differing by their mode"""
+                src = src_dir.path
+
+            with TempDir() as cache_dir:
+                with TempDir() as tmp_dir:
+                    skel = Linked()
+                    skel.link_cache_dir = cache_dir.path
+                    skel.write(tmp_dir.path, link_static='hardlink')
+
+                    self.assertEqual(len(os.listdir(cache_dir.path)), 2)
+                    self.assertFalse(os.path.samefile(
+                        tmp_dir.join('a.txt'), tmp_dir.join('b.txt')))
+                    self.assertEqual(
+                        os.stat(tmp_dir.join('b.txt')).st_mode & 0o777,
+                        0o755)
+                    self.assertEqual(
+                        os.stat(src_dir.join('a.txt')).st_nlink, 1)
+
+    def test_write_invalid_link_static(self):
+        """Tests Skeleton.write() with an unknown link_static mode"""
+        with TempDir() as tmp_dir:
+            self.assertRaises(
+                ValueError, Static().write, tmp_dir.path, link_static='foo')
+
+    def test_write_dynamic_directory_names(self):
+        """Tests Skeleton.write() with dynamic directory names"""
+        with TempDir() as src_dir:
+            os.makedirs(src_dir.join('{baz}', 'sub'))
+            with open(src_dir.join('{baz}', 'sub', 'foo.txt'), 'w') as foo:
+                foo.write('foo')
+
+            class DynamicDirectory(Skeleton):
+                """Skeleton with a dynamic directory name"""
+                src = src_dir.path
+                variables = [Var('baz')]
+
+            with TempDir() as tmp_dir:
+                DynamicDirectory(baz='bar').write(tmp_dir.path)
+                self.assertTrue(tmp_dir.exists('bar', 'sub', 'foo.txt'))
+
+    def test_write_directory_modes(self):
+        """Tests Skeleton.write() set directory modes after writing their
+        content.
+        """
+        with TempDir() as src_dir:
+            os.mkdir(src_dir.join('read-only'))
+            with open(src_dir.join('read-only', 'foo.txt'), 'w') as foo:
+                foo.write('foo')
+            os.chmod(src_dir.join('read-only'), 0o555)
+
+            class ReadOnly(Skeleton):
+                """Skeleton with a read-only directory"""
+                src = src_dir.path
+
+            with TempDir() as tmp_dir:
+                try:
+                    ReadOnly().write(tmp_dir.path)
+                    self.assertTrue(tmp_dir.exists('read-only', 'foo.txt'))
+                    self.assertEqual(
+                        os.stat(tmp_dir.join('read-only')).st_mode & 0o777,
+                        0o555)
+                finally:
+                    os.chmod(src_dir.join('read-only'), 0o755)
+                    if tmp_dir.exists('read-only'):
+                        os.chmod(tmp_dir.join('read-only'), 0o755)
+
+    def test_write_existing_file_modes(self):
+        """Tests Skeleton.write() set the mode of existing files"""
+        with TempDir() as src_dir:
+            with open(src_dir.join('foo.txt'), 'w') as foo:
+                foo.write('foo')
+            with open(src_dir.join('bar.txt_tmpl'), 'w') as bar:
+                bar.write('bar')
+            os.chmod(src_dir.join('foo.txt'), 0o751)
+            os.chmod(src_dir.join('bar.txt_tmpl'), 0o640)
+
+            class Modes(Skeleton):
+                """Skeleton with executable and private files"""
+                src = src_dir.path
+
+            with TempDir() as tmp_dir:
+                for name in ('foo.txt', 'bar.txt',):
+                    with open(tmp_dir.join(name), 'w') as dst:
+                        dst.write('old')
+                    os.chmod(tmp_dir.join(name), 0o600)
+
+                Modes().write(tmp_dir.path)
+                self.assertEqual(
+                    os.stat(tmp_dir.join('foo.txt')).st_mode & 0o777, 0o751)
+                self.assertEqual(
+                    os.stat(tmp_dir.join('bar.txt')).st_mode & 0o777, 0o640)
+                with open(tmp_dir.join('bar.txt')) as bar:
+                    self.assertEqual(bar.read(), 'bar')
+
+    def test_write_incremental(self):
+        """Tests Skeleton.write(incremental=True) only write modified files
+        """
+        with TempDir() as tmp_dir:
+            skel = DynamicContent(baz='foo')
+            skel.write(tmp_dir.path, incremental=True)
+            self.assertTrue(tmp_dir.exists(skel.output_manifest_name))
+
+            for path in ('foo.txt', ('bar', 'baz.txt'),):
+                if isinstance(path, tuple):
+                    path = os.path.join(*path)
+                os.utime(tmp_dir.join(path), (0, 0))
+            os.chmod(tmp_dir.join('foo.txt'), 0o600)
+
+            DynamicContent(baz='foo').write(tmp_dir.path, incremental=True)
+            self.assertEqual(os.stat(tmp_dir.join('foo.txt')).st_mtime, 0)
+            self.assertEqual(
+                os.stat(tmp_dir.join('bar', 'baz.txt')).st_mtime, 0)
+            self.assertEqual(
+                os.stat(tmp_dir.join('foo.txt')).st_mode & 0o777,
+                skel.manifest.get('foo.txt').mode)
+
+            DynamicContent(baz='bar').write(tmp_dir.path, incremental=True)
+            self.assertEqual(os.stat(tmp_dir.join('foo.txt')).st_mtime, 0)
+            self.assertNotEqual(
+                os.stat(tmp_dir.join('bar', 'baz.txt')).st_mtime, 0)
+            with open(tmp_dir.join('bar', 'baz.txt')) as baz:
+                self.assertEqual(baz.read().strip(), 'foo bar bar')
+
+    def test_write_incremental_edited_file(self):
+        """Tests Skeleton.write(incremental=True) rewrite a file edited
+        since the last write, even if it kept its size.
+        """
+        with TempDir() as tmp_dir:
+            DynamicContent(baz='foo').write(tmp_dir.path, incremental=True)
+            with open(tmp_dir.join('bar', 'baz.txt')) as baz:
+                content = baz.read()
+            with open(tmp_dir.join('bar', 'baz.txt'), 'w') as baz:
+                baz.write(content.upper())
+            os.utime(tmp_dir.join('bar', 'baz.txt'), (1, 1))
+
+            DynamicContent(baz='foo').write(tmp_dir.path, incremental=True)
+            with open(tmp_dir.join('bar', 'baz.txt')) as baz:
+                self.assertEqual(baz.read(), content)
+
+    def test_write_incremental_dependencies(self):
+        """Tests Skeleton.write(incremental=True) only render the templates
+        depending on modified variables.
+        """
+        rendered = []
+
+        class RecordingCache(TemplateCache):
+            """Record the templates read from the cache"""
+
+            def get_file(self, path, encoding):
+                rendered.append(os.path.basename(path))
+                return super(RecordingCache, self).get_file(path, encoding)
+
+        with TempDir() as src_dir:
+            os.mkdir(src_dir.join('{package}'))
+            with open(src_dir.join('{package}', 'a.txt_tmpl'), 'w') as tmpl:
+                tmpl.write('{author}')
+            with open(src_dir.join('b.txt_tmpl'), 'w') as tmpl:
+                tmpl.write('{email} {year}')
+
+            class Dependencies(Skeleton):
+                """Skeleton with templates using different variables"""
+                src = src_dir.path
+                template_cache = RecordingCache()
+
+            with TempDir() as tmp_dir:
+                variables = dict(package='foo', author='Joe', email='a@b.c')
+                Dependencies(**variables).write(
+                    tmp_dir.path, incremental=True)
+                self.assertEqual(
+                    sorted(rendered), ['a.txt_tmpl', 'b.txt_tmpl'])
+
+                del rendered[:]
+                variables['email'] = 'b@c.d'
+                Dependencies(**variables).write(
+                    tmp_dir.path, incremental=True)
+                self.assertEqual(rendered, ['b.txt_tmpl'])
+                with open(tmp_dir.join('b.txt')) as b_file:
+                    self.assertTrue(b_file.read().startswith('b@c.d'))
+
+                del rendered[:]
+                variables['package'] = 'bar'
+                Dependencies(**variables).write(
+                    tmp_dir.path, incremental=True)
+                self.assertEqual(rendered, ['a.txt_tmpl'])
+                self.assertTrue(tmp_dir.exists('bar', 'a.txt'))
+
+    def test_write_incremental_edited_source(self):
+        """Tests Skeleton.write(incremental=True) notices skeleton files
+        edited in place (the skeleton manifest is still valid).
+        """
+        with TempDir() as src_dir:
+            for name in ('static.txt', 'template.txt_tmpl',):
+                with open(src_dir.join(name), 'w') as src_file:
+                    src_file.write('v1 {name}')
+                os.utime(src_dir.join(name), (1, 1))
+
+            class Edited(Skeleton):
+                """Skeleton which files get edited"""
+                src = src_dir.path
+                variables = [Var('name')]
+
+            with TempDir() as tmp_dir:
+                Edited(name='foo').write(tmp_dir.path, incremental=True)
+                dir_stat = os.stat(src_dir.path)
+                for name in ('static.txt', 'template.txt_tmpl',):
+                    with open(src_dir.join(name), 'w') as src_file:
+                        src_file.write('v2 {name}')
+                os.utime(src_dir.path, (dir_stat.st_atime, dir_stat.st_mtime))
+                self.assertTrue(get_manifest(
+                    src_dir.path, Edited.template_suffix).is_valid())
+
+                Edited(name='foo').write(tmp_dir.path, incremental=True)
+                with open(tmp_dir.join('static.txt')) as static:
+                    self.assertEqual(static.read(), 'v2 {name}')
+                with open(tmp_dir.join('template.txt')) as template:
+                    self.assertEqual(template.read(), 'v2 foo')
+
+
+class Recording(object):
+    """Mixin recording the skeletons executed, and how many of them run
+    at the same time.
+
+    A skeleton waits (up to `timeout` seconds) for another one to run
+    before writing its files.
+    """
+    lock = threading.Lock()
+    executed = []
+    running = [0, 0]  # current, max
+    both_running = threading.Event()
+    timeout = 0
+
+    def _execute(self, *args, **kw):
+        with self.lock:
+            self.executed.append(self.__class__.__name__)
+            self.running[0] += 1
+            self.running[1] = max(self.running)
+            if self.running[0] > 1:
+                self.both_running.set()
+        try:
+            self.both_running.wait(self.timeout)
+            super(Recording, self)._execute(*args, **kw)
+        finally:
+            with self.lock:
+                self.running[0] -= 1
+
+
+class Shared(Recording, Required):
+    """Requirement shared by SharedA and SharedB"""
+
+
+class SharedA(Recording, DynamicContent):
+    """Requires Shared"""
+    required_skeletons = [Shared]
+
+
+class SharedB(Recording, Static):
+    """Requires Shared"""
+    required_skeletons = [Shared]
+
+
+class Diamond(Recording, Skeleton):
+    """Requires SharedA and SharedB"""
+    src = 'skeletons/dynamic-file-name'
+    required_skeletons = [SharedA, SharedB]
+
+
+class CycleA(Skeleton):
+    """Requires CycleB"""
+
+
+class CycleB(Skeleton):
+    """Requires CycleA"""
+    required_skeletons = [CycleA]
+
+CycleA.required_skeletons = [CycleB]
+
+
+class TestRequirementGraph(TestCase):
+    """Tests for skeleton.core.RequirementGraph"""
+
+    def setUp(self):
+        super(TestRequirementGraph, self).setUp()
+        Recording.executed = []
+        Recording.running = [0, 0]
+        Recording.both_running = threading.Event()
+
+    def test_graph(self):
+        """Tests RequirementGraph dedupes the shared requirements"""
+        graph = RequirementGraph(Diamond())
+        self.assertEqual(
+            [skel.__class__ for skel in graph.nodes],
+            [Shared, SharedA, SharedB])
+        self.assertEqual(graph.dependencies[SharedB], set([Shared]))
+
+    def test_write_shared_requirement(self):
+        """Tests a requirement shared by two skeletons is written once"""
+        with TempDir() as tmp_dir:
+            Diamond(file_name='fooz', baz='foo').write(tmp_dir.path)
+            self.assertTrue(tmp_dir.exists('fooz.txt'))
+        self.assertEqual(
+            Recording.executed, ['Shared', 'SharedA', 'SharedB', 'Diamond'])
+
+    def test_check_variables_once(self):
+        """Tests each skeleton of the requirement graph is checked once, and
+        checked again once a variable changed.
+        """
+        checked = []
+        check_own_variables = Skeleton.__dict__['_check_own_variables']
+
+        def recording(skel):
+            """Record the skeletons actually checked"""
+            memo = skel.set_variables.checked
+            version = memo.get(skel.__class__)
+            check_own_variables(skel)
+            if memo[skel.__class__] != version:
+                checked.append(skel.__class__.__name__)
+
+        Skeleton._check_own_variables = recording
+        try:
+            skel = Diamond(file_name='fooz', baz='foo')
+            with TempDir() as tmp_dir:
+                skel.write(tmp_dir.path)
+            self.assertEqual(
+                checked, ['Shared', 'SharedA', 'SharedB', 'Diamond'])
+
+            checked[:] = []
+            skel.check_variables()
+            self.assertEqual(checked, [])
+            skel['baz'] = 'bar'
+            skel.check_variables()
+            self.assertEqual(
+                checked, ['Shared', 'SharedA', 'SharedB', 'Diamond'])
+        finally:
+            Skeleton._check_own_variables = check_own_variables
+
+    def test_check_variables_first(self):
+        """Tests Skeleton.write() checks the variables of all the required
+        skeletons before writing any of them.
+        """
+
+        class Missing(Skeleton):
+            """Requires a skeleton with a missing variable"""
+            src = 'skeletons/static'
+            required_skeletons = [DynamicContent, Required]
+
+        with TempDir() as tmp_dir:
+            self.assertRaises(
+                KeyError, Missing(baz='foo').write, tmp_dir.path)
+            self.assertFalse(tmp_dir.exists('foo.txt'))
+
+    def test_concurrent_requirement_fails(self):
+        """Tests the error of a requirement running concurrently is raised
+        """
+
+        class Failing(Skeleton):
+            """Requires a skeleton with an undeclared variable"""
+            src = 'skeletons/static'
+            required_skeletons = [Required, MissingVariable]
+
+        with TempDir() as tmp_dir:
+            try:
+                Failing(file_name='fooz').write(tmp_dir.path, workers=2)
+                self.fail("TemplateKeyError not raised")
+            except (TemplateKeyError,), exc:
+                self.assertEqual(exc.variable_name, 'baz')
+
+    def test_cycle(self):
+        """Tests Skeleton.write() raises RequirementCycleError"""
+        with TempDir() as tmp_dir:
+            try:
+                CycleA().write(tmp_dir.path)
+                self.fail("RequirementCycleError not raised")
+            except (RequirementCycleError,), exc:
+                self.assertEqual(exc.cycle, [CycleA, CycleB, CycleA])
+
+    def test_concurrent_requirements(self):
+        """Tests independent requirements writing different files run at the
+        same time, the others one after the other.
+        """
+
+        class Left(Recording, Required):
+            """Writes {file_name}.txt and bar/empty"""
+            timeout = 0.5
+
+        class Right(Recording, DynamicContent):
+            """Writes foo.txt and bar/baz.txt"""
+            timeout = 0.5
+
+        class Other(Recording, Static):
+            """Writes foo.txt and bar/baz.txt"""
+            timeout = 0.5
+
+        class Independent(Recording, Skeleton):
+            """Requires two skeletons writing different files"""
+            src = 'skeletons/static'
+            required_skeletons = [Left, Right]
+
+        class Overlapping(Recording, Skeleton):
+            """Requires two skeletons writing the same files"""
+            src = 'skeletons/static'
+            required_skeletons = [Right, Other]
+
+        with TempDir() as tmp_dir:
+            Independent(file_name='fooz', baz='foo').write(
+                tmp_dir.path, workers=2)
+            self.assertEqual(Recording.running[1], 2)
+
+            Recording.running = [0, 0]
+            Recording.both_running = threading.Event()
+            Overlapping(file_name='fooz', baz='foo').write(
+                tmp_dir.join('overlapping'), workers=2)
+            self.assertEqual(Recording.running[1], 1)
+            self.assertTrue(tmp_dir.exists('overlapping', 'bar', 'baz.txt'))
+
+    def test_concurrent_incremental_requirements(self):
+        """Tests independent requirements of an incremental write don't run
+        at the same time (they share the output manifest), and their
+        outputs are only computed once.
+        """
+        planned = []
+
+        class Planned(Recording):
+            """Record the output files computations"""
+            timeout = 0.2
+
+            def _output_files(self, *args, **kw):
+                planned.append(self.__class__.__name__)
+                return super(Planned, self)._output_files(*args, **kw)
+
+        class Left(Planned, Required):
+            """Writes {file_name}.txt and bar/empty"""
+
+        class Right(Planned, DynamicContent):
+            """Writes foo.txt and bar/baz.txt"""
+
+        class Independent(Recording, Skeleton):
+            """Requires two skeletons writing different files"""
+            src = 'skeletons/static'
+            required_skeletons = [Left, Right]
+
+        load = OutputManifest.__dict__['load']
+
+        def slow_load(cls, path):
+            """Let the other requirement load the manifest too"""
+            time.sleep(0.05)
+            return load.__get__(None, cls)(path)
+
+        OutputManifest.load = classmethod(slow_load)
+        try:
+            with TempDir() as tmp_dir:
+                Independent(file_name='fooz', baz='foo').write(
+                    tmp_dir.path, workers=2, incremental=True)
+                manifest = OutputManifest.load(
+                    tmp_dir.join(Skeleton.output_manifest_name))
+        finally:
+            OutputManifest.load = load
+        self.assertEqual(Recording.running[1], 1)
+        self.assertTrue(manifest.get('fooz.txt') is not None)
+        self.assertTrue(manifest.get(os.path.join('bar', 'baz.txt'))
+            is not None)
+        self.assertEqual(sorted(planned), ['Left', 'Right'])
+
 
 class TestVar(TestCase):
     """Tests for skeleton.Var"""
@@ -453,6 +1241,8 @@ def suite():
     """Get all licence releated test"""
     tests = unittest.TestSuite()
     tests.addTest(unittest.TestLoader().loadTestsFromTestCase(TestSkeleton))
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestRequirementGraph))
     tests.addTest(unittest.TestLoader().loadTestsFromTestCase(TestVar))
     tests.addTest(unittest.TestLoader().loadTestsFromTestCase(TestBool))
     tests.addTest(
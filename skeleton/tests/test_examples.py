@@ -1,15 +1,23 @@
 """
 Tests the BDS, GPL and LGPL skeleton
 """
+from __future__ import with_statement
+from contextlib import closing
+import io
+import os
 import subprocess
 import sys
 import unittest
+import zipfile
 
-from skeleton.examples.basicpackage import BasicPackage, main
+from skeleton.backends import MemoryBackend
+from skeleton.core import PlanError
+from skeleton.examples.basicpackage import BasicPackage, NS_HEADER, main
 from skeleton.examples.licenses import (
     BSD, BSD_THIRD_CLAUSE, GPL, LGPL, NoLicense, LicenseChoice,
     )
 from skeleton.examples.mkmodule import BasicModule
+from skeleton.plan import execute
 from skeleton.tests.utils import TestCase, TempDir
 
 
@@ -39,6 +47,16 @@ class TestBSD(TestCase):
                 )
             self.assertTrue(tmp.exists('LICENSE'))
 
+    def test_execute_plan(self):
+        """Tests the plan of a BSD license can be executed."""
+        skel = BSD(author='Damien Lebrun', organization='Foo inc')
+
+        with TempDir() as tmp:
+            execute(skel.write(tmp.path, run_dry=True))
+
+            with open(tmp.join('LICENSE')) as license_file:
+                self.assertTrue('Foo inc' in license_file.read())
+
 
 class TestGPL(TestCase):
     """Tests skeleton.example.license.GPL."""
@@ -199,6 +217,30 @@ class TestBasicPackage(TestCase):
             self.assertTrue(tmp.exists('setup.py'))
             self.assertTrue(tmp.exists('foo/__init__.py'))
 
+    def test_write_in_memory(self):
+        """Tests skeleton.examples.basicpackage.BasicPackage with a memory
+        backend
+        """
+        skel = BasicPackage(
+            project_name='foo.bar',
+            package_name='foo.bar',
+            author='Damien Lebrun',
+            author_email='dinoboff@gmail.com',
+            license='BSD'
+            )
+
+        backend = MemoryBackend()
+        with TempDir() as tmp:
+            skel.write(tmp.path, backend=backend)
+            self.assertEqual(os.listdir(tmp.path), [])
+
+        self.assertTrue(tmp.join('foo', 'bar', '__init__.py') in backend)
+        self.assertEqual(
+            backend.read(tmp.join('foo', '__init__.py')).decode('UTF-8'),
+            NS_HEADER)
+        self.assertTrue("License :: OSI Approved" in
+            backend.read(tmp.join('setup.py')).decode('UTF-8'))
+
     def test_write_with_bsd(self):
         """Tests skeleton.examples.basicpackage.BasicPackage add BSD license
         """
@@ -221,6 +263,46 @@ class TestBasicPackage(TestCase):
                 content = license_file.read()
                 self.assertTrue(fragment in content)
 
+    def test_write_archive(self):
+        """Tests skeleton.examples.basicpackage.BasicPackage.write_archive()
+        creates the packages and adds the classifiers
+        """
+        skel = BasicPackage(
+            project_name='foo.bar',
+            package_name='foo.bar',
+            author='Damien Lebrun',
+            author_email='dinoboff@gmail.com',
+            license='BSD'
+            )
+
+        archive = io.BytesIO()
+        skel.write_archive(archive, 'zip')
+
+        archive.seek(0)
+        with closing(zipfile.ZipFile(archive)) as zip_file:
+            names = zip_file.namelist()
+            self.assertTrue('foo/__init__.py' in names)
+            self.assertTrue('foo/bar/__init__.py' in names)
+            self.assertTrue(
+                'License :: OSI Approved :: BSD License'.encode('UTF-8')
+                in zip_file.read('setup.py'))
+
+    def test_execute_plan(self):
+        """Tests the plan of a BasicPackage cannot be executed (it creates
+        its packages after the skeleton write)
+        """
+        skel = BasicPackage(
+            project_name='foo',
+            package_name='foo',
+            author='Damien Lebrun',
+            author_email='dinoboff@gmail.com'
+            )
+
+        with TempDir() as tmp:
+            plan = skel.write(tmp.path, run_dry=True)
+            self.assertRaises(PlanError, execute, plan)
+            self.assertEqual(os.listdir(tmp.path), [])
+
     def test_write_namespaces(self):
         """Tests skeleton.examples.basicpackage.BasicPackage with namespaces
         """
@@ -0,0 +1,117 @@
+"""
+Tests for skeleton.manifest
+
+"""
+from __future__ import with_statement
+import os
+import unittest
+
+from skeleton.manifest import (
+    Manifest, OutputManifest, get_manifest, file_digest)
+from skeleton.tests.test_core import DynamicContent
+from skeleton.tests.utils import TestCase, TempDir
+
+
+def make_skeleton(tmp_dir):
+    """Create a skeleton with a template, a static file and a sub directory.
+    """
+    os.mkdir(tmp_dir.join('bar'))
+    with open(tmp_dir.join('foo.txt'), 'w') as static:
+        static.write('foo')
+    with open(tmp_dir.join('bar', 'baz.txt_tmpl'), 'w') as template:
+        template.write('{baz}')
+
+
+class TestManifest(TestCase):
+    """Tests for skeleton.manifest.Manifest and get_manifest()"""
+
+    def test_build(self):
+        """Tests Manifest.build()"""
+        with TempDir() as tmp_dir:
+            make_skeleton(tmp_dir)
+            manifest = Manifest.build(tmp_dir.path, '_tmpl')
+
+            self.assertEqual(
+                [entry.path for entry in manifest],
+                ['bar', 'foo.txt', os.path.join('bar', 'baz.txt_tmpl')])
+            bar, foo, baz = manifest.entries
+            self.assertTrue(bar.is_dir)
+            self.assertFalse(foo.is_template)
+            self.assertTrue(baz.is_template)
+            self.assertEqual(foo.size, 3)
+            self.assertEqual(foo.digest, file_digest(tmp_dir.join('foo.txt')))
+
+    def test_get_manifest_cached(self):
+        """Tests get_manifest() only rebuild the manifest of a modified
+        skeleton.
+        """
+        with TempDir() as tmp_dir:
+            make_skeleton(tmp_dir)
+            manifest = get_manifest(tmp_dir.path, '_tmpl')
+            self.assertTrue(get_manifest(tmp_dir.path, '_tmpl') is manifest)
+
+            with open(tmp_dir.join('bar', 'new.txt'), 'w') as new:
+                new.write('new')
+            # make sure the mtime changed on file systems with low resolution
+            os.utime(tmp_dir.join('bar'), (0, 0))
+
+            new_manifest = get_manifest(tmp_dir.path, '_tmpl')
+            self.assertFalse(new_manifest is manifest)
+            self.assertEqual(len(new_manifest), 4)
+
+    def test_disk_cache(self):
+        """Tests get_manifest() save and load manifests from the cache dir
+        """
+        with TempDir() as tmp_dir:
+            with TempDir() as cache_dir:
+                make_skeleton(tmp_dir)
+                manifest = get_manifest(
+                    tmp_dir.path, '_tmpl', cache_dir=cache_dir.path)
+                self.assertEqual(len(os.listdir(cache_dir.path)), 1)
+
+                path = os.path.join(
+                    cache_dir.path, os.listdir(cache_dir.path)[0])
+                loaded = Manifest.load(path)
+                self.assertTrue(loaded.is_valid())
+                self.assertEqual(loaded.to_dict(), manifest.to_dict())
+
+    def test_skeleton_manifest(self):
+        """Tests Skeleton.manifest"""
+        skel = DynamicContent()
+        self.assertTrue(skel.manifest is DynamicContent().manifest)
+        self.assertEqual(
+            [entry.path for entry in skel.manifest],
+            ['bar', 'foo.txt', os.path.join('bar', 'baz.txt_tmpl')])
+
+
+class TestOutputManifest(TestCase):
+    """Tests for skeleton.manifest.OutputManifest"""
+
+    def test_save_and_load(self):
+        """Tests OutputManifest.save() and OutputManifest.load()"""
+        with TempDir() as tmp_dir:
+            path = tmp_dir.join('manifest.json')
+            self.assertEqual(len(OutputManifest.load(path)), 0)
+
+            manifest = OutputManifest()
+            manifest.record('foo.txt', 3, 1.5, 'abc', 0o644)
+            manifest.save(path)
+            self.assertEqual(
+                OutputManifest.load(path).get('foo.txt'),
+                [3, 1.5, 'abc', 0o644, None])
+
+            with open(path, 'w') as invalid:
+                invalid.write('[]')
+            self.assertEqual(len(OutputManifest.load(path)), 0)
+
+
+def suite():
+    """Get all manifest related tests"""
+    tests = unittest.TestSuite()
+    tests.addTest(unittest.TestLoader().loadTestsFromTestCase(TestManifest))
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestOutputManifest))
+    return tests
+
+if __name__ == "__main__":
+    unittest.main()
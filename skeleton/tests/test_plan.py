@@ -0,0 +1,105 @@
+"""
+Tests for skeleton.plan
+"""
+from __future__ import with_statement
+import json
+import os
+import unittest
+
+from skeleton.core import PlanError
+from skeleton.plan import Plan, Operation, execute
+from skeleton.tests.test_core import DynamicContent, StaticWithRequirement, \
+    Required
+from skeleton.tests.utils import TestCase, TempDir
+
+
+class TestPlan(TestCase):
+    """Tests for skeleton.plan and Skeleton.write(run_dry=True)"""
+
+    def test_dry_run_plan(self):
+        """Tests Skeleton.write(run_dry=True) returns the operations of the
+        write.
+        """
+        skel = DynamicContent(baz='foo')
+        with TempDir() as tmp_dir:
+            plan = skel.write(tmp_dir.path, run_dry=True)
+            self.assertEqual(os.listdir(tmp_dir.path), [])
+
+        self.assertTrue(isinstance(plan, Plan))
+        self.assertEqual(
+            [op.action for op in plan],
+            ['mkdir', 'mkdir', 'copy', 'render', 'chmod'])
+        render = list(plan)[3]
+        self.assertEqual(render.src, os.path.join('bar', 'baz.txt_tmpl'))
+        self.assertEqual(render.dst, tmp_dir.join('bar', 'baz.txt'))
+        self.assertEqual(render.size, skel.manifest.get(render.src).size)
+        self.assertEqual(plan.size, sum(op.size for op in plan))
+
+    def test_required_skeletons_plan(self):
+        """Tests the plan of a dry run includes the required skeletons"""
+        with TempDir() as tmp_dir:
+            plan = StaticWithRequirement(file_name='foo').write(
+                tmp_dir.path, run_dry=True)
+
+        self.assertEqual(
+            [section.skeleton for section in plan.sections],
+            [Required, StaticWithRequirement])
+        entry = Required().manifest.get('{file_name}.txt')
+        self.assertTrue(
+            Operation('copy', entry.path, tmp_dir.join('foo.txt'),
+                entry.mode, entry.size)
+            in plan.sections[0].operations)
+
+    def test_execute(self):
+        """Tests execute() a plan loaded from JSON"""
+        with TempDir() as tmp_dir:
+            plan = DynamicContent(baz='foo').write(tmp_dir.path, run_dry=True)
+            plan = Plan.from_dict(json.loads(json.dumps(plan.to_dict())))
+            self.assertEqual(
+                plan.sections[0].skeleton,
+                'skeleton.tests.test_core:DynamicContent')
+
+            execute(plan)
+            self.assertTrue(tmp_dir.exists('foo.txt'))
+            with open(tmp_dir.join('bar', 'baz.txt')) as baz:
+                self.assertEqual(baz.read().strip(), 'foo foo bar')
+
+    def test_execute_overwritten_write(self):
+        """Tests execute() refuses the plan of a skeleton which write does
+        more than its plan.
+        """
+        class PostWrite(StaticWithRequirement):
+            """Create a file after the skeleton write"""
+
+            def write(self, dst_dir, run_dry=False, **kw):
+                result = super(PostWrite, self).write(
+                    dst_dir, run_dry=run_dry, **kw)
+                if not run_dry:
+                    with open(os.path.join(dst_dir, 'post.txt'), 'w'):
+                        pass
+                return result
+
+        class SetVariable(PostWrite):
+            """Only set a variable before the skeleton write"""
+            executable_plan = True
+
+        with TempDir() as tmp_dir:
+            plan = PostWrite(file_name='foo').write(
+                tmp_dir.path, run_dry=True)
+            self.assertRaises(PlanError, execute, plan)
+            self.assertEqual(os.listdir(tmp_dir.path), [])
+
+            plan = SetVariable(file_name='foo').write(
+                tmp_dir.path, run_dry=True)
+            execute(plan)
+            self.assertTrue(tmp_dir.exists('foo.txt'))
+
+
+def suite():
+    """Get all plan related tests"""
+    tests = unittest.TestSuite()
+    tests.addTest(unittest.TestLoader().loadTestsFromTestCase(TestPlan))
+    return tests
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Tests for skeleton.profiling
+"""
+from __future__ import with_statement
+from StringIO import StringIO
+import sys
+import unittest
+
+from skeleton.profiling import PhaseStats, WriteProfile
+from skeleton.tests.test_core import DynamicContent, StaticWithRequirement
+from skeleton.tests.utils import TestCase, TempDir
+
+
+class TestWriteProfile(TestCase):
+    """Tests for skeleton.profiling.WriteProfile"""
+
+    def test_percentile(self):
+        """Tests PhaseStats.percentile()"""
+        stats = PhaseStats()
+        self.assertEqual(stats.percentile(50), 0)
+        for duration in (0.4, 0.1, 0.3, 0.2,):
+            stats.add(duration, 10)
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.bytes, 40)
+        self.assertEqual(stats.percentile(50), 0.2)
+        self.assertEqual(stats.percentile(95), 0.4)
+        self.assertEqual(stats.percentile(0), 0.1)
+
+    def test_merge(self):
+        """Tests WriteProfile.merge()"""
+        profile = WriteProfile()
+        profile.add('Foo', 'copy', 0.1, 3)
+        other = WriteProfile()
+        other.add('Bar', 'copy', 0.2, 4)
+        other.add('Foo', 'copy', 0.3, 5)
+        self.assertRaises(ValueError, other.add, 'Foo', 'unknown', 0.1)
+
+        merged = profile.merge(other)
+        self.assertEqual(merged.skeletons, ['Foo', 'Bar'])
+        self.assertEqual(merged.stats[('Foo', 'copy',)].count, 2)
+        self.assertEqual(merged.stats[('Foo', 'copy',)].bytes, 8)
+        self.assertEqual(merged.phases()['copy'].count, 3)
+        self.assertEqual(merged.phases('Bar')['copy'].bytes, 4)
+        self.assertEqual(profile.stats[('Foo', 'copy',)].count, 1)
+
+    def test_write_profile(self):
+        """Tests Skeleton.write(profile=True) returns the profile of the
+        skeleton and of its requirements.
+        """
+        with TempDir() as tmp_dir:
+            self.assertEqual(
+                StaticWithRequirement(file_name='fooz').write(
+                    tmp_dir.join('default')),
+                None)
+            profile = StaticWithRequirement(file_name='fooz').write(
+                tmp_dir.path, profile=True)
+
+        self.assertEqual(
+            profile.skeletons, ['Required', 'StaticWithRequirement'])
+        phases = profile.phases('StaticWithRequirement')
+        self.assertEqual(phases['walk'].count, 1)
+        self.assertEqual(phases['copy'].count, 2)
+        self.assertTrue(phases['copy'].bytes > 0)
+        self.assertEqual(phases['format_name'].count, 3)
+        self.assertEqual(profile.phases('Required')['copy'].count, 2)
+        self.assertEqual(
+            sorted(profile.to_dict()), ['Required', 'StaticWithRequirement'])
+
+        lines = profile.summary().splitlines()
+        self.assertEqual(
+            lines[0].split(),
+            ['skeleton', 'phase', 'count', 'bytes', 'total', 'p50', 'p95',
+                'max'])
+        self.assertEqual(lines[1].split()[:4], ['Required', 'walk', '1', '0'])
+        self.assertEqual(lines[-1].split()[0], 'total')
+
+    def test_render_profile(self):
+        """Tests the read, render and write phases of templates"""
+        with TempDir() as tmp_dir:
+            profile = DynamicContent(baz='foo').write(
+                tmp_dir.path, profile=True)
+            with open(tmp_dir.join('bar', 'baz.txt')) as baz:
+                size = len(baz.read())
+        phases = profile.phases()
+        self.assertEqual(phases['read'].count, 1)
+        self.assertEqual(phases['render'].bytes, size)
+        self.assertEqual(phases['write'].bytes, size)
+
+    def test_render_profile_fallback(self):
+        """Tests templates a process pool doesn't render are only recorded
+        once.
+        """
+        with TempDir() as tmp_dir:
+            profile = DynamicContent(baz='foo').write(
+                tmp_dir.path, processes=2, profile=True)
+            with open(tmp_dir.join('bar', 'baz.txt')) as baz:
+                size = len(baz.read())
+        phases = profile.phases()
+        self.assertEqual(phases['render'].count, 1)
+        self.assertEqual(phases['render'].bytes, size)
+
+    def test_cmd(self):
+        """Tests Skeleton.cmd() prints the profile with --profile"""
+        with TempDir() as tmp_dir:
+            stdout, sys.stdout = sys.stdout, StringIO()
+            try:
+                DynamicContent.cmd(
+                    ['--profile', '--baz', 'foo', '-q', tmp_dir.path])
+                output = sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+            self.assertTrue(tmp_dir.exists('bar', 'baz.txt'))
+        self.assertTrue(output.startswith('skeleton'))
+        self.assertTrue('DynamicContent' in output)
+
+
+def suite():
+    """Get all write profile related tests"""
+    tests = unittest.TestSuite()
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestWriteProfile))
+    return tests
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Tests for skeleton.resources
+"""
+from __future__ import with_statement
+from contextlib import closing
+import os
+import stat
+import sys
+import unittest
+import zipfile
+
+from skeleton.resources import (
+    get_loader, get_zip_index, clear_zip_indexes, stat_resource,
+    open_resource, FileSystemLoader, ZipLoader)
+from skeleton.tests.utils import TestCase, TempDir
+
+
+MODULE = '''
+from skeleton import Skeleton, Var
+
+
+class Zipped(Skeleton):
+    src = 'zipped-skeleton'
+    variables = [Var('baz')]
+'''
+
+
+def make_archive(path):
+    """Create a zip archive holding a "zipped" module and its skeleton.
+
+    The skeleton directories have no entry in the archive.
+    """
+    with closing(zipfile.ZipFile(path, 'w')) as archive:
+        archive.writestr('zipped.py', MODULE)
+        info = zipfile.ZipInfo('zipped-skeleton/foo.txt')
+        info.external_attr = (stat.S_IFREG | 0o640) << 16
+        archive.writestr(info, 'foo')
+        info = zipfile.ZipInfo('zipped-skeleton/bar/baz.txt_tmpl')
+        info.external_attr = (stat.S_IFREG | 0o755) << 16
+        archive.writestr(info, '{baz} bar')
+
+
+class TestResources(TestCase):
+    """Tests for skeleton.resources"""
+
+    def tearDown(self):
+        clear_zip_indexes()
+        super(TestResources, self).tearDown()
+
+    def test_get_loader(self):
+        """Tests get_loader()"""
+        with TempDir() as tmp_dir:
+            make_archive(tmp_dir.join('app.zip'))
+            self.assertTrue(
+                isinstance(get_loader(tmp_dir.path), FileSystemLoader))
+            loader = get_loader(tmp_dir.join('app.zip', 'zipped-skeleton'))
+            self.assertTrue(isinstance(loader, ZipLoader))
+            self.assertFalse(loader.is_file_system)
+            self.assertEqual(
+                get_loader(tmp_dir.join('app.zip', 'zipped.py')), None)
+            self.assertEqual(get_loader(tmp_dir.join('missing')), None)
+
+    def test_zip_loader(self):
+        """Tests ZipLoader walks and reads the skeleton from the index"""
+        with TempDir() as tmp_dir:
+            make_archive(tmp_dir.join('app.zip'))
+            loader = get_loader(tmp_dir.join('app.zip', 'zipped-skeleton'))
+            self.assertEqual(
+                list(loader.walk()),
+                [('', ['bar'], ['foo.txt']), ('bar', [], ['baz.txt_tmpl'])])
+
+            foo_stat = loader.stat('foo.txt')
+            self.assertEqual(stat.S_IMODE(foo_stat.st_mode), 0o640)
+            self.assertEqual(foo_stat.st_size, 3)
+            self.assertTrue(stat.S_ISDIR(loader.stat('bar').st_mode))
+            with closing(loader.open('foo.txt')) as foo:
+                self.assertEqual(foo.read(), 'foo'.encode('ascii'))
+            self.assertTrue(
+                get_zip_index(tmp_dir.join('app.zip')) is loader.index)
+
+    def test_resource_paths(self):
+        """Tests stat_resource() and open_resource() with archive members"""
+        with TempDir() as tmp_dir:
+            make_archive(tmp_dir.join('app.zip'))
+            path = tmp_dir.join('app.zip', 'zipped-skeleton', 'foo.txt')
+            self.assertEqual(stat_resource(path).st_size, 3)
+            with closing(open_resource(path)) as foo:
+                self.assertEqual(foo.read(), 'foo'.encode('ascii'))
+            self.assertRaises(
+                IOError, open_resource,
+                tmp_dir.join('app.zip', 'zipped-skeleton', 'missing'))
+
+    def test_write_zipped_skeleton(self):
+        """Tests Skeleton.write() with a skeleton imported from a zip
+        archive
+        """
+        with TempDir() as tmp_dir:
+            make_archive(tmp_dir.join('app.zip'))
+            sys.path.insert(0, tmp_dir.join('app.zip'))
+            try:
+                __import__('zipped')
+                skel = sys.modules['zipped'].Zipped(baz='foo')
+                skel.write(tmp_dir.join('out'))
+            finally:
+                sys.path.remove(tmp_dir.join('app.zip'))
+                sys.modules.pop('zipped', None)
+
+            with open(tmp_dir.join('out', 'foo.txt')) as foo:
+                self.assertEqual(foo.read(), 'foo')
+            with open(tmp_dir.join('out', 'bar', 'baz.txt')) as baz:
+                self.assertEqual(baz.read(), 'foo bar')
+            self.assertEqual(
+                stat.S_IMODE(os.stat(tmp_dir.join('out', 'foo.txt')).st_mode),
+                0o640)
+
+
+def suite():
+    """Get all resource loader related tests"""
+    tests = unittest.TestSuite()
+    tests.addTest(unittest.TestLoader().loadTestsFromTestCase(TestResources))
+    return tests
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Tests for skeleton.server and skeleton.cli
+"""
+from __future__ import with_statement
+from StringIO import StringIO
+import json
+import os
+import stat
+import sys
+import threading
+import unittest
+
+from skeleton.cli import main, configure_parser, write_many
+from skeleton.server import RenderServer, RenderClient, RenderError
+from skeleton.tests.utils import TestCase, TempDir
+
+
+DYNAMIC_CONTENT = 'skeleton.tests.test_core:DynamicContent'
+
+
+class TestRenderServer(TestCase):
+    """Tests for skeleton.server.RenderServer and RenderClient"""
+
+    def setUp(self):
+        super(TestRenderServer, self).setUp()
+        self.tmp_dir = TempDir().create()
+        self.socket_path = self.tmp_dir.join('skeleton.sock')
+        self.server = RenderServer(self.socket_path, [DYNAMIC_CONTENT])
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={'poll_interval': 0.01})
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.tmp_dir.remove()
+        super(TestRenderServer, self).tearDown()
+
+    def test_render(self):
+        """Tests RenderClient.render() writes a skeleton"""
+        with RenderClient(self.socket_path) as client:
+            for name in ('foo', 'bar',):
+                response = client.render(
+                    DYNAMIC_CONTENT, self.tmp_dir.join(name), {'baz': name})
+                self.assertEqual(response['status'], 'ok')
+                with open(self.tmp_dir.join(name, 'bar', 'baz.txt')) as baz:
+                    self.assertEqual(
+                        baz.read().strip(), 'foo %s bar' % name)
+
+    def test_socket_mode(self):
+        """Tests only the user can connect to the server socket"""
+        self.assertEqual(
+            stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o600)
+
+    def test_render_dry(self):
+        """Tests a dry run request returns the write plan"""
+        with RenderClient(self.socket_path) as client:
+            response = client.render(
+                DYNAMIC_CONTENT, self.tmp_dir.join('foo'), {'baz': 'foo'},
+                run_dry=True)
+        self.assertFalse(self.tmp_dir.exists('foo'))
+        self.assertEqual(
+            [op[0] for op in response['plan']['sections'][0]['operations']],
+            ['mkdir', 'mkdir', 'copy', 'render', 'chmod'])
+
+    def test_render_error(self):
+        """Tests RenderClient.render() raises a RenderError when the write
+        fails
+        """
+        with RenderClient(self.socket_path) as client:
+            try:
+                client.render(DYNAMIC_CONTENT, self.tmp_dir.join('foo'))
+                self.fail("RenderError not raised")
+            except (RenderError,), exc:
+                self.assertEqual(exc.error, 'KeyError')
+            self.assertRaises(
+                RenderError, client.render,
+                DYNAMIC_CONTENT, self.tmp_dir.join('foo'), {'baz': 'foo'},
+                unknown=True)
+
+            # the connection is still usable
+            client.render(
+                DYNAMIC_CONTENT, self.tmp_dir.join('foo'), {'baz': 'foo'})
+        self.assertTrue(self.tmp_dir.exists('foo', 'foo.txt'))
+
+    def test_invalid_request(self):
+        """Tests the server answers requests which aren't JSON objects"""
+        with RenderClient(self.socket_path) as client:
+            for line in (b'[1]\n', b'{\n',):
+                client._file.write(line)
+                client._file.flush()
+                response = json.loads(
+                    client._file.readline().decode('utf-8'))
+                self.assertEqual(response['status'], 'error')
+                self.assertTrue(
+                    response['message'].startswith('Invalid request'))
+
+            # the connection is still usable
+            client.render(
+                DYNAMIC_CONTENT, self.tmp_dir.join('foo'), {'baz': 'foo'})
+        self.assertTrue(self.tmp_dir.exists('foo', 'foo.txt'))
+
+    def test_cli_render(self):
+        """Tests the "skeleton render" command"""
+        self.assertEqual(
+            main([
+                '-q', '--socket', self.socket_path, 'render',
+                DYNAMIC_CONTENT, self.tmp_dir.join('foo'), 'baz=foo']),
+            0)
+        self.assertTrue(self.tmp_dir.exists('foo', 'bar', 'baz.txt'))
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertEqual(
+                main([
+                    '-q', '--socket', self.socket_path, 'render',
+                    DYNAMIC_CONTENT, self.tmp_dir.join('bar')]),
+                1)
+            self.assertTrue('KeyError' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+        self.assertFalse(self.tmp_dir.exists('bar'))
+
+
+class TestWriteMany(TestCase):
+    """Tests for the "skeleton write-many" command"""
+
+    def test_json_rows(self):
+        """Tests "skeleton write-many" with JSON lines"""
+        with TempDir() as tmp_dir:
+            stdout = StringIO()
+            status = write_many(
+                DYNAMIC_CONTENT, tmp_dir.join('{baz}'),
+                configure_parser().parse_args(['-w', '2'])[0],
+                StringIO('{"baz": "a"}\n\n{"baz": "b"}\n{}\n'), stdout)
+
+            self.assertEqual(status, 1)
+            results = [json.loads(line) for line in stdout.getvalue().split(
+                '\n') if line]
+            self.assertEqual(
+                [r['status'] for r in results], ['ok', 'ok', 'error'])
+            self.assertTrue(tmp_dir.exists('a', 'bar', 'baz.txt'))
+            self.assertTrue(tmp_dir.exists('b', 'bar', 'baz.txt'))
+
+    def test_csv_rows(self):
+        """Tests "skeleton write-many --csv" with CSV rows"""
+        with TempDir() as tmp_dir:
+            stdout = StringIO()
+            status = write_many(
+                DYNAMIC_CONTENT, tmp_dir.join('{baz}'),
+                configure_parser().parse_args(['--csv'])[0],
+                StringIO('baz\r\na\r\nb\r\n'), stdout)
+
+            self.assertEqual(status, 0)
+            self.assertEqual(len(stdout.getvalue().splitlines()), 2)
+            with open(tmp_dir.join('b', 'bar', 'baz.txt')) as baz:
+                self.assertEqual(baz.read().strip(), 'foo b bar')
+
+
+def suite():
+    """Get all render server related tests"""
+    tests = unittest.TestSuite()
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestRenderServer))
+    tests.addTest(unittest.TestLoader().loadTestsFromTestCase(TestWriteMany))
+    return tests
+
+if __name__ == "__main__":
+    unittest.main()
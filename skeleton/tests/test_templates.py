@@ -0,0 +1,315 @@
+"""
+Tests for skeleton.templates
+
+"""
+from __future__ import with_statement
+from StringIO import StringIO
+import io
+import pickle
+import unittest
+
+from skeleton.core import Skeleton
+from skeleton.templates import (
+    CompiledTemplate, TemplateCache, VariableSnapshot, complete_length,
+    render_stream, render_mmap)
+from skeleton.tests.test_core import (
+    DynamicContent, DynamicFileName, TemplateKeyError)
+from skeleton.tests.utils import TestCase, TempDir
+
+
+class TestCompiledTemplate(unittest.TestCase):
+    """Tests for skeleton.templates.CompiledTemplate"""
+
+    def test_render(self):
+        """Tests CompiledTemplate.render() formats like str.format()"""
+        template = "{foo} {{bar}} {baz!r} {foo:>{width}} {obj[key]}"
+        variables = dict(
+            foo='foo', baz='baz', width=5, obj={'key': 'value'})
+        self.assertEqual(
+            CompiledTemplate(template).render(variables),
+            template.format(**variables))
+
+    def test_render_mixed_types(self):
+        """Tests CompiledTemplate.render() converts the fields to the type
+        of the template, like str.format()
+        """
+        template = 'caf\xc3\xa9-{name}.txt'
+        self.assertEqual(
+            CompiledTemplate(template).render({'name': u'foo'}),
+            template.format(name=u'foo'))
+        self.assertEqual(
+            CompiledTemplate(u'{name}-\xe9').render({'name': 'foo'}),
+            u'foo-\xe9')
+
+    def test_write_non_ascii_file_name(self):
+        """Tests a non-ASCII file name formatted with a unicode variable"""
+        with TempDir() as src_dir:
+            with open(src_dir.join('caf\xc3\xa9-{name}.txt'), 'w') as src:
+                src.write('foo')
+
+            class NonAscii(Skeleton):
+                """Skeleton with a non-ASCII file name"""
+                src = src_dir.path
+
+            with TempDir() as tmp_dir:
+                NonAscii(name=u'foo').write(tmp_dir.path)
+                self.assertTrue(tmp_dir.exists('caf\xc3\xa9-foo.txt'))
+
+    def test_render_missing_variable(self):
+        """Tests CompiledTemplate.render() raise a KeyError with the name of
+        the missing variable.
+        """
+        compiled = CompiledTemplate("{foo} {bar}")
+        try:
+            compiled.render(Skeleton(foo=1))
+            self.fail("An exception should be raised")
+        except (KeyError,), exc:
+            self.assertEqual(exc.args[0], 'bar')
+
+    def test_render_bytes(self):
+        """Tests CompiledTemplate.render_bytes()"""
+        compiled = CompiledTemplate(u"\xe9t\xe9 {foo} {{bar}} {baz}")
+        variables = dict(foo=u'\u20ac', baz=1)
+        self.assertEqual(
+            compiled.render_bytes(variables, 'utf-8'),
+            compiled.render(variables).encode('utf-8'))
+    def test_render_snapshot(self):
+        """Tests VariableSnapshot is a read-only copy of a mapping"""
+        skel = DynamicContent(baz='foo')
+        snapshot = VariableSnapshot(skel, 1)
+        skel['baz'] = 'bar'
+
+        self.assertEqual(CompiledTemplate('{baz}').render(snapshot), 'foo')
+        self.assertEqual(sorted(snapshot), sorted(skel))
+        self.assertRaises(TypeError, snapshot.__setitem__, 'baz', 'bar')
+        self.assertRaises(TypeError, snapshot.update, baz='bar')
+        copy = pickle.loads(pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(copy, snapshot)
+        self.assertEqual(copy.version, 1)
+
+
+class TestTemplateCache(TestCase):
+    """Tests for skeleton.templates.TemplateCache"""
+
+    def test_get_string(self):
+        """Tests TemplateCache.get_string() hits and misses"""
+        cache = TemplateCache()
+        compiled = cache.get_string("{foo}")
+        self.assertTrue(cache.get_string("{foo}") is compiled)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_get_file_invalidation(self):
+        """Tests TemplateCache.get_file() reload an edited template"""
+        cache = TemplateCache()
+        with TempDir() as tmp_dir:
+            path = tmp_dir.join('foo.txt_tmpl')
+            with open(path, 'w') as template:
+                template.write('{foo}')
+            self.assertEqual(
+                cache.get_file(path, 'UTF-8').render({'foo': 1}), '1')
+            self.assertEqual(
+                cache.get_file(path, 'UTF-8').render({'foo': 1}), '1')
+            self.assertEqual(cache.hits, 1)
+
+            with open(path, 'w') as template:
+                template.write('{foo} {foo}')
+            self.assertEqual(
+                cache.get_file(path, 'UTF-8').render({'foo': 1}), '1 1')
+            self.assertEqual(cache.misses, 2)
+
+    def test_lru_eviction(self):
+        """Tests TemplateCache evicts the least recently used entry"""
+        cache = TemplateCache(max_size=2)
+        cache.get_string('a')
+        cache.get_string('b')
+        cache.get_string('a')
+        cache.get_string('c')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+        cache.get_string('a')
+        self.assertEqual(cache.hits, 2)
+        cache.get_string('b')
+        self.assertEqual(cache.misses, 4)
+
+    def test_names_dont_evict_templates(self):
+        """Tests the file names of a skeleton don't evict its templates"""
+        cache = TemplateCache(max_size=30)
+        with TempDir() as src_dir:
+            for index in range(20):
+                path = src_dir.join('file%d.txt_tmpl' % index)
+                with open(path, 'w') as template:
+                    template.write('{foo}')
+
+            class ManyTemplates(Skeleton):
+                """Skeleton with more names and templates than max_size"""
+                src = src_dir.path
+                template_cache = cache
+
+            with TempDir() as tmp_dir:
+                ManyTemplates(foo='bar').write(tmp_dir.path)
+                cache.hits = cache.misses = 0
+                ManyTemplates(foo='bar').write(tmp_dir.path)
+        self.assertEqual(cache.stats()['misses'], 0)
+        self.assertEqual(cache.stats()['hits'], 40)
+
+    def test_skeleton_uses_cache(self):
+        """Tests Skeleton.write() get its templates from the cache"""
+        cache = TemplateCache()
+        skel = DynamicContent(baz="<replaced>")
+        skel.template_cache = cache
+        with TempDir() as tmp_dir:
+            skel.write(tmp_dir.path)
+            skel.write(tmp_dir.path)
+            self.assertEqual(
+                open(tmp_dir.join('bar/baz.txt')).read().strip(),
+                'foo <replaced> bar'
+                )
+        self.assertTrue(cache.hits > 0)
+        self.assertEqual(cache.misses, cache.stats()['size'])
+
+    def test_custom_formatter(self):
+        """Tests a custom template_formatter bypasses the cache"""
+
+        class Formatter(DynamicFileName):
+            """Records the formatted templates"""
+            template_cache = TemplateCache()
+            formatted = []
+
+            def template_formatter(self, template):
+                self.formatted.append(template)
+                return template.format(**self)
+
+        skel = Formatter(baz="replaced-name")
+        with TempDir() as tmp_dir:
+            skel.write(tmp_dir.path)
+            self.assertTrue(tmp_dir.exists('bar', 'replaced-name.txt'))
+        self.assertTrue('{baz}.txt' in Formatter.formatted)
+        self.assertEqual(len(Formatter.template_cache), 0)
+
+
+class TestRenderStream(TestCase):
+    """Tests for skeleton.templates.render_stream"""
+
+    template = "foo {foo} {{bar}} {baz!r:>{width}} }} end {foo}"
+    variables = dict(foo='FOO', baz='baz', width=8)
+
+    def test_complete_length(self):
+        """Tests complete_length() doesn't cut fields and escaped braces"""
+        self.assertEqual(complete_length("foo"), 3)
+        self.assertEqual(complete_length("foo {bar} baz"), 13)
+        self.assertEqual(complete_length("foo {bar"), 4)
+        self.assertEqual(complete_length("foo {"), 4)
+        self.assertEqual(complete_length("foo {{"), 6)
+        self.assertEqual(complete_length("foo }"), 4)
+        self.assertEqual(complete_length("foo {bar:{width}"), 4)
+        self.assertEqual(complete_length("foo {bar:{width}} b"), 19)
+
+    def test_render_stream(self):
+        """Tests render_stream() formats like str.format()"""
+        expected = self.template.format(**self.variables)
+        for chunk_size in range(1, len(self.template) + 1):
+            dst = StringIO()
+            render_stream(
+                StringIO(self.template), dst, self.variables,
+                chunk_size=chunk_size)
+            self.assertEqual(dst.getvalue(), expected)
+
+    def test_render_stream_missing_variable(self):
+        """Tests render_stream() raises a KeyError"""
+        self.assertRaises(
+            KeyError, render_stream,
+            StringIO(self.template), StringIO(), {'foo': 1}, chunk_size=4)
+
+    def test_render_stream_unclosed_field(self):
+        """Tests render_stream() raises a ValueError for unclosed field"""
+        self.assertRaises(
+            ValueError, render_stream,
+            StringIO("{foo" + "o" * 100), StringIO(), self.variables,
+            chunk_size=4, max_field_size=50)
+
+    def test_skeleton_large_template(self):
+        """Tests Skeleton.write() formats large templates by chunks"""
+
+        class Streamed(DynamicContent):
+            """Format all templates by chunks"""
+            stream_min_size = 0
+
+        with TempDir() as tmp_dir:
+            Streamed(baz="<replaced>").write(tmp_dir.path)
+            self.assertEqual(
+                open(tmp_dir.join('bar/baz.txt')).read().strip(),
+                'foo <replaced> bar'
+                )
+
+        with TempDir() as tmp_dir:
+            skel = Streamed()
+            skel.variables = []
+            self.assertRaises(TemplateKeyError, skel.write, tmp_dir.path)
+            self.assertFalse(tmp_dir.exists('bar/baz.txt'))
+
+    def test_skeleton_large_latin1_template(self):
+        """Tests Skeleton.write() formats large latin-1 templates by chunks
+        """
+
+        class Streamed(DynamicContent):
+            """Format all templates by chunks"""
+            stream_min_size = 0
+            file_encoding = 'latin-1'
+
+        with TempDir() as tmp_dir:
+            Streamed(baz=u"\xe9").write(tmp_dir.path)
+            self.assertEqual(
+                open(tmp_dir.join('bar/baz.txt'), 'rb').read().strip(),
+                b'foo \xe9 bar'
+                )
+
+
+class TestRenderMmap(TestCase):
+    """Tests for skeleton.templates.render_mmap"""
+
+    template = u"\xe9t\xe9 {foo} {{bar}} {baz!r:>{width}} }} {foo}\u20ac"
+    variables = dict(foo=u'\u20ac', baz='baz', width=8)
+
+    def render(self, template, **kw):
+        """Write template in a file and render it with render_mmap"""
+        with TempDir() as tmp_dir:
+            with open(tmp_dir.join('template'), 'wb') as template_file:
+                template_file.write(template.encode('utf-8'))
+            dst = io.BytesIO()
+            render_mmap(tmp_dir.join('template'), dst, self.variables, **kw)
+            return dst.getvalue()
+
+    def test_render_mmap(self):
+        """Tests render_mmap() formats like str.format()"""
+        expected = self.template.format(**self.variables).encode('utf-8')
+        self.assertEqual(self.render(self.template), expected)
+        self.assertEqual(self.render(self.template, span_size=1), expected)
+
+    def test_render_mmap_empty(self):
+        """Tests render_mmap() with an empty template"""
+        self.assertEqual(self.render(u''), b'')
+
+    def test_render_mmap_errors(self):
+        """Tests render_mmap() raises the str.format() exceptions"""
+        self.assertRaises(KeyError, self.render, u'{missing}')
+        self.assertRaises(ValueError, self.render, u'foo } bar')
+        self.assertRaises(ValueError, self.render, u'foo { bar')
+
+
+def suite():
+    """Get all templates related tests"""
+    tests = unittest.TestSuite()
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestCompiledTemplate))
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestTemplateCache))
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestRenderStream))
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestRenderMmap))
+    return tests
+
+if __name__ == "__main__":
+    unittest.main()
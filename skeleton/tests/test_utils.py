@@ -1,12 +1,16 @@
 """
 Tests in skeleton.utils.*
 """
+from __future__ import with_statement
+import errno
 import optparse
+import os
 import unittest
 
+from skeleton import utils
 from skeleton.core import Var
 from skeleton.tests.utils import TestCase, TempDir
-from skeleton.utils import insert_into_file, vars_to_optparser
+from skeleton.utils import insert_into_file, vars_to_optparser, copy_file
 
 
 class TestInsertIntoFile(TestCase):
@@ -69,6 +73,94 @@ class TestInsertIntoFile(TestCase):
                     )
 
 
+class TestCopyFile(TestCase):
+    """Tests for skeleton.utils.copy_file"""
+
+    def setUp(self):
+        super(TestCopyFile, self).setUp()
+        self.strategies = utils.COPY_STRATEGIES[:]
+
+    def tearDown(self):
+        super(TestCopyFile, self).tearDown()
+        utils.COPY_STRATEGIES[:] = self.strategies
+
+    def test_copy_file(self):
+        """Tests skeleton.utils.copy_file() copy the file content"""
+        content = b'foo\n' * (utils.COPY_BUFFER_SIZE // 2)
+        with TempDir() as tmp_dir:
+            with open(tmp_dir.join('src'), 'wb') as src:
+                src.write(content)
+            strategy = copy_file(tmp_dir.join('src'), tmp_dir.join('dst'))
+            self.assertTrue(
+                strategy in [name for name, _ in utils.COPY_STRATEGIES])
+            with open(tmp_dir.join('dst'), 'rb') as dst:
+                self.assertEqual(dst.read(), content)
+
+    def test_copy_file_mode(self):
+        """Tests skeleton.utils.copy_file() set the mode of dst"""
+        with TempDir() as tmp_dir:
+            with open(tmp_dir.join('src'), 'wb') as src:
+                src.write(b'foo')
+            with open(tmp_dir.join('dst'), 'wb') as dst:
+                dst.write(b'bar')
+            os.chmod(tmp_dir.join('dst'), 0o600)
+            copy_file(tmp_dir.join('src'), tmp_dir.join('dst'), 0o750)
+            self.assertEqual(
+                os.stat(tmp_dir.join('dst')).st_mode & 0o777, 0o750)
+
+    def test_open_new_file(self):
+        """Tests skeleton.utils.open_new_file() only stat existing files"""
+        with TempDir() as tmp_dir:
+            fd, mode = utils.open_new_file(tmp_dir.join('foo'))
+            os.close(fd)
+            self.assertEqual(mode, utils.default_mode())
+            self.assertEqual(
+                os.stat(tmp_dir.join('foo')).st_mode & 0o777, mode)
+
+            os.chmod(tmp_dir.join('foo'), 0o600)
+            fd, mode = utils.open_new_file(tmp_dir.join('foo'))
+            try:
+                self.assertEqual(mode, 0o600)
+                self.assertFalse(utils.set_fd_mode(fd, 0o600, mode))
+                self.assertTrue(utils.set_fd_mode(fd, 0o640, mode))
+            finally:
+                os.close(fd)
+            self.assertEqual(
+                os.stat(tmp_dir.join('foo')).st_mode & 0o777, 0o640)
+
+    def test_copy_file_fallback(self):
+        """Tests skeleton.utils.copy_file() falls back on the next strategy
+        """
+        def unsupported(fd_src, fd_dst, size):
+            """Write some data and fail"""
+            utils._copy_read(fd_src, fd_dst, size)
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        utils.COPY_STRATEGIES[:] = [
+            ('unsupported', unsupported,), ('read', utils._copy_read,)]
+        with TempDir() as tmp_dir:
+            with open(tmp_dir.join('src'), 'wb') as src:
+                src.write(b'foo')
+            self.assertEqual(
+                copy_file(tmp_dir.join('src'), tmp_dir.join('dst')), 'read')
+            with open(tmp_dir.join('dst'), 'rb') as dst:
+                self.assertEqual(dst.read(), b'foo')
+
+    def test_copy_file_error(self):
+        """Tests skeleton.utils.copy_file() raises unexpected errors"""
+        def failing(fd_src, fd_dst, size):
+            """Fails with an unexpected error"""
+            raise IOError(errno.ENOSPC, 'No space left on device')
+
+        utils.COPY_STRATEGIES[:] = [
+            ('failing', failing,), ('read', utils._copy_read,)]
+        with TempDir() as tmp_dir:
+            with open(tmp_dir.join('src'), 'wb') as src:
+                src.write(b'foo')
+            self.assertRaises(
+                IOError, copy_file, tmp_dir.join('src'), tmp_dir.join('dst'))
+
+
 class TestVarsToOptparser(unittest.TestCase):
     """Tests skeleton.utils.vars_to_optparser
     """
@@ -109,6 +201,8 @@ def suite():
     tests = unittest.TestSuite()
     tests.addTest(
         unittest.TestLoader().loadTestsFromTestCase(TestInsertIntoFile))
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestCopyFile))
     tests.addTest(
         unittest.TestLoader().loadTestsFromTestCase(TestVarsToOptparser))
     return tests
@@ -0,0 +1,123 @@
+"""
+Tests for skeleton.variables
+"""
+import unittest
+
+from skeleton.core import Skeleton, Var, Bool
+from skeleton.tests.test_core import WithDefault, WithRequirement, THIS_YEAR
+from skeleton.tests.utils import TestCase
+from skeleton.variables import VariableStore, get_variable_schema
+
+
+class TestVariableStore(TestCase):
+    """Tests for skeleton.variables.VariableStore and Skeleton.layer_of()"""
+
+    def test_layers(self):
+        """Tests the layer of each variable"""
+        skel = WithRequirement(bar=3)
+        required_skel = skel.required_skeletons_instances[0]
+        required_skel['baz'] = 4
+
+        self.assertEqual(skel.layer_of('bar'), 'cli')
+        self.assertEqual(required_skel.layer_of('bar'), 'cli')
+        self.assertEqual(skel.layer_of('baz'), 'computed')
+        self.assertEqual(skel.layer_of('foo'), 'defaults')
+        self.assertEqual(required_skel.layer_of('foo'), 'parent')
+        self.assertEqual(required_skel['foo'], 1)
+        self.assertEqual(skel.layer_of('year'), 'builtins')
+        self.assertRaises(KeyError, skel.layer_of, 'missing')
+
+        skel['year'] = 2000
+        self.assertEqual(required_skel['year'], 2000)
+        self.assertEqual(required_skel.layer_of('year'), 'computed')
+        del skel['year']
+        self.assertEqual(required_skel['year'], THIS_YEAR)
+
+    def test_len(self):
+        """Tests variables both set and with a default are counted once"""
+        skel = WithDefault(foo=1, bar=3)
+        self.assertEqual(len(skel), 3)
+        self.assertEqual(sorted(skel), ['bar', 'foo', 'year'])
+        skel['baz'] = 4
+        self.assertEqual(len(skel), 4)
+        del skel['foo']
+        self.assertEqual(len(skel), 3)
+
+    def test_snapshot(self):
+        """Tests VariableStore.snapshot()"""
+        store = VariableStore({'foo': 1, 'bar': 2})
+        store.set('foo', 3, 'cli')
+        snapshot = store.snapshot()
+        store['bar'] = 4
+
+        self.assertEqual(snapshot, {'foo': 3, 'bar': 2, 'year': THIS_YEAR})
+        self.assertEqual(snapshot.version, 1)
+        self.assertEqual(store.version, 2)
+        self.assertRaises(ValueError, store.set, 'foo', 1, 'defaults')
+
+
+class TestVariableSchema(TestCase):
+    """Tests for skeleton.variables.VariableSchema"""
+
+    def test_schema(self):
+        """Tests the schema aggregates the variables of the requirement
+        closure
+        """
+
+        class Conflicting(Skeleton):
+            """Declares foo again, with another type"""
+            variables = [Bool('foo', default=True), Var('qux')]
+            required_skeletons = [WithDefault]
+
+        class Root(WithRequirement):
+            """Requires WithDefault twice"""
+            required_skeletons = [WithDefault, Conflicting]
+
+        schema = Root.variable_schema()
+        self.assertEqual(schema.classes, [Root, WithDefault, Conflicting])
+        self.assertEqual(
+            [var.name for var in schema.variables],
+            ['foo', 'bar', 'baz', 'qux'])
+        self.assertEqual(schema.defaults, {'foo': 1})
+        self.assertEqual(
+            schema.owners['foo'], [Root, WithDefault, Conflicting])
+        self.assertEqual(schema.owners['bar'], [WithDefault])
+        self.assertEqual(sorted(schema.conflicts), ['foo'])
+        self.assertEqual(
+            [skel_class for skel_class, var in schema.conflicts['foo']],
+            [Root, WithDefault, Conflicting])
+
+    def test_schema_cache(self):
+        """Tests schemas are built once per class"""
+
+        class Cached(WithRequirement):
+            """Replaces its variables"""
+
+        schema = get_variable_schema(Cached)
+        self.assertTrue(Cached.variable_schema() is schema)
+        Cached.variables = [Var('foo', default=2)]
+        self.assertFalse(Cached.variable_schema() is schema)
+        self.assertEqual(Cached()['foo'], 2)
+
+    def test_configure_parser(self):
+        """Tests Skeleton.configure_parser() has options for the variables
+        of the required skeletons
+        """
+        parser = WithRequirement().configure_parser()
+        options = parser.parse_args(['--foo', '3', '--baz', '4'])[0]
+        self.assertEqual(options.foo, '3')
+        self.assertEqual(options.baz, '4')
+        self.assertEqual(options.bar, None)
+
+
+def suite():
+    """Get all variable store related tests"""
+    tests = unittest.TestSuite()
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestVariableStore))
+    tests.addTest(
+        unittest.TestLoader().loadTestsFromTestCase(TestVariableSchema))
+    return tests
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,8 +3,7 @@ Skeleton Helpers
 """
 
 from __future__ import with_statement
-from contextlib import closing
-import codecs
+import errno
 import logging
 import optparse
 import os
@@ -12,6 +11,11 @@ import re
 import stat
 import sys
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 
 VALID_OPTION_NAME = re.compile("[a-z]([\w\d]*[a-z0-9])?", re.IGNORECASE)
 
@@ -26,6 +30,8 @@ def get_loggger(name):
 
 def vars_to_optparser(variables, parser=None):
     """Augments the parser with option to set value for the list of variables.
+
+    `variables` can be a `skeleton.variables.VariableSchema`.
     """
     if parser is None:
         parser = optparse.OptionParser()
@@ -48,9 +54,256 @@ def get_file_mode(path):
     return stat.S_IMODE(os.stat(path)[stat.ST_MODE])
 
 
+def _read_umask():
+    """Return the umask of the process."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+#: umask of the process, read when the module is imported (reading it
+#: changes it, which is not thread safe). It is stale if the umask is changed
+#: later; only use it for default modes, not to skip a chmod.
+UMASK = _read_umask()
+
+
+def default_mode(is_dir=False):
+    """Return the mode given by the umask to new files (or directories)."""
+    return (0o777 if is_dir else 0o666) & ~UMASK
+
+
+def open_new_file(path):
+    """Open `path` for writing, creating or truncating it.
+
+    Return a (fd, mode) tuple. For a new file, the mode is the one the
+    current umask gave it (the new fd is fstat'ed: `UMASK` may be stale). An
+    existing file hard linked to other files is replaced by a new file (see
+    `open_unshared`).
+    """
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    try:
+        fd = os.open(path, flags | os.O_EXCL, 0o666)
+    except (OSError,), exc:
+        if exc.errno != errno.EEXIST:
+            raise
+    else:
+        return fd, stat.S_IMODE(os.fstat(fd).st_mode)
+    fd, stat_result = open_unshared(path)
+    os.ftruncate(fd, 0)
+    return fd, stat.S_IMODE(stat_result.st_mode)
+
+
+def open_unshared(path):
+    """Open `path` for writing, creating it but without truncating it.
+
+    If `path` is a file with other hard links, it's removed and a new file
+    is created instead: writing to it would modify the files it is linked
+    to (e.g. the skeleton files of a previous `link_static='hardlink'`
+    write). Return a (fd, stat result) tuple.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    fd = os.open(path, flags, 0o666)
+    stat_result = os.fstat(fd)
+    if stat_result.st_nlink > 1:
+        os.close(fd)
+        os.remove(path)
+        fd = os.open(path, flags | os.O_EXCL, 0o666)
+        stat_result = os.fstat(fd)
+    return fd, stat_result
+
+
+def set_fd_mode(fd, mode, current_mode, path=None):
+    """Set the mode of the open file `fd` unless it is already `mode`.
+
+    `path` is used on platforms without `os.fchmod`. Return True if the mode
+    was changed.
+    """
+    if mode == current_mode:
+        return False
+    if hasattr(os, 'fchmod'):
+        os.fchmod(fd, mode)
+    else:
+        os.chmod(path, mode)
+    return True
+
+
+#: Size of the buffer used to copy files without kernel help.
+COPY_BUFFER_SIZE = 1024 * 1024
+
+#: ioctl request cloning a file (Linux, Btrfs/XFS/OCFS2...)
+FICLONE = 0x40049409
+
+# errors meaning a copy strategy is not supported for these files.
+_COPY_FALLBACK_ERRNOS = set(
+    getattr(errno, name) for name in (
+        'ENOTTY', 'EOPNOTSUPP', 'ENOTSUP', 'EINVAL', 'EXDEV', 'ENOSYS',
+        'EBADF', 'EPERM', 'ETXTBSY', 'ENODATA')
+    if hasattr(errno, name))
+
+
+def _copy_reflink(fd_src, fd_dst, size):
+    """Clone src into dst (copy on write; the data blocks are shared)."""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    fcntl.ioctl(fd_dst, FICLONE, fd_src)
+    return True
+
+
+def _copy_sparse(fd_src, fd_dst, size):
+    """Copy only the data regions of a sparse file (holes are kept)."""
+    if not hasattr(os, 'SEEK_DATA') or not hasattr(os, 'pread'):
+        return False
+    blocks = getattr(os.fstat(fd_src), 'st_blocks', None)
+    if blocks is None or blocks * 512 >= size:
+        return False
+
+    offset = 0
+    while offset < size:
+        try:
+            data = os.lseek(fd_src, offset, os.SEEK_DATA)
+        except (OSError,), exc:
+            if exc.errno == errno.ENXIO:
+                break
+            raise
+        hole = os.lseek(fd_src, data, os.SEEK_HOLE)
+        while data < hole:
+            chunk = os.pread(fd_src, min(COPY_BUFFER_SIZE, hole - data), data)
+            if not chunk:
+                break
+            data += os.pwrite(fd_dst, chunk, data)
+        offset = hole
+    os.ftruncate(fd_dst, size)
+    return True
+
+
+def _copy_file_range(fd_src, fd_dst, size):
+    """Copy with copy_file_range(2) (in kernel, may use server side copy)."""
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    while os.copy_file_range(fd_src, fd_dst, COPY_BUFFER_SIZE * 8):
+        pass
+    return True
+
+
+def _copy_sendfile(fd_src, fd_dst, size):
+    """Copy with sendfile(2) (in kernel)."""
+    if not hasattr(os, 'sendfile') or not sys.platform.startswith('linux'):
+        return False
+    offset = 0
+    while True:
+        sent = os.sendfile(fd_dst, fd_src, offset, COPY_BUFFER_SIZE * 8)
+        if not sent:
+            break
+        offset += sent
+    return True
+
+
+def _copy_read(fd_src, fd_dst, size):
+    """Copy through a user space buffer."""
+    while True:
+        chunk = os.read(fd_src, COPY_BUFFER_SIZE)
+        if not chunk:
+            break
+        while chunk:
+            written = os.write(fd_dst, chunk)
+            chunk = chunk[written:]
+    return True
+
+
+#: Copy strategies tried by `copy_file`, in order.
+COPY_STRATEGIES = [
+    ('reflink', _copy_reflink,),
+    ('sparse', _copy_sparse,),
+    ('copy_file_range', _copy_file_range,),
+    ('sendfile', _copy_sendfile,),
+    ('read', _copy_read,),
+    ]
+
+
+def copy_file(src, dst, mode=None):
+    """Copy the content of `src` to `dst` and return the strategy used.
+
+    Try each of `COPY_STRATEGIES` in turn: a reflink clone, a sparse copy
+    (only if `src` has holes), copy_file_range(2), sendfile(2) and finally
+    a copy through a buffer. Strategies not supported by the platform, the
+    file system or the Python version are skipped.
+
+    If `mode` is set, it is applied to the open `dst` descriptor (unless
+    `dst` already has this mode). An existing `dst` hard linked to other
+    files is replaced by a new file (see `open_unshared`).
+    """
+    with open(src, 'rb') as file_src:
+        # dst is not truncated yet: it might be src itself.
+        fd_dst, stat_dst = open_unshared(dst)
+        with os.fdopen(fd_dst, 'wb') as file_dst:
+            fd_src = file_src.fileno()
+            stat_src = os.fstat(fd_src)
+            if (stat_src.st_dev, stat_src.st_ino,) == (
+                stat_dst.st_dev, stat_dst.st_ino,):
+                return 'same'
+
+            if mode is not None:
+                set_fd_mode(
+                    fd_dst, mode, stat.S_IMODE(stat_dst.st_mode), dst)
+            os.ftruncate(fd_dst, 0)
+            size = stat_src.st_size
+            for name, strategy in COPY_STRATEGIES:
+                try:
+                    if strategy(fd_src, fd_dst, size):
+                        return name
+                except (IOError, OSError,), exc:
+                    if exc.errno not in _COPY_FALLBACK_ERRNOS:
+                        raise
+                    os.lseek(fd_src, 0, os.SEEK_SET)
+                    os.lseek(fd_dst, 0, os.SEEK_SET)
+                    os.ftruncate(fd_dst, 0)
+    raise IOError("Cannot copy %r to %r" % (src, dst,))
+
+
+def remove_file(path):
+    """Remove the file at `path` if it exists."""
+    try:
+        os.remove(path)
+    except (OSError,), exc:
+        if exc.errno != errno.ENOENT:
+            raise
+
+
+# errors meaning src cannot be hard linked to dst.
+_LINK_FALLBACK_ERRNOS = set(
+    getattr(errno, name) for name in (
+        'EXDEV', 'EPERM', 'EMLINK', 'ENOTSUP', 'EOPNOTSUPP', 'ENOSYS',
+        'EACCES')
+    if hasattr(errno, name))
+
+
+def link_file(src, dst, mode=None):
+    """Replace `dst` by a hard link to `src` and return the strategy used.
+
+    Fall back on `copy_file` if hard links are not supported or if `src`
+    and `dst` are on different file systems; `mode` is only applied to such
+    copies (a hard link shares the mode of `src`).
+    """
+    if not hasattr(os, 'link'):
+        return copy_file(src, dst, mode)
+    try:
+        os.link(src, dst)
+    except (OSError,), exc:
+        if exc.errno == errno.EEXIST:
+            if os.path.samefile(src, dst):
+                return 'hardlink'
+            # Writing over dst could modify the file it is linked to.
+            os.remove(dst)
+            return link_file(src, dst, mode)
+        if exc.errno in _LINK_FALLBACK_ERRNOS:
+            return copy_file(src, dst, mode)
+        raise
+    return 'hardlink'
+
+
 def insert_into_file(
     file_path, marker, text,
-    marker_tag="-*-", keep_indent=True, keep_marker=True, encoding="UTF-8"):
+    marker_tag="-*-", keep_indent=True, keep_marker=True, encoding="UTF-8",
+    backend=None):
     """Insert text into file at specific markers.
 
     eg, for a file "test.txt" with::
@@ -77,39 +330,43 @@ def insert_into_file(
     - keep_indent: Should it insert the text with the same marker indent.
     - keep_marker: Should the marker be removed.
     - encoding: file encoding.
+    - backend: backend holding the file (see `skeleton.backends`; the file
+      system by default).
     """
+    if backend is None:
+        # skeleton.backends depends on this module
+        from skeleton.backends import FILE_SYSTEM as backend
+
     marker_pattern = re.escape('%s %s %s' % (marker_tag, marker, marker_tag,))
     marker_re = re.compile(r"^(\s*).*%s.*$" % marker_pattern)
     edited = False
     new_content = []
-    with closing(
-        codecs.open(file_path, 'r', encoding=encoding)) as opened_file:
-        for line in opened_file:
-            match = marker_re.match(line)
-            if match is None:
-                new_content.append(line.rstrip('\n\r'))
-                continue
-
-            edited = True
-
-            if keep_marker:
-                new_content.append(line.rstrip('\n\r'))
-
-            if keep_indent:
-                indent = match.groups()[0]
-                for text_line in text.splitlines():
-                    new_content.append('%s%s' % (indent, text_line,))
-            else:
-                for text_line in text.splitlines():
-                    new_content.append(text_line)
+    content = backend.read(file_path).decode(encoding)
+    for line in content.splitlines(True):
+        match = marker_re.match(line)
+        if match is None:
+            new_content.append(line.rstrip('\n\r'))
+            continue
+
+        edited = True
+
+        if keep_marker:
+            new_content.append(line.rstrip('\n\r'))
+
+        if keep_indent:
+            indent = match.groups()[0]
+            for text_line in text.splitlines():
+                new_content.append('%s%s' % (indent, text_line,))
+        else:
+            for text_line in text.splitlines():
+                new_content.append(text_line)
 
     if not edited:
         return
 
-    with closing(
-        codecs.open(file_path, 'w', encoding=encoding)) as opened_file:
-        for line in new_content:
-            opened_file.write('%s%s' % (line, os.linesep,))
+    backend.write(file_path, ''.join(
+        '%s%s' % (line, os.linesep,) for line in new_content
+        ).encode(encoding))
 
 
 class NullHandler(logging.Handler):
@@ -0,0 +1,255 @@
+"""
+Layered variable store of the skeletons.
+
+A skeleton looks its variables up in these layers, in order:
+
+- 'cli' and 'computed': the values set on the skeleton, by its constructor,
+  the command line options or the prompts ('cli'), or by the skeleton
+  code (`skel[name] = value`, 'computed'). A value set again replaces the
+  previous one, whatever its layer. This layer is shared by a skeleton and
+  the skeletons it requires.
+- 'parent': the default values of the skeletons requiring the skeleton (the
+  outermost skeleton's defaults first);
+- 'defaults': the default values of the skeleton variables;
+- 'builtins': the variables every skeleton defines (`year`).
+
+Only the first layer can change. The other layers are merged once, when
+the store is created, so that a lookup, a membership test or the length of
+the store never walks a chain of parent skeletons.
+
+The variables declared by a skeleton class and by the classes it requires
+are aggregated once per class, in a `VariableSchema` (see
+`get_variable_schema`).
+"""
+import collections
+import datetime
+
+from skeleton.templates import VariableSnapshot
+
+
+#: Names of the layers, by priority.
+LAYERS = ('cli', 'computed', 'parent', 'defaults', 'builtins',)
+
+_SCHEMAS = {}
+
+
+class SetLayer(dict):
+    """Values set on a skeleton and on the skeletons it requires.
+
+    `origins` maps each name to its layer ('cli' or 'computed'); `version`
+    is incremented each time a value is set or deleted. `checked` maps the
+    skeleton classes which variables have been checked to the version they
+    were checked at (see `Skeleton.check_variables`).
+    """
+
+    def __init__(self):
+        super(SetLayer, self).__init__()
+        self.origins = {}
+        self.version = 0
+        self.checked = {}
+
+
+class VariableStore(collections.MutableMapping):
+    """Variables of a skeleton (see the module documentation).
+
+    `defaults` holds the default values of the skeleton variables; it's
+    not copied and should not be modified (see `VariableSchema.defaults`).
+    A store without `parent` creates the shared layers; a store with a `parent`
+    store (the store of the skeleton requiring the skeleton) shares its set
+    values and its builtins.
+    """
+
+    def __init__(self, defaults=None, parent=None):
+        # read-only, shared by the stores of a skeleton class
+        self.defaults = {} if defaults is None else defaults
+        if parent is None:
+            self.set_values = SetLayer()
+            self.parent_defaults = {}
+            self.builtins = {'year': datetime.datetime.utcnow().year}
+        else:
+            self.set_values = parent.set_values
+            self.parent_defaults = dict(parent.defaults)
+            self.parent_defaults.update(parent.parent_defaults)
+            self.builtins = parent.builtins
+
+        # the layers which never change, merged
+        self._fallback = dict(self.builtins)
+        self._fallback.update(self.defaults)
+        self._fallback.update(self.parent_defaults)
+        self._length = None
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, dict(self),)
+
+    def __contains__(self, key):
+        return key in self.set_values or key in self._fallback
+
+    def __getitem__(self, key):
+        try:
+            return self.set_values[key]
+        except KeyError:
+            pass
+        try:
+            return self._fallback[key]
+        except KeyError:
+            pass
+        raise KeyError("%s is not set and has no default value" % key)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        del self.set_values[key]
+        del self.set_values.origins[key]
+        self.set_values.version += 1
+
+    def __iter__(self):
+        set_values = self.set_values
+        for key in set_values:
+            yield key
+        for key in self._fallback:
+            if key not in set_values:
+                yield key
+
+    def __len__(self):
+        version = self.set_values.version
+        if self._length is None or self._length[0] != version:
+            fallback = self._fallback
+            self._length = (version, len(fallback) + sum(
+                1 for key in self.set_values if key not in fallback),)
+        return self._length[1]
+
+    @property
+    def version(self):
+        """Number incremented each time a value is set or deleted."""
+        return self.set_values.version
+
+    def set(self, key, value, layer='computed'):
+        """Set the value of `key`, coming from the 'cli' or 'computed'
+        `layer`.
+        """
+        if layer not in ('cli', 'computed',):
+            raise ValueError("Cannot set a value in the %r layer" % layer)
+        self.set_values[key] = value
+        self.set_values.origins[key] = layer
+        self.set_values.version += 1
+
+    def layer_of(self, key, *default):
+        """Return the name of the layer the value of `key` comes from.
+
+        Raise a KeyError if `key` is not set, unless a default return value
+        is given.
+        """
+        if key in self.set_values:
+            return self.set_values.origins[key]
+        for layer, values in (
+            ('parent', self.parent_defaults,),
+            ('defaults', self.defaults,),
+            ('builtins', self.builtins,),):
+            if key in values:
+                return layer
+        if default:
+            return default[0]
+        raise KeyError("%s is not set and has no default value" % key)
+
+    def snapshot(self):
+        """Return a `VariableSnapshot` of the store.
+
+        The layers are copied as a whole, without looking each variable up.
+        """
+        snapshot = VariableSnapshot((), self.version)
+        dict.update(snapshot, self._fallback)
+        dict.update(snapshot, self.set_values)
+        return snapshot
+
+
+class VariableSchema(object):
+    """Variables declared by the skeleton class `skel_class` and by the
+    skeleton classes it requires, directly or not.
+
+    - `classes`: the skeleton class and its requirement closure, in the
+      order their variables are prompted for (depth first, each class
+      before the classes it requires, each class once);
+    - `variables`: the variables of these classes, each name once (the
+      first declaration);
+    - `owners`: maps each variable name to the classes declaring it;
+    - `conflicts`: maps the names declared several times, with different
+      defaults or variable types, to the list of (class, variable) pairs;
+    - `defaults`: default values of the variables of `skel_class` itself
+      (the ones of its requirements come from their own schema).
+
+    Only the classes are walked; no skeleton is instantiated.
+    """
+
+    def __init__(self, skel_class):
+        self.skel_class = skel_class
+        self.defaults = dict(
+            (var.name, var.default,)
+            for var in skel_class.variables if var.default is not None)
+        self.classes = []
+        self.variables = []
+        self.owners = {}
+        self.conflicts = {}
+        self._declarations = {}
+        self._visit(skel_class)
+        del self._declarations
+        self._attributes = (
+            skel_class.variables, skel_class.required_skeletons,)
+
+    def __repr__(self):
+        return '<%s %s %r>' % (
+            self.__class__.__name__, self.skel_class.__name__,
+            [var.name for var in self.variables],)
+
+    def __iter__(self):
+        return iter(self.variables)
+
+    def __len__(self):
+        return len(self.variables)
+
+    def _visit(self, skel_class):
+        """Add the variables of `skel_class` and of its requirements."""
+        pending = [skel_class]
+        while pending:
+            current = pending.pop(0)
+            if current in self.classes:
+                continue
+            self.classes.append(current)
+            for var in current.variables:
+                self._add(current, var)
+            pending[:0] = current.required_skeletons
+
+    def _add(self, skel_class, var):
+        """Add the variable `var` declared by `skel_class`."""
+        declarations = self._declarations.setdefault(var.name, [])
+        declarations.append((skel_class, var,))
+        self.owners.setdefault(var.name, []).append(skel_class)
+        if len(declarations) == 1:
+            self.variables.append(var)
+            return
+        first = declarations[0][1]
+        if (var.__class__ is not first.__class__
+            or var.default != first.default):
+            self.conflicts[var.name] = list(declarations)
+        elif var.name in self.conflicts:
+            self.conflicts[var.name].append((skel_class, var,))
+
+    def is_valid(self):
+        """Check the `variables` and `required_skeletons` attributes of the
+        skeleton class haven't been replaced since the schema was built.
+        """
+        variables, required_skeletons = self._attributes
+        return (variables is self.skel_class.variables
+            and required_skeletons is self.skel_class.required_skeletons)
+
+
+def get_variable_schema(skel_class):
+    """Return the `VariableSchema` of the skeleton class `skel_class`.
+
+    Schemas are built lazily, once per class (and again if the class
+    `variables` or `required_skeletons` attribute is replaced).
+    """
+    schema = _SCHEMAS.get(skel_class)
+    if schema is None or not schema.is_valid():
+        schema = _SCHEMAS[skel_class] = VariableSchema(skel_class)
+    return schema